@@ -1,8 +1,12 @@
-from flask import Flask, render_template, request
+from flask import Flask, render_template, request, redirect, url_for, abort, jsonify, Response
 from src import youtube_data_module as ydt
 from src import viz
-import pandas as pd
+from src import jobs
+from src import quota
+from src import tracing
+from src import sentiment
 import os
+import time
 import logging
 import sys
 
@@ -12,6 +16,9 @@ logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
 API_KEY = os.getenv('YOUTUBE_API_KEY')
+# pandas, the plotting libraries, the API client and the sentiment lexicon are loaded on first use. Set PRELOAD_HEAVY=1 to load them,
+# when the app is imported, see "preload()". With "gunicorn --preload" the workers are forked after that and share the loaded modules.
+PRELOAD_HEAVY = os.getenv('PRELOAD_HEAVY', '0') == '1'
 
 app = Flask(__name__)
 
@@ -21,110 +28,246 @@ def home():
 
 @app.route('/select_video')
 def select_video():
-    '''This page returns search results, when a user hits the 'Search Video' button'''
+    '''This page returns search results, when a user hits the 'Search Video' button.
+    The results come from the videos downloaded before, if any match. With source=youtube the API is searched.'''
     result_dictionary = request.args
     query = result_dictionary['query']
     youtube = ydt.youtubeAPIkey(API_KEY)
-    query_result = ydt.youtubeSearchListStatistics(youtube, q=query)
+    query_result = ydt.search_videos(youtube, q=query, local=result_dictionary.get('source') != 'youtube')
 
     return render_template(
         'select_video.html',
         query_result=query_result,
-        query=query
+        query=query,
+        youtube_url=url_for('select_video', query=query, source='youtube')
     )
 
-@app.route('/video_comments')
-def video_comments():
-    '''This page returns a video comment analysis, when a user hits the 'See video comment analysis' button'''
-    video_id = request.args.get('video_id')
-
+def analyze_video(video_id, progress):
+    '''Download and analyse the comments of a video. Return the template name and its context.'''
     youtube = ydt.youtubeAPIkey(API_KEY)
 
     logger.info('Getting all comments')
-    all_snippets = ydt.get_all_comments(youtube, video_id)
+    progress('Downloading comments')
+    with tracing.span('video.fetch'):
+        comment_df = ydt.get_comment_df(youtube, video_id)
     logger.info('Writing comments to dict')
-    comment_dict = ydt.extract_comments(all_snippets)
+    with tracing.span('video.dict'):
+        comment_dict = comment_df['text_original'].to_dict()
 
     image_names = []
     logger.info('Generating wordcloud')
-    comment_string = ydt.concat_comments(comment_dict)
-    video_title = video_id
-    image_names.append(viz.create_wordcloud(comment_string, stopwords=None, video_id=video_id, channel_title=video_title))
-    comment_df = ydt.comments_to_df(all_snippets)
-    comment_sentiment = ydt.analyze_comment_sentiments(comment_df)
-    comment_sentiment2, pos_sent, neg_sent = viz.split_sentiment_pos_neg(comment_sentiment)
-    image_names.append(viz.lineplot_cumsum_video_comments(comment_sentiment2, video_id))
-    image_names.append(viz.lineplot_cumsum_video_comments_pos_neg(comment_sentiment2, pos_sent, neg_sent, video_id))
-    image_names.append(viz.scatterplot_sentiment_likecount(comment_sentiment2, pos_sent, neg_sent, video_id))
+    progress('Generating wordcloud')
+    with tracing.span('video.wordcloud'):
+        comment_frequencies = ydt.word_frequencies(f'comments:{video_id}', comment_dict, ydt.count_comment_words)
+        video_title = video_id
+        image_names.append(viz.create_wordcloud(comment_frequencies, stopwords=None, video_id=video_id, channel_title=video_title))
+    progress('Analysing sentiments')
+    with tracing.span('video.sentiment'):
+        comment_sentiment = ydt.analyze_comment_sentiments(comment_df)
+    progress('Generating plots')
+    with tracing.span('video.plotting'):
+        comment_sentiment2, pos_sent, neg_sent = viz.split_sentiment_pos_neg(comment_sentiment)
+        image_names.append(viz.lineplot_cumsum_video_comments(comment_sentiment2, video_id))
+        image_names.append(viz.lineplot_cumsum_video_comments_pos_neg(comment_sentiment2, pos_sent, neg_sent, video_id))
+        image_names.append(viz.scatterplot_sentiment_likecount(comment_sentiment2, pos_sent, neg_sent, video_id))
     # Calculate correlation
-    like_count_sentiment_corr = round(comment_sentiment2.corr().loc['like_count'][5],2)
+    like_count_sentiment_corr = round(float(comment_sentiment2[['like_count', 'compound']].corr().loc['like_count', 'compound']), 2)
 
-    return render_template(
-        'video_comments.html',
+    return 'video_comments.html', dict(
         image_names=image_names,
         like_count_sentiment_corr=like_count_sentiment_corr
     )
 
+@app.route('/video_comments')
+def video_comments():
+    '''This page returns a video comment analysis, when a user hits the 'See video comment analysis' button.
+    The analysis runs as a background job, the user is redirected to the job page.'''
+    video_id = request.args.get('video_id')
+    return redirect(url_for('job', job_id=submit_analysis(f'video_comments:{video_id}')))
+
 @app.route('/select_channels', methods=['GET', 'POST'])
 def select_channels():
-    '''This page return search results for the channel queries a user inputs and hits the 'Search Channels' button'''
+    '''This page return search results for the channel queries a user inputs and hits the 'Search Channels' button.
+    The results come from the channels searched or analysed before, if any match. With source=youtube the API is searched.'''
     result_dictionary = request.args
     channel_names = []
 
     for channel_name in result_dictionary:
-        if len(result_dictionary.get(channel_name)) > 0:
+        if channel_name != 'source' and len(result_dictionary.get(channel_name)) > 0:
             channel_names.append(result_dictionary[channel_name])
 
     youtube = ydt.youtubeAPIkey(API_KEY)
     query_results = {}
+    local = result_dictionary.get('source') != 'youtube'
 
     for cn in channel_names:
-        result = ydt.youtubeSearchList(youtube, channel_id=None, q=cn, maxResults=5, type='channel')
+        result = ydt.search_channels(youtube, q=cn, maxResults=5, local=local)
         query_results[cn] =  result
 
     return render_template(
         'select_channels.html',
-        query_results=query_results
+        query_results=query_results,
+        youtube_url=url_for('select_channels', **dict(result_dictionary.items(), source='youtube'))
     )
 
-@app.route('/channels', methods=['GET', 'POST'])
-def channels():
-    '''This page returns the channel coparison analysis when a user selects at least one channel with a radio button and hits "Compare channels now"'''
-    result_dictionary = request.args
+def analyze_channels(channel_ids, progress):
+    '''Download and compare the videos of channels. Return the template name and its context.\n
+    The comparison is built from the per channel rollups of the local store, that are kept up to date, while the videos are stored.'''
+    youtube = ydt.youtubeAPIkey(API_KEY)
+    progress('Downloading videos')
+    with tracing.span('channels.fetch'):
+        synced_ids = ydt.sync_channels(youtube, channel_ids)
 
-    channel_ids = []
-    for c_id in result_dictionary:
-        if len(result_dictionary[c_id]) == 24:
-            channel_ids.append(result_dictionary[c_id])
+    with tracing.span('channels.rollups'):
+        # Channels, that could not be downloaded or have no videos, are left out
+        channel_counts = ydt.get_channel_rollups(synced_ids)
 
-    youtube = ydt.youtubeAPIkey(API_KEY)
-    video_df = ydt.get_channel_video_df(youtube, channel_ids)
+    # None of the channels could be downloaded
+    if channel_counts.empty:
+        return 'channels.html', dict(
+            image_names=[],
+            channel_ids=channel_ids,
+            channel_titles=[],
+            tables=[],
+        )
 
-    image_names = []
-    image_names.append(viz.barplot_channel_video_count(video_df, channel_ids))
-    image_names.append(viz.barplot_links(video_df, channel_ids))
+    progress('Generating plots')
+    # The plots are independent of each other and are rendered at the same time
+    plot_tasks = []
+    plot_tasks.append((viz.barplot_channel_video_count, (channel_counts, channel_ids), {}))
+    plot_tasks.append((viz.barplot_links, (channel_counts, channel_ids), {}))
 
     channel_titles = []
-    for channel_id in channel_ids:
-        channel_video_df = video_df[video_df['channel_id'] == channel_id]
-        channel_title = channel_video_df['channel_title'].unique()[0]
+    for channel_id, channel_title in zip(channel_counts['channel_id'], channel_counts['channel_title']):
         channel_titles.append(channel_title)
-        image_names.append(viz.histogram_video_duration_count_single(channel_video_df, channel_id, channel_title=channel_title))
-        channel_video_series = channel_video_df['tags']
-        wordcloud_string = ydt.concat_listelements(channel_video_series)
-        image_names.append(viz.create_wordcloud(wordcloud_string, stopwords=None, video_id=channel_id, channel_title=channel_title))
+        plot_tasks.append((viz.histogram_video_duration_count_single, (ydt.get_duration_counts(channel_id), channel_id), {'channel_title': channel_title}))
+        tag_frequencies = ydt.channel_tag_frequencies(channel_id)
+        plot_tasks.append((viz.create_wordcloud, (tag_frequencies,), {'stopwords': None, 'video_id': channel_id, 'channel_title': channel_title}))
 
-    df_table = viz.top_videos(video_df, metric='view', n=5)
+    with tracing.span('channels.plotting'):
+        image_names = viz.render_plots(plot_tasks)
 
-    return render_template(
-        'channels.html',
-        result_dictionary=result_dictionary,
-        video_df=video_df,
+    with tracing.span('channels.tables'):
+        df_table = viz.top_videos(ydt.get_top_videos(channel_counts['channel_id'], metric='view', n=5), metric='view', n=5)
+
+    return 'channels.html', dict(
         image_names=image_names,
         channel_ids=channel_ids,
         channel_titles=channel_titles,
         tables=[df_table.to_html(index=False, classes='table-striped')],
     )
 
+@app.route('/channels', methods=['GET', 'POST'])
+def channels():
+    '''This page returns the channel coparison analysis when a user selects at least one channel with a radio button and hits "Compare channels now".
+    The analysis runs as a background job, the user is redirected to the job page.'''
+    result_dictionary = request.args
+
+    channel_ids = []
+    for c_id in result_dictionary:
+        if len(result_dictionary[c_id]) == 24:
+            channel_ids.append(result_dictionary[c_id])
+
+    # The same channels in any order are the same analysis
+    channel_ids = sorted(set(channel_ids))
+    return redirect(url_for('job', job_id=submit_analysis(f'channels:{",".join(channel_ids)}')))
+
+def submit_analysis(job_key, rerun_of=None):
+    '''Start the analysis of a job key like "video_comments:<video id>" or "channels:<comma separated channel ids>" in the background.
+    Return the job id. rerun_of is the id of the job, that is run again.'''
+    analysis, argument = job_key.split(':', 1)
+    if analysis == 'channels':
+        return jobs.submit(job_key, analyze_channels, argument.split(',') if argument else [], rerun_of=rerun_of)
+    return jobs.submit(job_key, analyze_video, argument, rerun_of=rerun_of)
+
+@app.template_filter('image_url')
+def image_url(image_name):
+    '''Return the url of an image returned by the viz functions. Images saved to the static folder are paths relative to the app,
+    so they are turned into absolute urls, that work on every page like "/jobs/<job_id>".'''
+    if image_name.startswith('static/'):
+        return url_for('static', filename=image_name[len('static/'):])
+    return image_name
+
+@app.route('/jobs/<job_id>')
+def job(job_id):
+    '''This page shows the progress of an analysis and renders its result, when the job is done.'''
+    job = jobs.get_job(job_id)
+    if job is None:
+        abort(404)
+
+    if job['status'] == 'done':
+        template_name, context = job['result']
+        # The images of older results may have been evicted or kept in the memory of a stopped process.
+        # The analysis is run again once from the local store and renders only the missing images.
+        if not all(viz.image_exists(image_name) for image_name in context['image_names']):
+            if job['rerun_of'] is None:
+                rerun_job_id = jobs.get_rerun_job_id(job_id) or submit_analysis(job['job_key'], rerun_of=job_id)
+                return redirect(url_for('job', job_id=rerun_job_id))
+            # The images of the rerun are gone as well, e.g. served by another process in memory mode. Show the page without them.
+            context = dict(context, image_names=[n if viz.image_exists(n) else None for n in context['image_names']])
+        return render_template(template_name, **context)
+
+    return render_template('job.html', job=job)
+
+@app.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    '''Return the status and progress of a job as json.'''
+    job = jobs.get_job(job_id)
+    if job is None:
+        abort(404)
+
+    return jsonify({k: job[k] for k in ('job_id', 'status', 'progress', 'error', 'created_at', 'updated_at')})
+
+@app.errorhandler(quota.QuotaExceeded)
+def quota_exceeded(e):
+    '''Answer with 429, when the daily quota of the API is used up.'''
+    return render_template('job.html', job={'status': 'failed', 'error': str(e)}), 429
+
+@app.route('/quota')
+def quota_metrics():
+    '''Return the quota usage of today and the request counters of the API client as json.'''
+    return jsonify(dict(quota.get_metrics(), cache=ydt.get_cache_stats()))
+
+@app.route('/metrics')
+def metrics():
+    '''Return the durations of the analysis stages, the API request counters and the quota and cache gauges in the Prometheus text format.'''
+    quota_metrics = quota.get_metrics()
+    tracing.set_gauge('youtube_quota_used_today', quota_metrics['used_today'])
+    tracing.set_gauge('youtube_quota_remaining_today', quota_metrics['remaining_today'])
+    tracing.set_gauge('youtube_api_quota_saved_units', ydt.get_cache_stats()['quota_saved'])
+    for name, value in sentiment.get_cache_stats().items():
+        tracing.set_gauge(f'sentiment_cache_{name}', value)
+    return Response(tracing.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/plots/<key>')
+def plot(key):
+    '''Serve a plot, that was rendered into memory. The key contains a fingerprint of the plot data, so the image never changes.'''
+    image = viz.get_image(key)
+    if image is None:
+        abort(404)
+
+    data, mimetype = image
+    response = Response(data, mimetype=mimetype)
+    response.set_etag(key)
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+def preload():
+    '''Load the heavy dependencies of all analyses, so the first requests do not wait for them.'''
+    start = time.perf_counter()
+    ydt.preload()
+    viz.preload()
+    sentiment.get_analyzer()
+    logger.info(f'Preloaded the heavy dependencies in {time.perf_counter() - start:.2f}s')
+
+if PRELOAD_HEAVY:
+    preload()
+
+# Jobs left queued or running by an earlier run of the app never finish. With "gunicorn --preload" this runs in the master,
+# the forked workers open their own database connections and own their jobs, see "sql._after_fork()" and "jobs._after_fork()".
+jobs.recover_jobs()
+
 if __name__ == '__main__':
     app.run(port=3000, debug=True)
@@ -0,0 +1,28 @@
+'''Micro-benchmark for "youtubeAPIkey()" against building a new client with googleapiclient.discovery.build() for every request.
+
+Run from the repository root: python benchmarks/bench_client.py [n]'''
+import os
+import sys
+import time
+import googleapiclient.discovery
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src import youtube_data_module as ydt
+
+def timed(func, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    return (time.perf_counter() - start) / n
+
+def main(n=200):
+    build_sec = timed(lambda: googleapiclient.discovery.build('youtube', 'v3', developerKey='benchmark'), n)
+    start = time.perf_counter()
+    ydt.youtubeAPIkey('benchmark')
+    first_sec = time.perf_counter() - start
+    reuse_sec = timed(lambda: ydt.youtubeAPIkey('benchmark'), n)
+    print(f'build per request {build_sec * 1000:.2f}ms, first client {first_sec * 1000:.2f}ms, reused client {reuse_sec * 1000:.4f}ms')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
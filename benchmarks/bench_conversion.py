@@ -0,0 +1,91 @@
+'''Micro-benchmark for "snippets_to_dict()" and "comments_to_df()" against the former row by row versions.
+
+Run from the repository root: python benchmarks/bench_conversion.py [n]'''
+import os
+import sys
+import time
+import datetime
+import pytz
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src import youtube_data_module as ydt
+import synthetic
+
+def rowwise_snippets_to_dict(video_snippet_list):
+    '''Former row by row version of "snippets_to_dict()" without categories.'''
+    df_data = {k: [] for k in ['video_id', 'published_at', 'channel_id', 'title', 'description', 'channel_title', 'tags',
+                               'category_id', 'live_broadcast_content', 'duration', 'duration_sec', 'dimension', 'definition',
+                               'caption', 'licensed_content', 'projection', 'privacy_status', 'license', 'embeddable',
+                               'public_stats_viewable', 'view_count', 'like_count', 'dislike_count', 'favorite_count',
+                               'comment_count', 'thumbnails_default', 'date_data_created']}
+    for i in video_snippet_list:
+        df_data['video_id'].append(i.get('id'))
+        df_data['published_at'].append(pd.to_datetime(i.get('snippet').get('publishedAt')))
+        df_data['channel_id'].append(i.get('snippet').get('channelId'))
+        df_data['title'].append(i.get('snippet').get('title'))
+        df_data['description'].append(i.get('snippet').get('description'))
+        df_data['channel_title'].append(i.get('snippet').get('channelTitle'))
+        df_data['tags'].append(i.get('snippet').get('tags'))
+        df_data['category_id'].append(i['snippet'].get('categoryId'))
+        df_data['live_broadcast_content'].append(i['snippet'].get('liveBroadcastContent'))
+        df_data['duration'].append(i['contentDetails'].get('duration'))
+        df_data['duration_sec'].append(ydt.get_duration_sec(i['contentDetails'].get('duration')))
+        df_data['dimension'].append(i['contentDetails'].get('dimension'))
+        df_data['definition'].append(i['contentDetails'].get('definition'))
+        df_data['caption'].append(i['contentDetails'].get('caption'))
+        df_data['licensed_content'].append(i['contentDetails'].get('licensedContent'))
+        df_data['projection'].append(i['contentDetails'].get('projection'))
+        df_data['privacy_status'].append(i['status'].get('privacyStatus'))
+        df_data['license'].append(i['status'].get('license'))
+        df_data['embeddable'].append(i['status'].get('embeddable'))
+        df_data['public_stats_viewable'].append(i['status'].get('publicStatsViewable'))
+        df_data['view_count'].append(int(i['statistics'].get('viewCount') or 0))
+        df_data['like_count'].append(int(i['statistics'].get('likeCount') or 0))
+        df_data['dislike_count'].append(int(i['statistics'].get('dislikeCount') or 0))
+        df_data['favorite_count'].append(int(i['statistics'].get('favoriteCount') or 0))
+        df_data['comment_count'].append(int(i['statistics'].get('commentCount') or 0))
+        df_data['thumbnails_default'].append(i.get('snippet').get('thumbnails').get('default').get('url'))
+        df_data['date_data_created'].append(datetime.datetime.now(tz=pytz.UTC))
+    return df_data
+
+def rowwise_comments_to_df(all_comments):
+    '''Former row by row version of "comments_to_df()".'''
+    new_dict = {'id': [], 'text_original': [], 'like_count': [], 'published_at': [], 'total_reply_count': []}
+    for c in all_comments:
+        if c['kind'] == 'youtube#commentThread':
+            s = c['snippet']['topLevelComment']['snippet']
+            new_dict['total_reply_count'].append(c['snippet']['totalReplyCount'])
+        else:
+            s = c['snippet']
+            new_dict['total_reply_count'].append(c['snippet'].get('totalReplyCount'))
+        new_dict['id'].append(c['id'])
+        new_dict['like_count'].append(s['likeCount'])
+        new_dict['text_original'].append(s['textOriginal'])
+        new_dict['published_at'].append(pd.to_datetime(s['publishedAt'], utc=True))
+    return pd.DataFrame(data=new_dict).set_index('id')
+
+def timed(func, *args):
+    '''Return the result of func and the seconds it took.'''
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main(n=100000):
+    videos = synthetic.video_items(n)
+    comments = synthetic.comment_items(n)
+
+    old, old_sec = timed(lambda v: pd.DataFrame(rowwise_snippets_to_dict(v)), videos)
+    new, new_sec = timed(lambda v: pd.DataFrame(ydt.snippets_to_dict(v)), videos)
+    pd.testing.assert_frame_equal(old.drop(columns='date_data_created'), new.drop(columns='date_data_created'))
+    assert old['date_data_created'].dtype == new['date_data_created'].dtype
+    print(f'snippets_to_dict: {n} videos row by row {old_sec:.2f}s, vectorized {new_sec:.2f}s, speedup {old_sec / new_sec:.1f}x')
+
+    old, old_sec = timed(rowwise_comments_to_df, comments)
+    new, new_sec = timed(ydt.comments_to_df, comments)
+    pd.testing.assert_frame_equal(old, new)
+    print(f'comments_to_df: {n} comments row by row {old_sec:.2f}s, vectorized {new_sec:.2f}s, speedup {old_sec / new_sec:.1f}x')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
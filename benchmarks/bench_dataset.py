@@ -0,0 +1,60 @@
+'''Benchmark of loading the videos of a channel from its Parquet dataset against building the dataframe from the local store.
+
+Run from the repository root: python benchmarks/bench_dataset.py [n]'''
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import synthetic
+
+def timed(func, *args, **kwargs):
+    '''Return the result of func and the seconds it took.'''
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def main(n=50000):
+    # The database and the datasets are created in a temporary folder
+    os.environ['YOUTUBE_DATA_DB'] = os.path.join(tempfile.mkdtemp(prefix='bench_dataset_'), 'youtube_data.db')
+    import pandas as pd
+    from src import youtube_data_module as ydt
+    from src import dataset
+    from src import sql
+
+    if not dataset.DATASET_ENABLED:
+        print('pyarrow is not installed, the datasets are disabled')
+        return
+
+    channel_id = 'UC' + 'x' * 22
+    sql.upsert_videos(synthetic.video_items(n, channel_id=channel_id))
+    version = sql.get_store_version(f'videos:{channel_id}')
+    build = lambda: pd.DataFrame(ydt.snippets_to_dict(sql.get_videos(channel_id)))
+
+    store_df, store_sec = timed(build)
+    print(f'{n} videos from the store: {store_sec:.3f}s')
+    _, write_sec = timed(dataset.load_frame, 'videos', channel_id, version, build)
+    print(f'{n} videos from the store and written to the dataset: {write_sec:.3f}s')
+
+    dataset_df, read_sec = timed(dataset.load_frame, 'videos', channel_id, version, build)
+    columns = [c for c in store_df.columns if c != 'date_data_created']
+    pd.testing.assert_frame_equal(store_df[columns], dataset_df[columns], check_dtype=False, check_categorical=False)
+    print(f'{n} videos from the dataset, all columns: {read_sec:.3f}s, speedup {store_sec / read_sec:.0f}x')
+
+    for name, columns in [
+        ('top_videos', ['channel_title', 'title', 'view_count']),
+        ('duration histogram', ['channel_id', 'channel_title', 'duration_sec']),
+    ]:
+        df, sec = timed(dataset.load_frame, 'videos', channel_id, version, build, columns=columns)
+        pd.testing.assert_frame_equal(store_df[columns], df, check_dtype=False, check_categorical=False)
+        print(f'{n} videos from the dataset, {name} columns: {sec * 1000:.1f}ms, speedup {store_sec / sec:.0f}x')
+
+    since = store_df['published_at'].max() - pd.Timedelta(days=30)
+    df, sec = timed(dataset.read_videos, channel_id, filters=[('published_at', '>=', since)])
+    assert len(df) == (store_df['published_at'] >= since).sum()
+    print(f'{len(df)} videos of the last 30 days from the dataset: {sec * 1000:.1f}ms')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
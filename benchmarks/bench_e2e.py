@@ -0,0 +1,146 @@
+'''End to end benchmark of the "/video_comments" and "/channels" analyses against the local fake API, see fake_youtube.py.
+
+Times the stages fetch, dict conversion, DataFrame build, sentiment and plotting for synthetic channels and videos of
+the given sizes and writes a JSON report. Caches are disabled, so every run downloads and computes everything.
+
+Run from the repository root:
+    python benchmarks/bench_e2e.py --videos 100,1000 --comments 1000,10000 --report bench_e2e.json
+    python benchmarks/bench_e2e.py --videos 100,1000,10000,50000 --comments 1000,10000,100000,500000 --latency 0.02'''
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import datetime
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fake_youtube
+
+def parse_sizes(value):
+    return [int(v) for v in value.split(',') if v]
+
+@contextmanager
+def stage(stages, name):
+    start = time.perf_counter()
+    yield
+    stages[name] = round(stages.get(name, 0) + time.perf_counter() - start, 4)
+
+def bench_video(ydt, viz, youtube, video_id):
+    '''Run the stages of the comment analysis of a video like "app.analyze_video()". Return the seconds per stage.'''
+    stages = {}
+    with stage(stages, 'fetch'):
+        all_snippets = ydt.get_all_comments(youtube, video_id)
+    with stage(stages, 'dict'):
+        comment_dict = ydt.extract_comments(all_snippets)
+    with stage(stages, 'dataframe'):
+        comment_df = ydt.comments_to_df(all_snippets)
+    with stage(stages, 'sentiment'):
+        comment_sentiment = ydt.analyze_comment_sentiments(comment_df)
+    with stage(stages, 'plotting'):
+        comment_frequencies = ydt.word_frequencies(f'comments:{video_id}', comment_dict, ydt.count_comment_words)
+        viz.create_wordcloud(comment_frequencies, stopwords=None, video_id=video_id, channel_title=video_id)
+        comment_sentiment2, pos_sent, neg_sent = viz.split_sentiment_pos_neg(comment_sentiment)
+        viz.lineplot_cumsum_video_comments(comment_sentiment2, video_id)
+        viz.lineplot_cumsum_video_comments_pos_neg(comment_sentiment2, pos_sent, neg_sent, video_id)
+        viz.scatterplot_sentiment_likecount(comment_sentiment2, pos_sent, neg_sent, video_id)
+    return stages, len(all_snippets)
+
+def bench_channel(ydt, viz, sql, youtube, channel_id):
+    '''Run the stages of the comparison of a channel like "app.analyze_channels()". Return the seconds per stage.'''
+    stages = {}
+    with stage(stages, 'fetch'):
+        video_snippet_list = ydt.video_snippets(youtube, ydt.videoIdList(youtube, channel_id), fields=ydt.fields_mask('videos', ydt.VIDEO_PARTS))
+    with stage(stages, 'store'):
+        sql.upsert_videos(video_snippet_list)
+    with stage(stages, 'rollups'):
+        channel_ids = [channel_id]
+        channel_counts = ydt.get_channel_rollups(channel_ids)
+        channel_title = channel_counts['channel_title'].iloc[0]
+        duration_counts = ydt.get_duration_counts(channel_id)
+        top_videos = ydt.get_top_videos(channel_ids, metric='view', n=5)
+    with stage(stages, 'plotting'):
+        viz.render_plots([
+            (viz.barplot_channel_video_count, (channel_counts, channel_ids), {}),
+            (viz.barplot_links, (channel_counts, channel_ids), {}),
+            (viz.histogram_video_duration_count_single, (duration_counts, channel_id), {'channel_title': channel_title}),
+            (viz.create_wordcloud, (ydt.channel_tag_frequencies(channel_id),), {'stopwords': None, 'video_id': channel_id, 'channel_title': channel_title}),
+        ])
+        viz.top_videos(top_videos, metric='view', n=5)
+    return stages, len(video_snippet_list)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--videos', type=parse_sizes, default=[100, 1000], help='comma separated numbers of videos per channel')
+    parser.add_argument('--comments', type=parse_sizes, default=[1000, 10000], help='comma separated numbers of comments per video')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per http request of the fake API')
+    parser.add_argument('--report', default='bench_e2e.json', help='path of the JSON report')
+    args = parser.parse_args()
+
+    # One channel per channel size and one channel with a video per comment count
+    comment_channel = len(args.videos)
+    sizes = {fake_youtube.channel_id(c): n for c, n in enumerate(args.videos)}
+    sizes[fake_youtube.channel_id(comment_channel)] = len(args.comments)
+    sizes.update({fake_youtube.video_id(comment_channel, i): n for i, n in enumerate(args.comments)})
+    api = fake_youtube.FakeYouTube(fake_youtube.Dataset(sizes=sizes), latency=args.latency)
+    server = fake_youtube.start(api)
+
+    # The app reads its configuration on import. Plots are rendered into memory, also in the render processes.
+    work_dir = tempfile.mkdtemp(prefix='bench_e2e_')
+    os.environ.update({
+        'YOUTUBE_API_ENDPOINT': server.url,
+        'YOUTUBE_DATA_DB': os.path.join(work_dir, 'youtube_data.db'),
+        'YOUTUBE_CACHE': '0',
+        'SENTIMENT_CACHE': '0',
+        'YOUTUBE_DAILY_QUOTA': str(10 ** 9),
+        'PLOT_OUTPUT': 'memory',
+    })
+    import matplotlib
+    matplotlib.use('Agg')
+    from src import youtube_data_module as ydt
+    from src import viz
+    from src import sql
+    youtube = ydt.youtubeAPIkey('benchmark')
+
+    results = []
+    runs = [('channels', fake_youtube.channel_id(c), n) for c, n in enumerate(args.videos)]
+    runs += [('video_comments', fake_youtube.video_id(comment_channel, i), n) for i, n in enumerate(args.comments)]
+    for flow, item_id, size in runs:
+        before = dict(api.stats)
+        start = time.perf_counter()
+        if flow == 'channels':
+            stages, items = bench_channel(ydt, viz, sql, youtube, item_id)
+        else:
+            stages, items = bench_video(ydt, viz, youtube, item_id)
+        total = time.perf_counter() - start
+        result = {
+            'flow': flow,
+            'size': size,
+            'items': items,
+            'stages': stages,
+            'total': round(total, 4),
+            'api': {k: api.stats[k] - before[k] for k in api.stats},
+            'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+        results.append(result)
+        print(f'{flow} {size}: ' + ', '.join(f'{k} {v:.2f}s' for k, v in stages.items()) + f', total {total:.2f}s, {result["api"]["http_requests"]} http requests')
+
+    report = {
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'latency': args.latency,
+        'results': results,
+    }
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Report written to {args.report}')
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+'''Benchmark of partial responses: bytes per call and parse time with and without the field masks of "fields_mask()".
+
+Runs the video, comment and search downloads of the app against the local fake API, see fake_youtube.py, once with full
+responses and once with field masks, checks that the app gets the same dataframes and prints the JSON bytes, the parse
+time per endpoint and the gzip compressed bytes on the wire.
+
+Run from the repository root: python benchmarks/bench_fields.py [videos] [comments]'''
+import os
+import sys
+import time
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fake_youtube
+
+ENDPOINTS = ['search', 'playlistItems', 'videos', 'commentThreads', 'comments']
+
+def run(ydt, tracing, api, youtube, channel_id, video_id):
+    '''Download the videos of a channel, the comments of a video and a page of search results.
+    Return the dataframes and the requests, bytes and parse seconds per endpoint.'''
+    before = {e: (tracing.get_count('youtube_api_requests_total', endpoint=e),
+                  tracing.get_count('youtube_api_response_bytes_total', endpoint=e),
+                  tracing.get_count('youtube_api_parse_seconds_total', endpoint=e)) for e in ENDPOINTS}
+    stats = dict(api.stats)
+
+    start = time.perf_counter()
+    video_df = ydt.channel_video_df(youtube, channel_id)
+    comment_df = ydt.comments_to_df(ydt.get_all_comments(youtube, video_id))
+    ydt.youtubeSearchList(youtube, q='fake', maxResults=50, type='video')
+    seconds = time.perf_counter() - start
+
+    endpoints = {}
+    for e in ENDPOINTS:
+        requests, response_bytes, parse_seconds = before[e]
+        endpoints[e] = (tracing.get_count('youtube_api_requests_total', endpoint=e) - requests,
+                        tracing.get_count('youtube_api_response_bytes_total', endpoint=e) - response_bytes,
+                        tracing.get_count('youtube_api_parse_seconds_total', endpoint=e) - parse_seconds)
+    wire = {k: api.stats[k] - stats[k] for k in ('bytes_sent', 'bytes_uncompressed')}
+    return video_df, comment_df, endpoints, wire, seconds
+
+def main(videos=5000, comments=20000):
+    sizes = {fake_youtube.channel_id(0): videos, fake_youtube.channel_id(1): 1, fake_youtube.video_id(1, 0): comments}
+    api = fake_youtube.FakeYouTube(fake_youtube.Dataset(sizes=sizes))
+    server = fake_youtube.start(api)
+    os.environ.update({
+        'YOUTUBE_API_ENDPOINT': server.url,
+        'YOUTUBE_DATA_DB': os.path.join(tempfile.mkdtemp(prefix='bench_fields_'), 'youtube_data.db'),
+        'YOUTUBE_CACHE': '0',
+        'YOUTUBE_DAILY_QUOTA': str(10 ** 9),
+    })
+    import pandas as pd
+    from src import youtube_data_module as ydt
+    from src import tracing
+    youtube = ydt.youtubeAPIkey('benchmark')
+    ydt.logger.setLevel(logging.WARNING)
+
+    results = {}
+    for partial in (False, True):
+        ydt.PARTIAL_RESPONSES = partial
+        results[partial] = run(ydt, tracing, api, youtube, fake_youtube.channel_id(0), fake_youtube.video_id(1, 0))
+
+    full, masked = results[False], results[True]
+    columns = [c for c in full[0].columns if c != 'date_data_created']
+    pd.testing.assert_frame_equal(full[0][columns], masked[0][columns])
+    pd.testing.assert_frame_equal(full[1], masked[1])
+
+    print(f'{videos} videos, {comments} comments')
+    print(f'{"endpoint":<16}{"calls":>7}{"full bytes/call":>17}{"masked bytes/call":>19}{"saved":>8}{"full parse":>12}{"masked parse":>14}')
+    for e in ENDPOINTS:
+        calls, full_bytes, full_parse = full[2][e]
+        _, masked_bytes, masked_parse = masked[2][e]
+        if not calls:
+            continue
+        print(f'{e:<16}{calls:>7}{full_bytes // calls:>17}{masked_bytes // calls:>19}{1 - masked_bytes / full_bytes:>8.0%}'
+              f'{full_parse:>11.3f}s{masked_parse:>13.3f}s')
+
+    for name, (_, _, endpoints, wire, seconds) in [('full', full), ('masked', masked)]:
+        json_bytes = sum(b for _, b, _ in endpoints.values())
+        print(f'{name}: {json_bytes / 1e6:.1f} MB JSON, {wire["bytes_sent"] / 1e6:.1f} MB gzip on the wire, {seconds:.2f}s')
+    server.shutdown()
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:3]])
@@ -0,0 +1,54 @@
+'''Benchmark of the concurrent reply downloads of "get_all_comments()": wall-clock time with workers=1, the serial path,
+and with n workers against the local fake API with latency per request, see fake_youtube.py.
+
+Both runs download the same comments without the response cache. The speedup is the ratio of the two wall-clock times.
+
+Run from the repository root: python benchmarks/bench_replies.py [comments] [workers] [latency]'''
+import os
+import sys
+import time
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fake_youtube
+
+def timed(func):
+    '''Return the result of func() and its wall-clock seconds.'''
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def main(comments=3000, workers=8, latency=0.02):
+    video_id = fake_youtube.video_id(0, 0)
+    # Up to 12 replies per thread, so about half of the threads need extra reply requests
+    dataset = fake_youtube.Dataset(replies_per_thread=6, sizes={video_id: comments})
+    api = fake_youtube.FakeYouTube(dataset, latency=latency)
+    server = fake_youtube.start(api)
+    os.environ.update({
+        'YOUTUBE_API_ENDPOINT': server.url,
+        'YOUTUBE_DATA_DB': os.path.join(tempfile.mkdtemp(prefix='bench_replies_'), 'youtube_data.db'),
+        'YOUTUBE_CACHE': '0',
+        'YOUTUBE_DAILY_QUOTA': str(10 ** 9),
+    })
+    from src import youtube_data_module as ydt
+    youtube = ydt.youtubeAPIkey('benchmark')
+    ydt.logger.setLevel(logging.WARNING)
+
+    results = {}
+    for n in (1, workers):
+        requests = api.stats['api_requests']
+        snippets, seconds = timed(lambda: ydt.get_all_comments(youtube, video_id, workers=n))
+        results[n] = (sorted(s['id'] for s in snippets), seconds, api.stats['api_requests'] - requests)
+
+    assert results[1][0] == results[workers][0], 'The serial and the concurrent path returned different comments'
+    print(f'{comments} comments, {latency * 1000:.0f}ms latency per request')
+    for n, (ids, seconds, requests) in results.items():
+        print(f'workers={n:<4}{len(ids):>8} comments{requests:>6} requests{seconds:>8.2f}s')
+    print(f'speedup {results[1][1] / results[workers][1]:.1f}x')
+    server.shutdown()
+
+if __name__ == '__main__':
+    args = sys.argv[1:4]
+    main(*[int(a) for a in args[:2]], *[float(a) for a in args[2:3]])
@@ -0,0 +1,33 @@
+'''Benchmark for the sentiment engine: serial scoring against the process pool.
+
+Run from the repository root: python benchmarks/bench_sentiment.py [n] [workers]'''
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src import sentiment
+import synthetic
+
+def main(n=100000, workers=None):
+    workers = workers or sentiment.SENTIMENT_WORKERS
+    comments = synthetic.comment_items(n)
+    texts = [c['snippet']['topLevelComment']['snippet']['textOriginal'] if c['kind'] == 'youtube#commentThread' else c['snippet']['textOriginal'] for c in comments]
+
+    start = time.perf_counter()
+    serial = sentiment.score_texts(texts, workers=1)
+    serial_sec = time.perf_counter() - start
+
+    # Start the pool outside of the measurement
+    sentiment.score_texts(texts[:1000], workers=workers, min_parallel=0)
+    start = time.perf_counter()
+    parallel = sentiment.score_texts(texts, workers=workers, min_parallel=0)
+    parallel_sec = time.perf_counter() - start
+
+    assert np.array_equal(serial, parallel)
+    print(f'{n} comments serial {serial_sec:.2f}s, {workers} workers {parallel_sec:.2f}s, speedup {serial_sec / parallel_sec:.1f}x')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000, int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -0,0 +1,66 @@
+'''Benchmark of the startup of the web app: import time and memory of "import app" with lazy imports and with PRELOAD_HEAVY=1.
+
+Every run starts a new Python process, imports the app, sends a request to "/" and then loads the heavy dependencies,
+that the first analysis needs, see "app.preload()". The medians of n runs are printed.
+
+Run from the repository root: python benchmarks/bench_startup.py [n]'''
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Runs in the child process and prints the measurements as JSON
+CHILD = '''
+import sys
+import json
+import time
+import resource
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is the peak in kilobytes on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+result = {}
+start = time.perf_counter()
+import app
+result['import_sec'] = time.perf_counter() - start
+result['import_rss_mb'] = rss_mb()
+result['modules'] = len(sys.modules)
+
+start = time.perf_counter()
+app.app.test_client().get('/')
+result['first_request_sec'] = time.perf_counter() - start
+
+start = time.perf_counter()
+app.preload()
+result['heavy_sec'] = time.perf_counter() - start
+result['heavy_rss_mb'] = rss_mb()
+print(json.dumps(result))
+'''
+
+def run(preload):
+    '''Measure the startup in a new process. Return the measurements.'''
+    env = dict(os.environ, PRELOAD_HEAVY='1' if preload else '0', YOUTUBE_API_KEY=os.getenv('YOUTUBE_API_KEY', 'benchmark'))
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main(n=5):
+    print(f'{"mode":<10}{"import":>10}{"RSS":>10}{"modules":>9}{"first /":>10}{"heavy deps":>12}{"RSS after":>11}')
+    for name, preload in [('lazy', False), ('preload', True)]:
+        runs = [run(preload) for _ in range(n)]
+        median = {k: statistics.median(r[k] for r in runs) for k in runs[0]}
+        print(f'{name:<10}{median["import_sec"]:>9.3f}s{median["import_rss_mb"]:>8.0f}MB{median["modules"]:>9.0f}'
+              f'{median["first_request_sec"] * 1000:>8.1f}ms{median["heavy_sec"]:>11.3f}s{median["heavy_rss_mb"]:>9.0f}MB')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
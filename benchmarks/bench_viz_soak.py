@@ -0,0 +1,73 @@
+'''Soak test for the viz functions: render thousands of plots in several threads and check that the resident memory stays bounded.
+
+Run from the repository root: python benchmarks/bench_viz_soak.py [n_plots] [threads] [max_growth_mb]'''
+import os
+import sys
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src import youtube_data_module as ydt
+from src import viz
+import synthetic
+
+def rss_mb():
+    '''Return the resident memory of this process in MB.'''
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def render(n, channel_counts, duration_counts, comment_sentiment, pos_sent, neg_sent, tags):
+    '''Render one plot. The plot type depends on n, the image name is unique so that the plot cache is never hit.'''
+    kind = n % 6
+    ids = [f'soak{n}']
+    if kind == 0:
+        return viz.barplot_channel_video_count(channel_counts, ids)
+    if kind == 1:
+        return viz.barplot_links(channel_counts, ids)
+    if kind == 2:
+        return viz.histogram_video_duration_count_single(duration_counts, ids[0], channel_title='Soak')
+    if kind == 3:
+        return viz.create_wordcloud(tags, stopwords=None, video_id=ids[0])
+    if kind == 4:
+        return viz.lineplot_cumsum_video_comments_pos_neg(comment_sentiment, pos_sent, neg_sent, ids[0])
+    return viz.scatterplot_sentiment_likecount(comment_sentiment, pos_sent, neg_sent, ids[0])
+
+def main(n_plots=3000, threads=4, max_growth_mb=150):
+    viz.IMAGE_DIR = tempfile.mkdtemp(prefix='viz_soak_')
+    # Keep only a few images on disk
+    viz.PLOT_CACHE_MAX_BYTES = 5 * 1024 * 1024
+
+    video_df = pd.DataFrame(ydt.snippets_to_dict(synthetic.video_items(500)))
+    comment_df = ydt.comments_to_df(synthetic.comment_items(2000))
+    comment_sentiment = ydt.analyze_comment_sentiments(comment_df, workers=1)
+    comment_sentiment, pos_sent, neg_sent = viz.split_sentiment_pos_neg(comment_sentiment)
+    tags = dict(ydt.count_tag_words(video_df['tags']))
+    # The rollups of the channel comparison, see "youtube_data_module.get_channel_rollups()"
+    channel_counts = video_df.groupby(['channel_id', 'channel_title']).agg(
+        video_count=('video_id', 'size'), link_count=('description', lambda d: d.str.contains('http').sum())
+    ).reset_index()
+    duration_counts = video_df['duration_sec'].value_counts().sort_index()
+    args = (channel_counts, duration_counts, comment_sentiment, pos_sent, neg_sent, tags)
+
+    # Warm up caches of matplotlib, fonts and wordcloud before measuring
+    for n in range(60):
+        render(n, *args)
+    baseline = rss_mb()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda n: render(n, *args), range(60, 60 + n_plots)))
+    seconds = time.perf_counter() - start
+    growth = rss_mb() - baseline
+
+    print(f'{n_plots} plots with {threads} threads in {seconds:.1f}s, resident memory {baseline:.0f} MB -> {baseline + growth:.0f} MB')
+    assert growth < max_growth_mb, f'Resident memory grew by {growth:.0f} MB'
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:4]])
@@ -0,0 +1,65 @@
+'''Micro-benchmark for the word cloud input of "count_comment_words()" and "count_tag_words()" against the former string building.
+
+Run from the repository root: python benchmarks/bench_wordcloud.py [n]'''
+import os
+import sys
+import re
+import time
+from wordcloud import WordCloud, STOPWORDS
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src import youtube_data_module as ydt
+from src import viz
+import synthetic
+
+# Texts with cases, plurals, numbers and "'s" endings, that WordCloud treats specially
+EXTRA_COMMENTS = ["The cat's toys and cats are 100% the BEST", 'Cats cats CAT class classes glass 2020', "It's what it's"]
+EXTRA_TAGS = [["Mike's Song", 'songs 2020', 'the Best of'], ['Song', 'Glass', 'glasses']]
+
+def string_concat_comments(comment_dict):
+    '''Former version of "concat_comments()".'''
+    string = ''
+    for i, c in comment_dict.items():
+        result = re.findall('[a-z0-9]+', c.lower())
+        string += ' '.join(result) + ' '
+    return string
+
+def string_concat_listelements(series_object):
+    '''Former version of "concat_listelements()".'''
+    result = ''
+    for tag_list in series_object:
+        if tag_list:
+            for tag in tag_list:
+                result += ' ' + ''.join(tag).upper()
+    return result
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def compare(label, n, build_string, count_words, data):
+    wordcloud = WordCloud(stopwords=STOPWORDS, collocations=False)
+    old, old_sec = timed(lambda d: wordcloud.process_text(build_string(d)), data)
+    new, new_sec = timed(lambda d: viz.wordcloud_frequencies(count_words(d), STOPWORDS), data)
+    assert old == new, (label, set(old.items()) ^ set(new.items()))
+    print(f'{label}: {n} items string building {old_sec:.2f}s, counting {new_sec:.2f}s, speedup {old_sec / new_sec:.1f}x')
+
+def main(n=100000):
+    comment_dict = {c['id']: c['snippet']['topLevelComment']['snippet']['textOriginal'] if c['kind'] == 'youtube#commentThread' else c['snippet']['textOriginal']
+                    for c in synthetic.comment_items(n)}
+    comment_dict.update({f'extra{i}': t for i, t in enumerate(EXTRA_COMMENTS)})
+    compare('comments', len(comment_dict), string_concat_comments, ydt.count_comment_words, comment_dict)
+
+    tags = [v['snippet']['tags'] for v in synthetic.video_items(n)] + EXTRA_TAGS
+    compare('tags', len(tags), string_concat_listelements, ydt.count_tag_words, tags)
+
+    # Counting in chunks gives the same frequencies
+    chunked = None
+    for s in range(0, len(tags), 1000):
+        chunked = ydt.count_tag_words(tags[s:s + 1000], chunked)
+    assert chunked == ydt.count_tag_words(tags)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
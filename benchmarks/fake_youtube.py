@@ -0,0 +1,412 @@
+'''Deterministic local stand-in of the YouTube Data API for benchmarks.
+
+Serves list requests of search, channels, playlistItems, videos, commentThreads and comments and batch requests under the
+paths of the API, with configurable latency, errors, page sizes and dataset sizes. Like the API, responses are gzip compressed,
+if the client accepts gzip and has "gzip" in its user agent, and reduced to the fields of the fields parameter. Items are generated on request from the seed,
+so channels with 50k videos and videos with 500k comments need no memory up front.
+
+Start it from a benchmark with "start()" or on the command line and point the app to it:
+
+    python benchmarks/fake_youtube.py --port 8080 --videos 1000 --comments 10000 --latency 0.05
+    YOUTUBE_API_ENDPOINT=http://localhost:8080/ python app.py
+'''
+import os
+import re
+import sys
+import json
+import html
+import hashlib
+import gzip
+import time
+import random
+import argparse
+import datetime
+import threading
+import email.parser
+import urllib.parse
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic
+
+# Newest video and comment. Older items are published one hour (videos) or one minute (comments) apart.
+NEWEST = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+# Number of channels, that a channel search finds
+SEARCH_CHANNELS = 20
+
+# Thumbnail sizes of the API
+THUMBNAILS = {'default': (120, 90), 'medium': (320, 180), 'high': (480, 360), 'standard': (640, 480), 'maxres': (1280, 720)}
+
+def timestamp(t):
+    return t.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def etag(key):
+    return hashlib.sha1(key.encode()).hexdigest()[:27]
+
+def select_parts(item, part):
+    '''Return a resource with kind, etag, id and the requested parts only.'''
+    parts = {p.strip() for p in part.split(',')}
+    return {k: v for k, v in item.items() if k in ('kind', 'etag', 'id') or k in parts}
+
+def complete_comment(item):
+    '''Add the fields of a comment, that the synthetic comments leave out, like the API sends them.'''
+    item['etag'] = etag(item['id'])
+    snippet = item['snippet']
+    snippet['textDisplay'] = html.escape(snippet['textOriginal'])
+    snippet['authorProfileImageUrl'] = 'https://yt3.ggpht.com/ytc/' + etag(item['id'] + 'a') * 2 + '=s48-c-k-c0x00ffffff-no-rj'
+    return item
+
+def channel_id(c):
+    '''Return the id of channel number c.'''
+    return f'UCfake{c:018d}'
+
+def video_id(c, i):
+    '''Return the id of video number i of channel number c. Videos are numbered from new to old.'''
+    return f'v{c:03d}{i:07d}'
+
+def parse_fields(fields):
+    '''Return a field mask such as "items(id,snippet/title),nextPageToken" as a tree of dictionaries. True selects a whole field.'''
+    tree, _ = _parse_selection(fields, 0)
+    return tree
+
+_NAME = re.compile(r'[^,/()]*')
+
+def _merge(node, name, sub):
+    if node.get(name) is True or sub is True:
+        node[name] = True
+        return
+    child = node.setdefault(name, {})
+    for k, v in sub.items():
+        _merge(child, k, v)
+
+def _parse_selection(fields, i):
+    tree = {}
+    while i < len(fields):
+        path = []
+        while True:
+            match = _NAME.match(fields, i)
+            path.append(match.group().strip())
+            i = match.end()
+            if i < len(fields) and fields[i] == '/':
+                i += 1
+                continue
+            break
+        if i < len(fields) and fields[i] == '(':
+            sub, i = _parse_selection(fields, i + 1)
+        else:
+            sub = True
+        for name in reversed(path[1:]):
+            sub = {name: sub}
+        _merge(tree, path[0], sub)
+
+        if i < len(fields) and fields[i] == ',':
+            i += 1
+        elif i < len(fields) and fields[i] == ')':
+            return tree, i + 1
+    return tree, i
+
+def apply_fields(value, tree):
+    '''Return value reduced to the fields of a tree from "parse_fields()" like the API does for the fields parameter.'''
+    if tree is True:
+        return value
+    if isinstance(value, list):
+        return [apply_fields(v, tree) for v in value]
+    if isinstance(value, dict):
+        if '*' in tree:
+            return {k: apply_fields(v, tree['*']) for k, v in value.items()}
+        return {k: apply_fields(value[k], sub) for k, sub in tree.items() if k in value}
+    return value
+
+class Dataset:
+    '''Deterministic channels, videos and comments.\n
+    Every channel has videos_per_channel videos and every video has comments_per_video comment threads and replies,
+    unless sizes maps a channel id or video id to another number.'''
+
+    def __init__(self, videos_per_channel=100, comments_per_video=1000, replies_per_thread=3, seed=0, sizes=None):
+        self.videos_per_channel = videos_per_channel
+        self.comments_per_video = comments_per_video
+        self.replies_per_thread = replies_per_thread
+        self.seed = seed
+        self.sizes = sizes or {}
+        self.reply_counts = lru_cache(maxsize=64)(self._reply_counts)
+
+    def rng(self, *key):
+        return random.Random(':'.join(map(str, (self.seed,) + key)))
+
+    def channel_index(self, channel_id):
+        match = re.fullmatch(r'(?:UC|UU)fake(\d{18})', channel_id or '')
+        return int(match.group(1)) if match else None
+
+    def video_count(self, c):
+        return self.sizes.get(channel_id(c), self.videos_per_channel)
+
+    def channel(self, c):
+        return {
+            'kind': 'youtube#channel',
+            'id': channel_id(c),
+            'snippet': {
+                'title': f'Fake Channel {c}',
+                'description': synthetic.text(self.rng('channel', c), 20),
+                'publishedAt': timestamp(NEWEST - datetime.timedelta(days=1000 + c)),
+                'thumbnails': {size: {'url': f'https://example.com/{channel_id(c)}/{size}.jpg'} for size in ('default', 'medium', 'high')}
+            },
+            'contentDetails': {'relatedPlaylists': {'uploads': 'UU' + channel_id(c)[2:], 'likes': ''}},
+            'statistics': {'videoCount': str(self.video_count(c)), 'viewCount': '0', 'subscriberCount': '0', 'hiddenSubscriberCount': False}
+        }
+
+    def video(self, video_id):
+        '''Return a video resource or None for an unknown id.'''
+        match = re.fullmatch(r'v(\d{3})(\d{7})', video_id)
+        if not match:
+            return None
+        c, i = int(match.group(1)), int(match.group(2))
+        if i >= self.video_count(c):
+            return None
+        item = synthetic.video_item(self.rng('video', c, i), video_id, channel_id(c), f'Fake Channel {c}')
+        snippet = item['snippet']
+        snippet['publishedAt'] = timestamp(NEWEST - datetime.timedelta(hours=i))
+        snippet['thumbnails'] = {size: {'url': f'https://i.ytimg.com/vi/{video_id}/{size}.jpg', 'width': w, 'height': h} for size, (w, h) in THUMBNAILS.items()}
+        snippet['localized'] = {'title': snippet['title'], 'description': snippet['description']}
+        item['etag'] = etag(video_id)
+        item['contentDetails']['contentRating'] = {}
+        item['status'].update({'uploadStatus': 'processed', 'madeForKids': False})
+        item['statistics']['commentCount'] = str(self.sizes.get(video_id, self.comments_per_video))
+        item['player'] = {'embedHtml': f'<iframe width="480" height="270" src="//www.youtube.com/embed/{video_id}" frameborder="0" '
+                                       'allow="accelerometer; autoplay; clipboard-write; encrypted-media; gyroscope; picture-in-picture" allowfullscreen></iframe>'}
+        return item
+
+    def _reply_counts(self, video_id):
+        '''Return the number of replies of each comment thread of a video.'''
+        rng = self.rng('replies', video_id)
+        n = self.sizes.get(video_id, self.comments_per_video)
+        counts = []
+        total = 0
+        while total < n:
+            replies = min(rng.randint(0, self.replies_per_thread * 2), n - total - 1)
+            counts.append(replies)
+            total += 1 + replies
+        return counts
+
+    def comment_thread(self, video_id, j, with_replies):
+        '''Return comment thread number j of a video. Threads are numbered from new to old.'''
+        rng = self.rng('thread', video_id, j)
+        replies = self.reply_counts(video_id)[j]
+        thread_id = f'{video_id}-{j}'
+        item = synthetic.comment_thread_item(rng, video_id, thread_id, replies)
+        item['etag'] = etag(thread_id + 't')
+        complete_comment(item['snippet']['topLevelComment'])
+        published = NEWEST - datetime.timedelta(minutes=j)
+        item['snippet']['topLevelComment']['snippet']['publishedAt'] = timestamp(published)
+        item['snippet']['topLevelComment']['snippet']['updatedAt'] = timestamp(published)
+        if with_replies and replies:
+            # Up to 5 replies come with the thread
+            item['replies'] = {'comments': [self.reply(video_id, j, k) for k in range(min(replies, 5))]}
+        return item
+
+    def reply(self, video_id, j, k):
+        '''Return reply number k of comment thread number j of a video.'''
+        item = complete_comment(synthetic.comment_item(self.rng('reply', video_id, j, k), video_id, f'{video_id}-{j}.{k}', f'{video_id}-{j}'))
+        published = NEWEST - datetime.timedelta(minutes=j) + datetime.timedelta(seconds=k + 1)
+        item['snippet']['publishedAt'] = item['snippet']['updatedAt'] = timestamp(published)
+        return item
+
+    def comment(self, comment_id):
+        '''Return a comment thread or a reply by its id or None for an unknown id.'''
+        match = re.fullmatch(r'(v\d{10})-(\d+)(?:\.(\d+))?', comment_id)
+        if not match:
+            return None
+        video_id, j, k = match.group(1), int(match.group(2)), match.group(3)
+        counts = self.reply_counts(video_id)
+        if j >= len(counts) or (k is not None and int(k) >= counts[j]):
+            return None
+        if k is None:
+            return self.comment_thread(video_id, j, False)['snippet']['topLevelComment']
+        return self.reply(video_id, j, int(k))
+
+def page(items_at, total, params, max_results, default_results):
+    '''Return a list response with the items of a page. items_at returns the item at an index.'''
+    page_size = min(int(params.get('maxResults', default_results)), max_results)
+    start = int(params.get('pageToken') or 0)
+    end = min(start + page_size, total)
+    response = {'kind': 'youtube#listResponse', 'pageInfo': {'totalResults': total, 'resultsPerPage': page_size}, 'items': [items_at(i) for i in range(start, end)]}
+    if end < total:
+        response['nextPageToken'] = str(end)
+    return response
+
+class FakeYouTube:
+    '''Answer list requests of the API from a Dataset.'''
+
+    def __init__(self, dataset=None, latency=0.0, compress=True):
+        self.dataset = dataset or Dataset()
+        self.latency = latency
+        self.compress = compress
+        self.lock = threading.Lock()
+        # bytes_sent counts the bytes on the wire, bytes_uncompressed the bytes before gzip compression
+        self.stats = {'http_requests': 0, 'api_requests': 0, 'batch_requests': 0, 'bytes_sent': 0, 'bytes_uncompressed': 0}
+        # Errors, that the next list requests are answered with, one (status, reason) tuple per request
+        self.errors = []
+
+    def _count(self, **increments):
+        with self.lock:
+            for k, v in increments.items():
+                self.stats[k] += v
+
+    def list(self, endpoint, params):
+        '''Return the response of a list request and its HTTP status.'''
+        d = self.dataset
+        self._count(api_requests=1)
+        with self.lock:
+            error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            status, reason = error
+            return status, {'error': {'code': status, 'message': reason, 'errors': [{'reason': reason}]}}
+        if 'part' not in params:
+            return 400, {'error': {'code': 400, 'message': 'Required parameter: part', 'errors': [{'reason': 'required'}]}}
+
+        if endpoint == 'search':
+            if params.get('type') == 'channel':
+                def search_result(c):
+                    channel = d.channel(c)
+                    return {'kind': 'youtube#searchResult', 'id': {'kind': 'youtube#channel', 'channelId': channel['id']},
+                            'snippet': dict(channel['snippet'], channelId=channel['id'], channelTitle=channel['snippet']['title'])}
+                response = page(search_result, SEARCH_CHANNELS, params, 50, 5)
+            else:
+                c = d.channel_index(params.get('channelId')) or 0
+                def search_result(i):
+                    video = d.video(video_id(c, i))
+                    return {'kind': 'youtube#searchResult', 'id': {'kind': 'youtube#video', 'videoId': video['id']},
+                            'snippet': {k: video['snippet'][k] for k in ('publishedAt', 'channelId', 'title', 'description', 'thumbnails', 'channelTitle', 'liveBroadcastContent')}}
+                response = page(search_result, d.video_count(c), params, 50, 5)
+        elif endpoint == 'channels':
+            ids = [d.channel_index(i) for i in params.get('id', '').split(',')]
+            response = {'kind': 'youtube#channelListResponse', 'items': [d.channel(c) for c in ids if c is not None]}
+        elif endpoint == 'playlistItems':
+            c = d.channel_index(params.get('playlistId'))
+            if c is None:
+                return 404, {'error': {'code': 404, 'errors': [{'reason': 'playlistNotFound'}]}}
+            def playlist_item(i):
+                published = timestamp(NEWEST - datetime.timedelta(hours=i))
+                return {'kind': 'youtube#playlistItem', 'id': f'PL{video_id(c, i)}',
+                        'snippet': {'publishedAt': published, 'channelId': channel_id(c), 'title': f'Video {i}', 'position': i,
+                                    'playlistId': params['playlistId'], 'resourceId': {'kind': 'youtube#video', 'videoId': video_id(c, i)}},
+                        'contentDetails': {'videoId': video_id(c, i), 'videoPublishedAt': published}}
+            response = page(playlist_item, d.video_count(c), params, 50, 5)
+        elif endpoint == 'videos':
+            videos = [d.video(i) for i in params.get('id', '').split(',')[:50]]
+            response = {'kind': 'youtube#videoListResponse', 'items': [select_parts(v, params['part']) for v in videos if v is not None]}
+        elif endpoint == 'commentThreads':
+            video = params.get('videoId', '')
+            counts = d.reply_counts(video) if d.video(video) else []
+            with_replies = 'replies' in params['part']
+            response = page(lambda j: d.comment_thread(video, j, with_replies), len(counts), params, 100, 20)
+        elif endpoint == 'comments':
+            if params.get('parentId'):
+                video, j = params['parentId'].rsplit('-', 1)
+                replies = d.reply_counts(video)[int(j)] if d.comment(params['parentId']) else 0
+                response = page(lambda k: d.reply(video, int(j), k), replies, params, 100, 20)
+            else:
+                comments = [d.comment(i) for i in params.get('id', '').split(',')[:50]]
+                response = {'kind': 'youtube#commentListResponse', 'items': [c for c in comments if c is not None]}
+            if params['part'] == 'id':
+                response['items'] = [{'kind': c['kind'], 'id': c['id']} for c in response['items']]
+        else:
+            return 404, {'error': {'code': 404, 'errors': [{'reason': 'notFound'}]}}
+
+        if params.get('fields'):
+            response = apply_fields(response, parse_fields(params['fields']))
+        return 200, response
+
+    def get(self, path):
+        '''Answer a GET request of a path like /youtube/v3/videos?part=id&id=... Return the status and the response.'''
+        url = urllib.parse.urlsplit(path)
+        match = re.fullmatch(r'/youtube/v3/(\w+)', url.path)
+        if not match:
+            return 404, {'error': {'code': 404, 'errors': [{'reason': 'notFound'}]}}
+        params = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+        return self.list(match.group(1), params)
+
+    def batch(self, content_type, body):
+        '''Answer a multipart batch request. Return the content type and the body of the multipart response.'''
+        self._count(batch_requests=1)
+        message = email.parser.BytesParser().parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        boundary = 'fake_youtube_batch'
+        parts = []
+        for part in message.get_payload():
+            request_line = part.get_payload().split('\n', 1)[0]
+            status, response = self.get(request_line.split(' ')[1])
+            content_id = part['Content-ID'].strip('<>')
+            parts.append(
+                f'--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n'
+                f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n'
+                f'{json.dumps(response)}\r\n'
+            )
+        return f'multipart/mixed; boundary={boundary}', (''.join(parts) + f'--{boundary}--\r\n').encode()
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive connections like the API. Headers and body are written separately, so Nagle's algorithm would delay the body.
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def send(self, status, content_type, body):
+        api = self.server.api
+        uncompressed = len(body)
+        # The API compresses only for clients with "gzip" in the user agent
+        gzipped = api.compress and 'gzip' in self.headers.get('Accept-Encoding', '') and 'gzip' in self.headers.get('User-Agent', '')
+        if gzipped:
+            body = gzip.compress(body, compresslevel=6)
+        api._count(http_requests=1, bytes_sent=len(body), bytes_uncompressed=uncompressed)
+        if api.latency:
+            time.sleep(api.latency)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        status, response = self.server.api.get(self.path)
+        self.send(status, 'application/json; charset=UTF-8', json.dumps(response).encode())
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if urllib.parse.urlsplit(self.path).path != '/batch':
+            return self.send(404, 'application/json; charset=UTF-8', b'{"error": {"code": 404}}')
+        content_type, response = self.server.api.batch(self.headers['Content-Type'], body)
+        self.send(200, content_type, response)
+
+    def log_message(self, format, *args):
+        pass
+
+def start(api=None, host='127.0.0.1', port=0):
+    '''Start a server for a FakeYouTube in a background thread and return the server. The base url of the API is server.url.'''
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+    server.api = api or FakeYouTube()
+    server.url = f'http://{host}:{server.server_address[1]}/'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a deterministic local stand-in of the YouTube Data API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--videos', type=int, default=100, help='videos per channel')
+    parser.add_argument('--comments', type=int, default=1000, help='comment threads and replies per video')
+    parser.add_argument('--replies', type=int, default=3, help='average replies per comment thread')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per http request')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-gzip', action='store_true', help='send uncompressed responses')
+    args = parser.parse_args()
+
+    api = FakeYouTube(Dataset(args.videos, args.comments, args.replies, args.seed), latency=args.latency, compress=not args.no_gzip)
+    server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+    server.api = api
+    print(f'Serving the fake YouTube Data API on http://{args.host}:{args.port}/, e.g. channel {channel_id(0)} and video {video_id(0, 0)}')
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
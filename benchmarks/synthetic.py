@@ -0,0 +1,113 @@
+'''Deterministic synthetic YouTube Data API items for benchmarks.'''
+import random
+
+WORDS = ['music', 'video', 'great', 'awful', 'love', 'hate', 'tutorial', 'python', 'data', 'funny',
+         'best', 'worst', 'thanks', 'amazing', 'boring', 'live', 'new', 'song', 'game', 'review']
+
+def text(rng, n_words=12):
+    '''Return a random sentence.'''
+    return ' '.join(rng.choice(WORDS) for _ in range(n_words))
+
+def timestamp(rng, year=2019):
+    '''Return a random ISO 8601 timestamp in the format of the API.'''
+    return f'{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}Z'
+
+def video_item(rng, video_id, channel_id='UC' + 'x' * 22, channel_title='Synthetic Channel'):
+    '''Return a video resource with the parts snippet, statistics, contentDetails and status.'''
+    hours, minutes, seconds = rng.choice([0, 0, 0, 1]), rng.randint(0, 59), rng.randint(0, 59)
+    duration = 'PT' + (f'{hours}H' if hours else '') + (f'{minutes}M' if minutes else '') + (f'{seconds}S' if seconds else '')
+    return {
+        'kind': 'youtube#video',
+        'id': video_id,
+        'snippet': {
+            'publishedAt': timestamp(rng),
+            'channelId': channel_id,
+            'title': text(rng, 6),
+            'description': text(rng, 40) + (' https://example.com' if rng.random() < 0.5 else ''),
+            'channelTitle': channel_title,
+            'tags': [text(rng, 2) for _ in range(rng.randint(1, 8))] if rng.random() < 0.8 else None,
+            'categoryId': rng.choice(['10', '20', '22', '24', '27', '28']),
+            'liveBroadcastContent': 'none',
+            'thumbnails': {
+                'default': {'url': f'https://i.ytimg.com/vi/{video_id}/default.jpg'},
+                'medium': {'url': f'https://i.ytimg.com/vi/{video_id}/mqdefault.jpg'}
+            }
+        },
+        'contentDetails': {
+            'duration': duration if duration != 'PT' else 'PT0S',
+            'dimension': '2d',
+            'definition': rng.choice(['hd', 'sd']),
+            'caption': 'false',
+            'licensedContent': True,
+            'projection': 'rectangular'
+        },
+        'status': {
+            'privacyStatus': 'public',
+            'license': 'youtube',
+            'embeddable': True,
+            'publicStatsViewable': True
+        },
+        'statistics': {
+            'viewCount': str(rng.randint(0, 10 ** 7)),
+            'likeCount': str(rng.randint(0, 10 ** 5)),
+            'dislikeCount': str(rng.randint(0, 10 ** 3)),
+            'favoriteCount': '0',
+            'commentCount': str(rng.randint(0, 10 ** 4))
+        }
+    }
+
+def comment_snippet(rng, video_id, parent_id=None):
+    '''Return the snippet of a comment.'''
+    snippet = {
+        'videoId': video_id,
+        'authorDisplayName': 'Author',
+        'authorProfileImageUrl': 'https://example.com/a.jpg',
+        'authorChannelUrl': 'https://www.youtube.com/channel/UCauthor',
+        'authorChannelId': {'value': 'UCauthor'},
+        'textDisplay': '',
+        'textOriginal': text(rng, rng.randint(3, 30)),
+        'canRate': True,
+        'viewerRating': 'none',
+        'likeCount': rng.randint(0, 500),
+        'publishedAt': timestamp(rng, 2020),
+        'updatedAt': timestamp(rng, 2020)
+    }
+    if parent_id:
+        snippet['parentId'] = parent_id
+    return snippet
+
+def comment_thread_item(rng, video_id, thread_id, total_reply_count=0):
+    '''Return a comment thread resource without replies.'''
+    return {
+        'kind': 'youtube#commentThread',
+        'id': thread_id,
+        'snippet': {
+            'videoId': video_id,
+            'topLevelComment': {'kind': 'youtube#comment', 'id': thread_id, 'snippet': comment_snippet(rng, video_id)},
+            'canReply': True,
+            'totalReplyCount': total_reply_count,
+            'isPublic': True
+        }
+    }
+
+def comment_item(rng, video_id, comment_id, parent_id):
+    '''Return a reply comment resource.'''
+    return {'kind': 'youtube#comment', 'id': comment_id, 'snippet': comment_snippet(rng, video_id, parent_id)}
+
+def video_items(n, seed=0, **kwargs):
+    '''Return a list of n video resources.'''
+    rng = random.Random(seed)
+    return [video_item(rng, f'video{i:07d}', **kwargs) for i in range(n)]
+
+def comment_items(n, seed=0, video_id='video0000000', replies_per_thread=3):
+    '''Return a list of n comment threads and replies as returned by "get_all_comments()".'''
+    rng = random.Random(seed)
+    threads, replies = [], []
+    i = 0
+    while len(threads) + len(replies) < n:
+        thread_id = f'thread{i:07d}'
+        n_replies = min(rng.randint(0, replies_per_thread * 2), n - len(threads) - len(replies) - 1)
+        threads.append(comment_thread_item(rng, video_id, thread_id, n_replies))
+        replies += [comment_item(rng, video_id, f'{thread_id}.reply{j}', thread_id) for j in range(n_replies)]
+        i += 1
+    return threads + replies
@@ -0,0 +1,105 @@
+import os
+import re
+import uuid
+import logging
+import sys
+import importlib.util
+from src import sql
+from src import tracing
+
+logger = logging.getLogger('dataset_logger')
+handler = logging.StreamHandler(sys.stderr)
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+# Folder of the Parquet datasets: <DATASET_DIR>/videos/<channel_id>.parquet and <DATASET_DIR>/comments/<video_id>.parquet.
+# The datasets are built from the local store, so they are kept next to its database file.
+DATASET_DIR = os.getenv('YOUTUBE_DATASET_DIR', os.path.join(os.path.dirname(sql.DB_PATH), 'datasets'))
+# The datasets need pyarrow, which is imported on first use. Without it or with YOUTUBE_DATASET=0 the dataframes are built from the local store every time.
+DATASET_ENABLED = importlib.util.find_spec('pyarrow') is not None and os.getenv('YOUTUBE_DATASET', '1') != '0'
+# Rows per row group. Filters on sorted columns like published_at skip whole row groups by their statistics.
+ROW_GROUP_SIZE = int(os.getenv('YOUTUBE_DATASET_ROW_GROUP_SIZE', 10000))
+# Increase when the columns of the dataframes change, so old datasets are written again
+FORMAT_VERSION = 1
+
+# Columns with few distinct values, that are stored dictionary encoded and read as categoricals
+CATEGORICAL_COLUMNS = {
+    'videos': ['channel_id', 'channel_title', 'category_id', 'category', 'live_broadcast_content', 'dimension', 'definition',
+               'caption', 'projection', 'privacy_status', 'license'],
+    'comments': [],
+}
+
+def dataset_path(kind, key):
+    '''Return the path of the dataset of a channel (kind 'videos') or a video (kind 'comments').'''
+    return os.path.join(DATASET_DIR, kind, re.sub(r'[^A-Za-z0-9_-]', '_', key) + '.parquet')
+
+def read_version(kind, key):
+    '''Return the version of the store, that a dataset was written from, or None, if there is no dataset.'''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    try:
+        metadata = pq.read_schema(dataset_path(kind, key), memory_map=True).metadata or {}
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    version = metadata.get(b'source_version')
+    return version.decode() if version is not None else None
+
+def write_frame(kind, key, df, version):
+    '''Write a dataframe to the dataset of key together with the version of the store, that it was built from.\n
+    The file is written next to the dataset and then renamed, so readers never see a partly written dataset.'''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    df = df.astype({c: 'category' for c in CATEGORICAL_COLUMNS[kind] if c in df.columns})
+    table = pa.Table.from_pandas(df, preserve_index=df.index.name is not None)
+    table = table.replace_schema_metadata(dict(table.schema.metadata or {}, source_version=version))
+
+    path = dataset_path(kind, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp_path, path)
+
+def read_frame(kind, key, columns=None, filters=None):
+    '''Read the dataset of key into a dataframe. The file is memory mapped and only the given columns and the row groups,
+    that can match filters, are read. filters are pyarrow filters like [('published_at', '>=', pd.Timestamp('2020-01-01', tz='UTC'))].'''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    table = pq.read_table(dataset_path(kind, key), columns=columns, filters=filters, memory_map=True)
+    df = table.to_pandas()
+    # List columns like tags come back as numpy arrays, the rest of the app expects lists
+    for field in table.schema:
+        if pa.types.is_list(field.type):
+            df[field.name] = table.column(field.name).to_pylist()
+    return df
+
+def load_frame(kind, key, version, build, columns=None, filters=None):
+    '''Return the dataframe of key from its dataset, if the dataset was written from version of the store.\n
+    Otherwise build the dataframe with build(), write the dataset and read it back, so the columns have the same types every time.
+    Without pyarrow the built dataframe is returned and filters are ignored.'''
+    version = f'{FORMAT_VERSION}:{version}'
+    if not DATASET_ENABLED:
+        df = build()
+        return df[columns] if columns is not None else df
+
+    if read_version(kind, key) != version:
+        logger.info(f'Writing {kind} dataset of {key}')
+        with tracing.span('dataset.build', kind=kind):
+            write_frame(kind, key, build(), version)
+        tracing.count('dataset_loads_total', kind=kind, source='store')
+    else:
+        tracing.count('dataset_loads_total', kind=kind, source='dataset')
+
+    with tracing.span('dataset.read', kind=kind):
+        return read_frame(kind, key, columns=columns, filters=filters)
+
+def read_videos(channel_id, columns=None, filters=None):
+    '''Return the video dataframe of a channel as written by "youtube_data_module.channel_video_df()" without a sync or None, if there is no dataset.'''
+    if not DATASET_ENABLED or not os.path.exists(dataset_path('videos', channel_id)):
+        return None
+    return read_frame('videos', channel_id, columns=columns, filters=filters)
+
+def read_comments(video_id, columns=None, filters=None):
+    '''Return the comment dataframe of a video as written by "youtube_data_module.get_comment_df()" without a sync or None, if there is no dataset.'''
+    if not DATASET_ENABLED or not os.path.exists(dataset_path('comments', video_id)):
+        return None
+    return read_frame('comments', video_id, columns=columns, filters=filters)
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from src import sql
+from src import tracing
+
+logger = logging.getLogger('jobs_logger')
+handler = logging.StreamHandler(sys.stderr)
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+# Number of analyses, that run at the same time
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+
+def process_owner():
+    '''Return the owner of the jobs started by this process. The random part tells this process apart from an earlier one with the same pid,
+    e.g. after a container restart.'''
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+OWNER = process_owner()
+
+_executor = None
+
+def _after_fork():
+    '''Give a forked process, e.g. a gunicorn worker, its own owner. The threads of the parent's job pool do not exist in the child.'''
+    global OWNER, _executor
+    OWNER = process_owner()
+    _executor = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+def get_executor():
+    '''Return the thread pool, that runs the jobs of this process.'''
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+    return _executor
+
+def submit(job_key, func, *args, rerun_of=None):
+    '''Run func(*args, progress=...) in the background and return the job id.\n
+    If a job with the same job_key is queued or running in any process sharing the database, return its id instead of starting another one.
+    rerun_of is the id of a job, that is run again, see "get_rerun_job_id()".
+    func must return a JSON serializable result. progress is a function, that takes a message describing the current step.'''
+    recover_jobs(job_key)
+    new_job_id = uuid.uuid4().hex
+    job_id = sql.create_job(new_job_id, job_key, OWNER, rerun_of=rerun_of)
+    if job_id != new_job_id:
+        return job_id
+
+    get_executor().submit(_run, job_id, job_key, func, args)
+    logger.info(f'Queued job {job_id} for {job_key}')
+    return job_id
+
+def _run(job_id, job_key, func, args):
+    start = time.perf_counter()
+    sql.update_job(job_id, status='running')
+    try:
+        with tracing.profile(job_key), tracing.span('job', job=func.__name__):
+            result = func(*args, progress=lambda message: sql.update_job(job_id, progress=message))
+        sql.update_job(job_id, status='done', progress='Done', result=json.dumps(result))
+        logger.info(f'Job {job_id} for {job_key} done in {time.perf_counter() - start:.1f}s')
+    except Exception as e:
+        logger.exception(f'Job {job_id} for {job_key} failed')
+        sql.update_job(job_id, status='failed', error=f'{type(e).__name__}: {e}')
+
+def _owner_alive(owner):
+    '''Return False, if the process owner, that started a job, is known to be gone. Processes on other hosts are assumed to be alive.'''
+    if owner == OWNER:
+        return True
+    if owner is None:
+        # Started by a version, that did not record the owner
+        return False
+
+    host, pid, _ = owner.rsplit(':', 2)
+    if host != socket.gethostname():
+        return True
+    if int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def recover_jobs(job_key=None):
+    '''Mark the queued and running jobs, whose process is gone, as failed, optionally only the jobs with job_key.
+    Called when the app starts, so the pages of jobs interrupted by a restart stop waiting for them.'''
+    for job_id, owner in sql.get_active_jobs(job_key):
+        if not _owner_alive(owner):
+            sql.update_job(job_id, status='failed', error='Interrupted, because the server stopped. Start the analysis again.')
+            logger.warning(f'Job {job_id} of {owner} was interrupted')
+
+def get_rerun_job_id(job_id):
+    '''Return the id of the latest job, that runs the job job_id again, or None.'''
+    return sql.get_rerun_job_id(job_id)
+
+def get_job(job_id):
+    '''Return a dictionary with status, progress, error and the decoded result of a job or None, if there is no such job.'''
+    job = sql.get_job(job_id)
+    if job is not None and job['status'] in ('queued', 'running') and not _owner_alive(job['owner']):
+        recover_jobs(job['job_key'])
+        job = sql.get_job(job_id)
+    if job is not None and job['result'] is not None:
+        job['result'] = json.loads(job['result'])
+    return job
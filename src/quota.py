@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import random
+import datetime
+import threading
+import logging
+import sys
+import pytz
+from src import sql
+
+logger = logging.getLogger('quota_logger')
+handler = logging.StreamHandler(sys.stderr)
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+# Quota units per day of the API project. The quota is reset at midnight Pacific Time.
+DAILY_QUOTA = int(os.getenv('YOUTUBE_DAILY_QUOTA', 10000))
+# Quota units per second and the burst of units, that can be spent at once. UNITS_PER_SECOND=0 disables the throttling.
+UNITS_PER_SECOND = float(os.getenv('YOUTUBE_QUOTA_PER_SECOND', 0))
+BURST = float(os.getenv('YOUTUBE_QUOTA_BURST', 200))
+# Retries of failed requests with exponential backoff: base * 2 ** attempt seconds with full jitter, at most BACKOFF_MAX seconds
+MAX_RETRIES = int(os.getenv('YOUTUBE_MAX_RETRIES', 5))
+BACKOFF_BASE = float(os.getenv('YOUTUBE_BACKOFF_BASE', 1))
+BACKOFF_MAX = float(os.getenv('YOUTUBE_BACKOFF_MAX', 32))
+
+QUOTA_TIMEZONE = pytz.timezone('America/Los_Angeles')
+# Reasons of 403 errors, that are retried. quotaExceeded means the daily quota is used up and raises QuotaExceeded, see "is_daily_quota_error()".
+RETRY_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'backendError', 'internalError'}
+
+def quota_day():
+    '''Return the current day of the quota in the format YYYY-MM-DD.'''
+    return datetime.datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+class QuotaExceeded(Exception):
+    '''Raised instead of sending a request, that would exceed the daily quota.'''
+
+def error_reason(error):
+    '''Return the reason of an HttpError of the API such as 'quotaExceeded' or None.'''
+    try:
+        return json.loads(error.content)['error']['errors'][0]['reason']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+def is_daily_quota_error(error):
+    '''Return True for the 403 error, that the API answers with, when the daily quota of the API project is used up.'''
+    import googleapiclient.errors
+    return isinstance(error, googleapiclient.errors.HttpError) and error.resp.status == 403 and error_reason(error) == 'quotaExceeded'
+
+def is_retryable(error):
+    '''Return True for errors, that may go away when the request is sent again: rate and quota limits, server errors and connection errors.'''
+    import googleapiclient.errors
+    if isinstance(error, googleapiclient.errors.HttpError):
+        status = error.resp.status
+        return status == 429 or status >= 500 or (status == 403 and error_reason(error) in RETRY_REASONS)
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+class QuotaScheduler:
+    '''Send API requests within a daily quota and a token bucket of units per second and retry failed requests with jittered exponential backoff.\n
+    The daily usage is counted in the database, so it survives restarts of the app and is shared by all processes of the app.'''
+
+    def __init__(self, daily_quota=None, units_per_second=None, burst=None, max_retries=None, backoff_base=None, backoff_max=None, sleep=time.sleep):
+        self.daily_quota = DAILY_QUOTA if daily_quota is None else daily_quota
+        self.units_per_second = UNITS_PER_SECOND if units_per_second is None else units_per_second
+        self.burst = BURST if burst is None else burst
+        self.max_retries = MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_max = BACKOFF_MAX if backoff_max is None else backoff_max
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.metrics = {'calls': 0, 'units': 0, 'retries': 0, 'errors': 0, 'rejected': 0, 'throttled_seconds': 0.0, 'endpoints': {}}
+
+    def acquire(self, cost, endpoint=None):
+        '''Reserve cost units of the daily quota and wait until the token bucket has them. Raise QuotaExceeded, if the daily quota is used up.'''
+        reserved, used = sql.reserve_quota_usage(quota_day(), cost, self.daily_quota)
+        with self.lock:
+            if not reserved:
+                self.metrics['rejected'] += 1
+                raise QuotaExceeded(f'{endpoint} request of {cost} units exceeds the daily quota ({used} of {self.daily_quota} units used)')
+
+            wait = 0.0
+            if self.units_per_second:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.units_per_second)
+                self.refilled_at = now
+                # Requests, that cost more than the burst, wait for a full bucket
+                needed = min(cost, self.burst)
+                if self.tokens < needed:
+                    wait = (needed - self.tokens) / self.units_per_second
+                # The bucket may go below zero, so later requests wait for the units reserved here
+                self.tokens -= cost
+                self.metrics['throttled_seconds'] += wait
+
+        if wait > 0:
+            self.sleep(wait)
+
+    def backoff(self, attempt, error=None):
+        '''Return the seconds to wait before retry number attempt. A Retry-After header of the error takes precedence.'''
+        resp = getattr(error, 'resp', None)
+        retry_after = resp.get('retry-after') if resp is not None else None
+        if retry_after and str(retry_after).isdigit():
+            return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def wait_retry(self, attempt, error, endpoint=None):
+        '''Wait before retry number attempt of a request, that failed with error.'''
+        wait = self.backoff(attempt, error)
+        logger.info(f'Retrying {endpoint} request in {wait:.1f}s after {type(error).__name__}: {error_reason(error) or error}')
+        with self.lock:
+            self.metrics['retries'] += 1
+        self.sleep(wait)
+
+    def execute(self, func, cost, endpoint=None):
+        '''Call func, that sends one request of cost units, within the quota and return its result.
+        Retry up to max_retries times on errors, that may go away, see "is_retryable()". Raise QuotaExceeded, if the API reports,
+        that the daily quota is used up.'''
+        self.acquire(cost, endpoint)
+        attempt = 0
+        while True:
+            try:
+                result = func()
+                break
+            except Exception as e:
+                if is_daily_quota_error(e) or not is_retryable(e) or attempt >= self.max_retries:
+                    with self.lock:
+                        self.metrics['errors'] += 1
+                    if is_daily_quota_error(e):
+                        raise QuotaExceeded(f'{endpoint} request was rejected by the API, because the daily quota is used up') from e
+                    raise
+                self.wait_retry(attempt, e, endpoint)
+                attempt += 1
+
+        with self.lock:
+            self.metrics['calls'] += 1
+            self.metrics['units'] += cost
+            endpoint_metrics = self.metrics['endpoints'].setdefault(endpoint, {'calls': 0, 'units': 0})
+            endpoint_metrics['calls'] += 1
+            endpoint_metrics['units'] += cost
+        return result
+
+    def get_metrics(self):
+        '''Return the daily quota, the units used today by all processes and the counters of this process.'''
+        day = quota_day()
+        used = sql.get_quota_usage(day)
+        with self.lock:
+            metrics = json.loads(json.dumps(self.metrics))
+            metrics.update({
+                'day': day,
+                'daily_quota': self.daily_quota,
+                'used_today': used,
+                'remaining_today': max(self.daily_quota - used, 0),
+                'units_per_second': self.units_per_second,
+            })
+            return metrics
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    '''Return the scheduler, that all API requests of this process go through.'''
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = QuotaScheduler()
+        return _scheduler
+
+def get_metrics():
+    '''Return the live quota metrics of the scheduler, see "QuotaScheduler.get_metrics()".'''
+    return get_scheduler().get_metrics()
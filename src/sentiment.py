@@ -0,0 +1,117 @@
+import os
+import threading
+import hashlib
+import multiprocessing
+from importlib import metadata
+from concurrent.futures import ProcessPoolExecutor
+from src import sql
+
+# Score columns in the order of VADER's polarity_scores()
+COLUMNS = ['neg', 'neu', 'pos', 'compound']
+
+# Number of worker processes and the smallest number of texts, that is scored in parallel
+SENTIMENT_WORKERS = int(os.getenv('SENTIMENT_WORKERS', os.cpu_count() or 1))
+MIN_PARALLEL = int(os.getenv('SENTIMENT_MIN_PARALLEL', 20000))
+CHUNK_SIZE = 5000
+
+# Scores are cached by a hash of the text and the analyzer version
+CACHE_ENABLED = os.getenv('SENTIMENT_CACHE', '1') != '0'
+# Most scores kept in the cache. The least recently used scores are evicted above it, about 100 bytes per score.
+CACHE_MAX_ROWS = int(os.getenv('SENTIMENT_CACHE_MAX_ROWS', 1000000))
+try:
+    ANALYZER_VERSION = 'vaderSentiment-' + metadata.version('vaderSentiment')
+except metadata.PackageNotFoundError:
+    ANALYZER_VERSION = 'vaderSentiment'
+
+cache_stats = {'hits': 0, 'misses': 0, 'duplicates': 0}
+_cache_stats_lock = threading.Lock()
+
+_analyzer = None
+_pools = {}
+_pool_lock = threading.Lock()
+
+def get_analyzer():
+    '''Return the sentiment analyzer of this process. Loading the lexicon is done only once per process.'''
+    global _analyzer
+    if _analyzer is None:
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+        _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+def score_chunk(texts):
+    '''Return an array with one row of neg, neu, pos and compound scores per text.'''
+    import numpy as np
+    analyzer = get_analyzer()
+    scores = np.empty((len(texts), len(COLUMNS)), dtype='float64')
+    for n, text in enumerate(texts):
+        vs = analyzer.polarity_scores(text)
+        scores[n] = [vs[k] for k in COLUMNS]
+    return scores
+
+def get_pool(workers):
+    '''Return a process pool with workers processes. There is one pool per number of workers, that is created once and reused,
+    so callers asking for another number never shut down a pool, that other threads are using.
+    Like the render pool in "viz.get_render_pool()" the workers are started by a fork server, because the pool is created
+    from the threads of the jobs. The fork server is shared with the render pool, which sets its preloaded modules.'''
+    with _pool_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers, initializer=get_analyzer, mp_context=context)
+        return pool
+
+def score_texts(texts, workers=None, min_parallel=None, chunk_size=CHUNK_SIZE):
+    '''Return an array with one row of neg, neu, pos and compound scores per text.\n
+    Texts are split into chunks of chunk_size and scored by a pool of workers processes.
+    Less than min_parallel texts or workers=1 are scored in this process.'''
+    texts = list(texts)
+    workers = SENTIMENT_WORKERS if workers is None else workers
+    min_parallel = MIN_PARALLEL if min_parallel is None else min_parallel
+
+    if workers <= 1 or len(texts) < max(min_parallel, 2):
+        return score_chunk(texts)
+
+    import numpy as np
+    chunks = [texts[s:s + chunk_size] for s in range(0, len(texts), chunk_size)]
+    return np.concatenate(list(get_pool(workers).map(score_chunk, chunks)))
+
+def text_hash(text):
+    '''Return the cache key of a text for the current analyzer version.'''
+    return hashlib.sha1(f'{ANALYZER_VERSION}\0{text}'.encode('utf-8')).hexdigest()
+
+def score_texts_cached(texts, workers=None):
+    '''Return an array with one row of neg, neu, pos and compound scores per text like "score_texts()".\n
+    Only texts, that are neither in the score cache nor repeated in texts, are scored.'''
+    texts = list(texts)
+    hashes = [text_hash(t) for t in texts]
+
+    # Texts by hash, repeated texts are scored once
+    unique = dict(zip(hashes, texts))
+    cached = sql.get_sentiment_scores(unique)
+    missing = [h for h in unique if h not in cached]
+
+    if missing:
+        new_scores = score_texts([unique[h] for h in missing], workers=workers)
+        new_scores = {h: tuple(row) for h, row in zip(missing, new_scores.tolist())}
+        sql.set_sentiment_scores(new_scores, max_rows=CACHE_MAX_ROWS)
+        cached.update(new_scores)
+
+    with _cache_stats_lock:
+        cache_stats['hits'] += len(unique) - len(missing)
+        cache_stats['misses'] += len(missing)
+        cache_stats['duplicates'] += len(texts) - len(unique)
+
+    import numpy as np
+    scores = np.empty((len(texts), len(COLUMNS)), dtype='float64')
+    for n, h in enumerate(hashes):
+        scores[n] = cached[h]
+    return scores
+
+def get_cache_stats():
+    '''Return the score cache counters and the share of texts, that did not need to be scored.'''
+    with _cache_stats_lock:
+        stats = dict(cache_stats)
+    total = stats['hits'] + stats['misses'] + stats['duplicates']
+    stats['hit_rate'] = (stats['hits'] + stats['duplicates']) / total if total else 0.0
+    return stats
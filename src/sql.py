@@ -1,10 +1,756 @@
 import time
 import random
+import os
+import re
+import json
+import sqlite3
+import threading
+from collections import Counter
+
+# Local SQLite database for cached API responses
+DB_PATH = os.getenv('YOUTUBE_DATA_DB', 'youtube_data.db')
+
+_local = threading.local()
+# Connections inherited from the parent process, see "_after_fork()"
+_inherited = []
+# Ranking weights of the columns of the full text indexes, see "search_index()"
+VIDEO_INDEX_WEIGHTS = (10.0, 1.0, 4.0, 6.0)
+CHANNEL_INDEX_WEIGHTS = (10.0, 1.0)
+# Columns of the full text indexes
+INDEX_COLUMNS = {'video': ('title', 'description', 'tags', 'channel_title'), 'channel': ('title', 'description')}
+# Set to False, when SQLite is built without FTS5
+_search_index_available = True
+# Metrics of the top videos per channel, see "get_top_videos()"
+TOP_METRICS = ('view', 'like', 'dislike', 'comment')
+DURATION_PATTERN = re.compile(r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?')
 
 def set_temp_id():
     '''Create a random string by using current unix time and random integer of 4 digits.'''
     time_id = str(int(time.time()))
     rand_id = str(random.randint(1000,9999))
     temp_id = time_id + "_" + rand_id
-    
+
     return temp_id
+
+def _after_fork():
+    '''Drop the connections inherited from the parent process, e.g. the gunicorn master with --preload. SQLite connections must not be used
+    across fork(), so the child opens its own ones. The inherited connections are never closed, because that could change the database files
+    of the parent.'''
+    global _local
+    _inherited.append(_local)
+    _local = threading.local()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+def get_connection(db_path=None):
+    '''Return a SQLite connection for the current thread. Connections are reused per thread and database file.'''
+    db_path = db_path or DB_PATH
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    connection = connections.get(db_path)
+    if connection is None:
+        connection = sqlite3.connect(db_path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        create_tables(connection)
+        connections[db_path] = connection
+
+    return connection
+
+def create_tables(connection):
+    '''Create all tables, that do not exist yet.'''
+    connection.executescript('''
+        CREATE TABLE IF NOT EXISTS api_cache (
+            cache_key TEXT PRIMARY KEY,
+            endpoint TEXT NOT NULL,
+            response TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS api_cache_last_access ON api_cache (last_access);
+        CREATE TABLE IF NOT EXISTS videos (
+            video_id TEXT PRIMARY KEY,
+            channel_id TEXT NOT NULL,
+            published_at TEXT,
+            item TEXT NOT NULL,
+            fetched_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS videos_channel_id ON videos (channel_id, published_at);
+        CREATE TABLE IF NOT EXISTS channel_sync (
+            channel_id TEXT PRIMARY KEY,
+            synced_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS comments (
+            comment_id TEXT PRIMARY KEY,
+            video_id TEXT NOT NULL,
+            parent_id TEXT,
+            published_at TEXT,
+            updated_at TEXT,
+            total_reply_count INTEGER,
+            item TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS comments_video_id ON comments (video_id, parent_id, published_at);
+        CREATE TABLE IF NOT EXISTS sentiment_scores (
+            text_hash TEXT PRIMARY KEY,
+            neg REAL NOT NULL,
+            neu REAL NOT NULL,
+            pos REAL NOT NULL,
+            compound REAL NOT NULL,
+            last_access REAL NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            job_key TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress TEXT,
+            result TEXT,
+            error TEXT,
+            owner TEXT,
+            rerun_of TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS comment_sync (
+            video_id TEXT PRIMARY KEY,
+            watermark TEXT,
+            synced_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS quota_usage (
+            day TEXT PRIMARY KEY,
+            units INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS store_versions (
+            store_key TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS word_frequencies (
+            frequency_key TEXT PRIMARY KEY,
+            input_hash TEXT NOT NULL,
+            frequencies TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        );
+    ''')
+    # Columns, that tables of databases of older versions do not have
+    for table, column, definition in [('jobs', 'owner', 'TEXT'), ('jobs', 'rerun_of', 'TEXT'), ('sentiment_scores', 'last_access', 'REAL NOT NULL DEFAULT 0')]:
+        if column not in [row[1] for row in connection.execute(f'PRAGMA table_info({table})')]:
+            connection.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    connection.execute('CREATE INDEX IF NOT EXISTS sentiment_scores_last_access ON sentiment_scores (last_access)')
+    connection.commit()
+    create_search_index(connection)
+    create_rollups(connection)
+
+def create_search_index(connection):
+    '''Create the full text indexes of videos and channels, see "search_index()". Stored videos are indexed, when the indexes are created.'''
+    global _search_index_available
+    if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'channel_index'").fetchone():
+        return
+
+    # The first connections of several threads may get here at the same time. The write lock lets one of them create and fill the indexes.
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'channel_index'").fetchone() is None:
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS search_items (
+                    item_id INTEGER PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    resource_id TEXT NOT NULL,
+                    item TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    UNIQUE (kind, resource_id)
+                )
+            ''')
+            try:
+                connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS video_index USING fts5(title, description, tags, channel_title, tokenize='unicode61 remove_diacritics 2')")
+                connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS channel_index USING fts5(title, description, tokenize='unicode61 remove_diacritics 2')")
+            except sqlite3.OperationalError:
+                # SQLite without FTS5
+                _search_index_available = False
+                connection.rollback()
+                return
+            _index_videos(connection, [json.loads(row[0]) for row in connection.execute('SELECT item FROM videos')])
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+def create_rollups(connection):
+    '''Create the per channel rollups of the channel comparison, see "get_channel_rollups()". Stored videos are added, when the rollups are created.'''
+    if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'channel_durations'").fetchone():
+        return
+
+    # Like "create_search_index()": only one of several first connections creates and fills the rollups
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'channel_durations'").fetchone() is None:
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS video_facts (
+                    video_id TEXT PRIMARY KEY,
+                    channel_id TEXT NOT NULL,
+                    channel_title TEXT,
+                    title TEXT,
+                    has_link INTEGER NOT NULL,
+                    duration_sec INTEGER NOT NULL,
+                    view_count INTEGER NOT NULL,
+                    like_count INTEGER NOT NULL,
+                    dislike_count INTEGER NOT NULL,
+                    comment_count INTEGER NOT NULL
+                )
+            ''')
+            for metric in TOP_METRICS:
+                connection.execute(f'CREATE INDEX IF NOT EXISTS video_facts_{metric} ON video_facts (channel_id, {metric}_count DESC)')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS channel_rollups (
+                    channel_id TEXT PRIMARY KEY,
+                    channel_title TEXT,
+                    video_count INTEGER NOT NULL,
+                    link_count INTEGER NOT NULL
+                )
+            ''')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS channel_durations (
+                    channel_id TEXT NOT NULL,
+                    duration_sec INTEGER NOT NULL,
+                    video_count INTEGER NOT NULL,
+                    PRIMARY KEY (channel_id, duration_sec)
+                ) WITHOUT ROWID
+            ''')
+            _update_rollups(connection, [json.loads(row[0]) for row in connection.execute('SELECT item FROM videos')])
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+def cache_get(cache_key, ttl, db_path=None):
+    '''Return a cached API response or None, if there is no entry younger than ttl seconds.'''
+    connection = get_connection(db_path)
+    now = time.time()
+    row = connection.execute(
+        'SELECT response, created_at FROM api_cache WHERE cache_key = ?', (cache_key,)
+    ).fetchone()
+
+    if row is None:
+        return None
+
+    if now - row[1] > ttl:
+        connection.execute('DELETE FROM api_cache WHERE cache_key = ?', (cache_key,))
+        connection.commit()
+        return None
+
+    connection.execute('UPDATE api_cache SET last_access = ? WHERE cache_key = ?', (now, cache_key))
+    connection.commit()
+    return json.loads(row[0])
+
+def cache_set(cache_key, endpoint, response, max_bytes=None, db_path=None):
+    '''Write an API response to the cache. Evict least recently used entries, if the cache grows bigger than max_bytes.'''
+    connection = get_connection(db_path)
+    now = time.time()
+    data = json.dumps(response)
+    connection.execute(
+        'INSERT OR REPLACE INTO api_cache (cache_key, endpoint, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)',
+        (cache_key, endpoint, data, len(data), now, now)
+    )
+
+    if max_bytes:
+        cache_evict(max_bytes, connection=connection)
+
+    connection.commit()
+
+def cache_evict(max_bytes, connection=None):
+    '''Delete least recently used cache entries until the total size of all responses is below max_bytes. Return number of deleted entries.'''
+    connection = connection or get_connection()
+    total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM api_cache').fetchone()[0]
+    if total <= max_bytes:
+        return 0
+
+    deleted = 0
+    for cache_key, size in connection.execute('SELECT cache_key, size FROM api_cache ORDER BY last_access').fetchall():
+        if total <= max_bytes:
+            break
+        connection.execute('DELETE FROM api_cache WHERE cache_key = ?', (cache_key,))
+        total -= size
+        deleted += 1
+
+    return deleted
+
+def cache_clear(endpoint=None, db_path=None):
+    '''Delete all cached responses or only the ones of a single endpoint.'''
+    connection = get_connection(db_path)
+    if endpoint:
+        connection.execute('DELETE FROM api_cache WHERE endpoint = ?', (endpoint,))
+    else:
+        connection.execute('DELETE FROM api_cache')
+    connection.commit()
+
+def _bump_versions(connection, store_keys):
+    connection.executemany(
+        'INSERT INTO store_versions (store_key, version) VALUES (?, 1) ON CONFLICT (store_key) DO UPDATE SET version = version + 1',
+        [(k,) for k in store_keys]
+    )
+
+def get_store_version(store_key, db_path=None):
+    '''Return the number of changes of the stored videos of a channel ('videos:<channel_id>') or comments of a video ('comments:<video_id>').'''
+    connection = get_connection(db_path)
+    row = connection.execute('SELECT version FROM store_versions WHERE store_key = ?', (store_key,)).fetchone()
+    return row[0] if row else 0
+
+def get_video_ids(channel_id, db_path=None):
+    '''Return a set of the stored video ids of a channel.'''
+    connection = get_connection(db_path)
+    rows = connection.execute('SELECT video_id FROM videos WHERE channel_id = ?', (channel_id,))
+    return {row[0] for row in rows}
+
+def upsert_videos(video_snippet_list, db_path=None):
+    '''Insert or replace video snippets as returned by "video_snippets()".'''
+    connection = get_connection(db_path)
+    now = time.time()
+    connection.executemany(
+        'INSERT OR REPLACE INTO videos (video_id, channel_id, published_at, item, fetched_at) VALUES (?, ?, ?, ?, ?)',
+        [(i['id'], i['snippet']['channelId'], i['snippet'].get('publishedAt'), json.dumps(i), now) for i in video_snippet_list]
+    )
+    _bump_versions(connection, {f"videos:{i['snippet']['channelId']}" for i in video_snippet_list})
+    _index_videos(connection, video_snippet_list)
+    _update_rollups(connection, video_snippet_list)
+    connection.commit()
+
+def _duration_sec(duration):
+    match = DURATION_PATTERN.search(duration or '')
+    if not match:
+        return 0
+    hours, minutes, seconds = (int(g or 0) for g in match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+def _video_facts(item):
+    '''Return the columns of video_facts of a video snippet. The values are derived like in "youtube_data_module.snippets_to_dict()".'''
+    snippet = item['snippet']
+    statistics = item.get('statistics', {})
+    return (
+        item['id'],
+        snippet['channelId'],
+        snippet.get('channelTitle'),
+        snippet.get('title'),
+        int('http' in (snippet.get('description') or '')),
+        _duration_sec(item.get('contentDetails', {}).get('duration')),
+        *[int(statistics.get(f'{metric}Count') or 0) for metric in TOP_METRICS],
+    )
+
+def _update_rollups(connection, video_snippet_list):
+    '''Update the facts of videos and the rollups of their channels by the difference to the stored facts.'''
+    facts = {f[0]: f for f in map(_video_facts, video_snippet_list)}
+    video_ids = list(facts)
+    old = {}
+    for start in range(0, len(video_ids), 500):
+        chunk = video_ids[start:start + 500]
+        rows = connection.execute(
+            f'SELECT video_id, channel_id, has_link, duration_sec FROM video_facts WHERE video_id IN ({", ".join("?" * len(chunk))})', chunk
+        )
+        old.update((row[0], row[1:]) for row in rows)
+
+    # Differences of the video and link counts per channel and of the video counts per channel and duration
+    channel_deltas = {}
+    duration_deltas = Counter()
+    for video_id, (_, channel_id, channel_title, _, has_link, duration_sec, *_) in facts.items():
+        before = old.get(video_id)
+        if before == (channel_id, has_link, duration_sec):
+            continue
+        changes = [((channel_id, has_link, duration_sec), 1)] if before is None else [(before, -1), ((channel_id, has_link, duration_sec), 1)]
+        for (c, link, duration), sign in changes:
+            title, videos, links = channel_deltas.get(c, (None, 0, 0))
+            channel_deltas[c] = (channel_title if sign > 0 else title, videos + sign, links + sign * link)
+            duration_deltas[(c, duration)] += sign
+
+    connection.executemany(
+        '''INSERT INTO channel_rollups (channel_id, channel_title, video_count, link_count) VALUES (?, ?, ?, ?)
+        ON CONFLICT (channel_id) DO UPDATE SET channel_title = coalesce(excluded.channel_title, channel_title),
+        video_count = video_count + excluded.video_count, link_count = link_count + excluded.link_count''',
+        [(c, title, videos, links) for c, (title, videos, links) in channel_deltas.items()]
+    )
+    connection.executemany(
+        '''INSERT INTO channel_durations (channel_id, duration_sec, video_count) VALUES (?, ?, ?)
+        ON CONFLICT (channel_id, duration_sec) DO UPDATE SET video_count = video_count + excluded.video_count''',
+        [(c, duration, videos) for (c, duration), videos in duration_deltas.items() if videos]
+    )
+    connection.executemany(
+        'DELETE FROM channel_durations WHERE channel_id = ? AND duration_sec = ? AND video_count <= 0',
+        [key for key, videos in duration_deltas.items() if videos < 0]
+    )
+    connection.executemany('INSERT OR REPLACE INTO video_facts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', list(facts.values()))
+
+def get_channel_rollups(channel_ids, db_path=None):
+    '''Return the video count, the count of videos with a link in the description and the channel title of channels
+    as a list of dictionaries in the order of channel_ids. Channels without stored videos are left out.'''
+    connection = get_connection(db_path)
+    rollups = []
+    for channel_id in channel_ids:
+        row = connection.execute(
+            'SELECT channel_title, video_count, link_count FROM channel_rollups WHERE channel_id = ? AND video_count > 0', (channel_id,)
+        ).fetchone()
+        if row is not None:
+            rollups.append({'channel_id': channel_id, 'channel_title': row[0], 'video_count': row[1], 'link_count': row[2]})
+    return rollups
+
+def get_duration_counts(channel_id, db_path=None):
+    '''Return a list of durations in seconds and the number of stored videos of a channel with that duration, ordered by duration.'''
+    connection = get_connection(db_path)
+    return connection.execute(
+        'SELECT duration_sec, video_count FROM channel_durations WHERE channel_id = ? ORDER BY duration_sec', (channel_id,)
+    ).fetchall()
+
+def get_top_videos(channel_ids, metric='view', n=5, db_path=None):
+    '''Return the n stored videos with the highest count of metric of every channel as a list of dictionaries with the video id,
+    channel id, channel title, title and the count. metric is one of TOP_METRICS.'''
+    if metric not in TOP_METRICS:
+        raise ValueError(f'Unknown metric {metric}')
+    connection = get_connection(db_path)
+    top = []
+    for channel_id in channel_ids:
+        rows = connection.execute(
+            f'''SELECT video_id, channel_id, channel_title, title, {metric}_count FROM video_facts
+            WHERE channel_id = ? ORDER BY {metric}_count DESC LIMIT ?''',
+            (channel_id, n)
+        )
+        top.extend(dict(zip(('video_id', 'channel_id', 'channel_title', 'title', f'{metric}_count'), row)) for row in rows)
+    return top
+
+def _index_items(connection, kind, rows):
+    if not _search_index_available or not rows:
+        return
+    now = time.time()
+    for resource_id, item, columns in rows:
+        # One statement, so connections of other threads can not insert the same item in between
+        item_id = connection.execute(
+            '''INSERT INTO search_items (kind, resource_id, item, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (kind, resource_id) DO UPDATE SET item = excluded.item, updated_at = excluded.updated_at RETURNING item_id''',
+            (kind, resource_id, json.dumps(item), now)
+        ).fetchone()[0]
+        connection.execute(f'DELETE FROM {kind}_index WHERE rowid = ?', (item_id,))
+        connection.execute(
+            f'INSERT INTO {kind}_index (rowid, {", ".join(INDEX_COLUMNS[kind])}) VALUES (?{", ?" * len(columns)})', (item_id, *columns)
+        )
+
+def _index_videos(connection, video_snippet_list):
+    rows = []
+    for i in video_snippet_list:
+        snippet = i.get('snippet')
+        if not snippet:
+            continue
+        # Stored like a search result with statistics, see "youtube_data_module.youtubeSearchListStatistics()"
+        item = {
+            'kind': 'youtube#searchResult',
+            'id': {'kind': 'youtube#video', 'videoId': i['id']},
+            'snippet': {k: snippet.get(k) for k in ('publishedAt', 'channelId', 'title', 'description', 'channelTitle')},
+            'statistics': i.get('statistics', {}),
+        }
+        item['snippet']['thumbnails'] = {'medium': (snippet.get('thumbnails') or {}).get('medium') or {'url': f"https://i.ytimg.com/vi/{i['id']}/mqdefault.jpg"}}
+        rows.append((i['id'], item, (snippet.get('title'), snippet.get('description'), ' '.join(snippet.get('tags') or []), snippet.get('channelTitle'))))
+    _index_items(connection, 'video', rows)
+
+def index_videos(video_snippet_list, db_path=None):
+    '''Add videos as returned by "video_snippets()" with the parts snippet and statistics to the full text index.'''
+    connection = get_connection(db_path)
+    _index_videos(connection, video_snippet_list)
+    connection.commit()
+
+def index_channels(channel_items, db_path=None):
+    '''Add channels to the full text index. Take as input channel resources with a snippet or channel search results.'''
+    rows = []
+    for i in channel_items:
+        snippet = i.get('snippet')
+        channel_id = i['id']['channelId'] if isinstance(i['id'], dict) else i['id']
+        if not snippet:
+            continue
+        # Stored like a channel search result
+        item = {
+            'kind': 'youtube#searchResult',
+            'id': {'kind': 'youtube#channel', 'channelId': channel_id},
+            'snippet': {
+                'publishedAt': snippet.get('publishedAt'),
+                'channelId': channel_id,
+                'title': snippet.get('title'),
+                'description': snippet.get('description'),
+                'channelTitle': snippet.get('title'),
+                'thumbnails': {'medium': (snippet.get('thumbnails') or {}).get('medium') or {'url': ''}},
+            },
+        }
+        rows.append((channel_id, item, (snippet.get('title'), snippet.get('description'))))
+
+    connection = get_connection(db_path)
+    _index_items(connection, 'channel', rows)
+    connection.commit()
+
+def fts_query(text):
+    '''Return a FTS5 query, that matches all words of text, the last one as prefix, or None, if text has no words.'''
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+    return ' '.join(f'"{w}"' for w in words) + '*'
+
+def search_index(kind, text, limit=10, db_path=None):
+    '''Return up to limit search results of kind 'video' or 'channel' from the full text index, that match all words of text.\n
+    Videos match in title, description, tags and channel title, channels in title and description. The best matches come first,
+    titles weigh most, see VIDEO_INDEX_WEIGHTS. Video results carry their statistics. Return None, if SQLite has no FTS5.'''
+    connection = get_connection(db_path)
+    if not _search_index_available:
+        return None
+    query = fts_query(text)
+    if query is None:
+        return []
+
+    weights = ', '.join(map(str, VIDEO_INDEX_WEIGHTS if kind == 'video' else CHANNEL_INDEX_WEIGHTS))
+    rows = connection.execute(
+        f'''SELECT s.item FROM {kind}_index JOIN search_items s ON s.item_id = {kind}_index.rowid
+        WHERE {kind}_index MATCH ? ORDER BY bm25({kind}_index, {weights}) LIMIT ?''',
+        (query, limit)
+    )
+    return [json.loads(row[0]) for row in rows]
+
+def get_stale_video_ids(channel_id, max_age, limit=None, db_path=None):
+    '''Return a list of video ids of a channel, that were fetched more than max_age seconds ago, from new to old.
+    Return at most limit video ids, if limit is given.'''
+    connection = get_connection(db_path)
+    rows = connection.execute(
+        'SELECT video_id FROM videos WHERE channel_id = ? AND fetched_at < ? ORDER BY published_at DESC LIMIT ?',
+        (channel_id, time.time() - max_age, -1 if limit is None else limit)
+    )
+    return [row[0] for row in rows]
+
+def update_video_statistics(statistics, db_path=None):
+    '''Replace the statistics of stored videos. Take as input a dictionary of video ids and statistics.'''
+    connection = get_connection(db_path)
+    now = time.time()
+    channel_ids = set()
+    items = []
+    for video_id, video_statistics in statistics.items():
+        row = connection.execute('SELECT item, channel_id FROM videos WHERE video_id = ?', (video_id,)).fetchone()
+        if row is None:
+            continue
+        item = json.loads(row[0])
+        item['statistics'] = video_statistics
+        connection.execute('UPDATE videos SET item = ?, fetched_at = ? WHERE video_id = ?', (json.dumps(item), now, video_id))
+        channel_ids.add(row[1])
+        items.append(item)
+    _bump_versions(connection, {f'videos:{channel_id}' for channel_id in channel_ids})
+    _index_videos(connection, items)
+    _update_rollups(connection, items)
+    connection.commit()
+
+def get_videos(channel_id, db_path=None):
+    '''Return a list of the stored video snippets of a channel, ordered from new to old.'''
+    connection = get_connection(db_path)
+    rows = connection.execute('SELECT item FROM videos WHERE channel_id = ? ORDER BY published_at DESC', (channel_id,))
+    return [json.loads(row[0]) for row in rows]
+
+def set_channel_synced(channel_id, db_path=None):
+    '''Save the time of the last sync of a channel.'''
+    connection = get_connection(db_path)
+    connection.execute('INSERT OR REPLACE INTO channel_sync (channel_id, synced_at) VALUES (?, ?)', (channel_id, time.time()))
+    connection.commit()
+
+def upsert_comments(video_id, comments, db_path=None):
+    '''Insert or replace comment threads and replies of a video as returned by "get_all_comments()".\n
+    Replies, that come with a comment thread, are not stored with the thread. They need to be part of comments as well.'''
+    connection = get_connection(db_path)
+    rows = []
+    for c in comments:
+        if c['kind'] == 'youtube#commentThread':
+            c = {k: v for k, v in c.items() if k != 'replies'}
+            comment_snippet = c['snippet']['topLevelComment']['snippet']
+            rows.append((c['id'], video_id, None, comment_snippet.get('publishedAt'), comment_snippet.get('updatedAt'), c['snippet'].get('totalReplyCount'), json.dumps(c)))
+        else:
+            rows.append((c['id'], video_id, c['snippet'].get('parentId'), c['snippet'].get('publishedAt'), c['snippet'].get('updatedAt'), None, json.dumps(c)))
+
+    # Unchanged comments are not written, so the version of the video changes only with its comments
+    total_changes = connection.total_changes
+    connection.executemany(
+        '''INSERT INTO comments (comment_id, video_id, parent_id, published_at, updated_at, total_reply_count, item) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (comment_id) DO UPDATE SET video_id = excluded.video_id, parent_id = excluded.parent_id, published_at = excluded.published_at,
+        updated_at = excluded.updated_at, total_reply_count = excluded.total_reply_count, item = excluded.item
+        WHERE item != excluded.item OR video_id != excluded.video_id''',
+        rows
+    )
+    if connection.total_changes != total_changes:
+        _bump_versions(connection, {f'comments:{video_id}'})
+    connection.commit()
+
+def get_comments(video_id, db_path=None):
+    '''Return a list of the stored comment threads of a video followed by their replies.'''
+    connection = get_connection(db_path)
+    rows = connection.execute(
+        'SELECT item FROM comments WHERE video_id = ? ORDER BY parent_id IS NOT NULL, published_at',
+        (video_id,)
+    )
+    return [json.loads(row[0]) for row in rows]
+
+def get_thread_reply_counts(video_id, db_path=None):
+    '''Return a dictionary of the stored comment thread ids of a video and their total reply counts.'''
+    connection = get_connection(db_path)
+    rows = connection.execute(
+        'SELECT comment_id, total_reply_count FROM comments WHERE video_id = ? AND parent_id IS NULL',
+        (video_id,)
+    )
+    return {row[0]: row[1] for row in rows}
+
+def get_comment_watermark(video_id, db_path=None):
+    '''Return the publishing time of the newest stored comment thread of a video or None, if the video was never synced completely.'''
+    connection = get_connection(db_path)
+    row = connection.execute('SELECT watermark FROM comment_sync WHERE video_id = ?', (video_id,)).fetchone()
+    return row[0] if row else None
+
+def set_comment_watermark(video_id, db_path=None):
+    '''Save the publishing time of the newest stored comment thread of a video as its watermark.'''
+    connection = get_connection(db_path)
+    watermark = connection.execute(
+        'SELECT MAX(published_at) FROM comments WHERE video_id = ? AND parent_id IS NULL', (video_id,)
+    ).fetchone()[0]
+    connection.execute(
+        'INSERT OR REPLACE INTO comment_sync (video_id, watermark, synced_at) VALUES (?, ?, ?)',
+        (video_id, watermark, time.time())
+    )
+    connection.commit()
+
+def get_sentiment_scores(text_hashes, db_path=None):
+    '''Return a dictionary of text hashes and their stored neg, neu, pos and compound scores. Unknown hashes are left out.
+    The found scores are marked as recently used, see "sentiment_evict()".'''
+    connection = get_connection(db_path)
+    text_hashes = list(text_hashes)
+    now = time.time()
+    scores = {}
+    # SQLite limits the number of variables per statement
+    for s in range(0, len(text_hashes), 500):
+        chunk = text_hashes[s:s + 500]
+        rows = connection.execute(
+            f'SELECT text_hash, neg, neu, pos, compound FROM sentiment_scores WHERE text_hash IN ({",".join("?" * len(chunk))})',
+            chunk
+        )
+        for row in rows:
+            scores[row[0]] = row[1:]
+        # Scores are marked at most once a day, so repeated analyses do not rewrite them
+        connection.execute(
+            f'UPDATE sentiment_scores SET last_access = ? WHERE last_access < ? AND text_hash IN ({",".join("?" * len(chunk))})',
+            [now, now - 24 * 3600] + chunk
+        )
+    connection.commit()
+    return scores
+
+def set_sentiment_scores(scores, max_rows=None, db_path=None):
+    '''Store sentiment scores. Take as input a dictionary of text hashes and neg, neu, pos and compound scores.
+    Evict the least recently used scores, if more than max_rows scores are stored.'''
+    connection = get_connection(db_path)
+    now = time.time()
+    connection.executemany(
+        'INSERT OR REPLACE INTO sentiment_scores (text_hash, neg, neu, pos, compound, last_access) VALUES (?, ?, ?, ?, ?, ?)',
+        [(k, *v, now) for k, v in scores.items()]
+    )
+
+    if max_rows:
+        sentiment_evict(max_rows, connection=connection)
+
+    connection.commit()
+
+def sentiment_evict(max_rows, connection=None):
+    '''Delete the least recently used sentiment scores until at most max_rows are stored. Return the number of deleted scores.'''
+    connection = connection or get_connection()
+    excess = connection.execute('SELECT COUNT(*) FROM sentiment_scores').fetchone()[0] - max_rows
+    if excess <= 0:
+        return 0
+
+    connection.execute(
+        'DELETE FROM sentiment_scores WHERE text_hash IN (SELECT text_hash FROM sentiment_scores ORDER BY last_access LIMIT ?)', (excess,)
+    )
+    return excess
+
+def get_quota_usage(day, db_path=None):
+    '''Return the quota units used on a day in the format YYYY-MM-DD.'''
+    connection = get_connection(db_path)
+    row = connection.execute('SELECT units FROM quota_usage WHERE day = ?', (day,)).fetchone()
+    return row[0] if row else 0
+
+def reserve_quota_usage(day, units, daily_quota, db_path=None):
+    '''Add units to the quota usage of a day, unless the usage would exceed daily_quota.
+    Return True and the new usage or False and the current usage. The check and the update are one statement,
+    so processes sharing the database spend the daily quota only once.'''
+    connection = get_connection(db_path)
+    connection.execute('INSERT OR IGNORE INTO quota_usage (day, units) VALUES (?, 0)', (day,))
+    reserved = connection.execute(
+        'UPDATE quota_usage SET units = units + ? WHERE day = ? AND units + ? <= ?', (units, day, units, daily_quota)
+    ).rowcount == 1
+    used = connection.execute('SELECT units FROM quota_usage WHERE day = ?', (day,)).fetchone()[0]
+    connection.commit()
+    return reserved, used
+
+def get_word_frequencies(frequency_key, input_hash, db_path=None):
+    '''Return the stored word frequencies of a video or a channel as dictionary or None, if they were counted from other input.'''
+    connection = get_connection(db_path)
+    row = connection.execute(
+        'SELECT frequencies FROM word_frequencies WHERE frequency_key = ? AND input_hash = ?', (frequency_key, input_hash)
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+def set_word_frequencies(frequency_key, input_hash, frequencies, db_path=None):
+    '''Store the word frequencies of a video or a channel together with a hash of the texts they were counted from.'''
+    connection = get_connection(db_path)
+    connection.execute(
+        'INSERT OR REPLACE INTO word_frequencies (frequency_key, input_hash, frequencies, updated_at) VALUES (?, ?, ?, ?)',
+        (frequency_key, input_hash, json.dumps(frequencies), time.time())
+    )
+    connection.commit()
+
+def create_job(job_id, job_key, owner, rerun_of=None, db_path=None):
+    '''Insert a queued job owned by the process owner, unless a job with the same job_key is queued or running.
+    rerun_of is the id of the job, that the new job runs again.
+    Return the id of that job or job_id. The check and the insert run in one transaction, so processes sharing the database
+    do not start the same job twice.'''
+    connection = get_connection(db_path)
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        row = connection.execute(
+            "SELECT job_id FROM jobs WHERE job_key = ? AND status IN ('queued', 'running') ORDER BY created_at DESC LIMIT 1", (job_key,)
+        ).fetchone()
+        if row is None:
+            now = time.time()
+            connection.execute(
+                'INSERT INTO jobs (job_id, job_key, status, progress, owner, rerun_of, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, job_key, 'queued', 'Waiting for other analyses to finish', owner, rerun_of, now, now)
+            )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return job_id if row is None else row[0]
+
+def get_rerun_job_id(job_id, db_path=None):
+    '''Return the id of the latest job, that runs the job job_id again, or None.'''
+    connection = get_connection(db_path)
+    row = connection.execute('SELECT job_id FROM jobs WHERE rerun_of = ? ORDER BY created_at DESC LIMIT 1', (job_id,)).fetchone()
+    return row[0] if row else None
+
+def get_active_jobs(job_key=None, db_path=None):
+    '''Return a list of (job_id, owner) of the queued and running jobs, optionally only of the jobs with job_key.'''
+    connection = get_connection(db_path)
+    query = "SELECT job_id, owner FROM jobs WHERE status IN ('queued', 'running')"
+    if job_key is not None:
+        return connection.execute(query + ' AND job_key = ?', (job_key,)).fetchall()
+    return connection.execute(query).fetchall()
+
+def update_job(job_id, db_path=None, **fields):
+    '''Update the columns status, progress, result and/or error of a job.'''
+    connection = get_connection(db_path)
+    columns = [c for c in ('status', 'progress', 'result', 'error') if c in fields]
+    connection.execute(
+        f'UPDATE jobs SET {", ".join(c + " = ?" for c in columns)}, updated_at = ? WHERE job_id = ?',
+        [fields[c] for c in columns] + [time.time(), job_id]
+    )
+    connection.commit()
+
+def get_job(job_id, db_path=None):
+    '''Return a job as a dictionary or None, if there is no such job.'''
+    connection = get_connection(db_path)
+    row = connection.execute(
+        'SELECT job_id, job_key, status, progress, result, error, owner, rerun_of, created_at, updated_at FROM jobs WHERE job_id = ?', (job_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return dict(zip(['job_id', 'job_key', 'status', 'progress', 'result', 'error', 'owner', 'rerun_of', 'created_at', 'updated_at'], row))
@@ -0,0 +1,171 @@
+import os
+import re
+import time
+import math
+import cProfile
+import threading
+import functools
+import logging
+import sys
+from contextlib import contextmanager
+
+logger = logging.getLogger('tracing_logger')
+handler = logging.StreamHandler(sys.stderr)
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+# Upper bounds of the histogram buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, math.inf)
+# Spans, that take longer than SLOW_SPAN seconds, are logged
+SLOW_SPAN = float(os.getenv('TRACING_SLOW_SPAN', 1))
+# Set PROFILE_DIR to write a cProfile dump of every analysis to this folder, see "profile()"
+PROFILE_DIR = os.getenv('PROFILE_DIR')
+
+# Help texts of the metrics for the Prometheus exposition format
+HELP = {
+    'span_duration_seconds': 'Duration of the stages of the analyses and the functions of the API client',
+    'youtube_api_requests_total': 'Requests sent to the YouTube Data API',
+    'youtube_api_cache_hits_total': 'API requests answered from the cache',
+    'youtube_api_pages_total': 'Pages of list requests',
+    'youtube_api_items_total': 'Items in the responses of the API',
+    'youtube_api_quota_units_total': 'Quota units spent',
+    'youtube_api_response_bytes_total': 'Bytes of the responses of the API after decompression',
+    'youtube_api_parse_seconds_total': 'Seconds spent parsing the responses of the API',
+    'local_search_total': 'Searches answered from the local search index (hit) or sent to the API (miss)',
+    'dataset_loads_total': 'Dataframes read from their Parquet dataset or built from the local store',
+    'youtube_api_quota_saved_units': 'Quota units saved by the response cache since the start',
+    'youtube_quota_used_today': 'Quota units used today',
+    'youtube_quota_remaining_today': 'Quota units left today',
+}
+
+_lock = threading.Lock()
+_types = {}
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def _register(name, metric_type):
+    if _types.setdefault(name, metric_type) != metric_type:
+        raise ValueError(f'Metric {name} is a {_types[name]}, not a {metric_type}')
+
+def count(name, value=1, **labels):
+    '''Add value to a counter.'''
+    with _lock:
+        _register(name, 'counter')
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+def get_count(name, **labels):
+    '''Return the value of a counter.'''
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+def set_gauge(name, value, **labels):
+    '''Set a gauge to value.'''
+    with _lock:
+        _register(name, 'gauge')
+        _gauges[_key(name, labels)] = value
+
+def observe(name, value, **labels):
+    '''Add an observation to a histogram.'''
+    with _lock:
+        _register(name, 'histogram')
+        key = _key(name, labels)
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram['buckets'][i] += 1
+                break
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+@contextmanager
+def span(name, **labels):
+    '''Measure the duration of a block and add it to the histogram span_duration_seconds. Failed blocks are labelled with error="true".'''
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        if error:
+            labels['error'] = 'true'
+        observe('span_duration_seconds', duration, span=name, **labels)
+        if duration > SLOW_SPAN:
+            logger.info(f'{name} took {duration:.2f}s')
+
+def traced(func):
+    '''Decorate a function to record a span with the name of the function for every call.'''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def profile(name):
+    '''Profile a block with cProfile and write the statistics to PROFILE_DIR/<name>-<time>.prof, if PROFILE_DIR is set.
+    Only the calling thread is profiled. Open the dump with "python -m pstats" or snakeviz.'''
+    if not PROFILE_DIR:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f'{re.sub(r"[^A-Za-z0-9_.-]+", "_", name)[:100]}-{time.strftime("%Y%m%d-%H%M%S")}.prof')
+        profiler.dump_stats(path)
+        logger.info(f'Profile of {name} written to {path}')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels) + '}'
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_metrics():
+    '''Return all metrics in the Prometheus text exposition format.'''
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {k: {'buckets': list(v['buckets']), 'sum': v['sum'], 'count': v['count']} for k, v in _histograms.items()}
+        types = dict(_types)
+
+    lines = []
+    for name in sorted(types):
+        if name in HELP:
+            lines.append(f'# HELP {name} {HELP[name]}')
+        lines.append(f'# TYPE {name} {types[name]}')
+        if types[name] == 'histogram':
+            for (n, labels), histogram in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip(BUCKETS, histogram['buckets']):
+                    cumulative += bucket
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", _format_value(bound)),))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(histogram["sum"])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {histogram["count"]}')
+        else:
+            values = counters if types[name] == 'counter' else gauges
+            for (n, labels), value in sorted(values.items()):
+                if n == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
@@ -1,10 +1,16 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from wordcloud import WordCloud, STOPWORDS, ImageColorGenerator
-from src import sql
-import numpy as np
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+import os
+import io
+import base64
+import hashlib
+import importlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# matplotlib, seaborn, wordcloud and pandas take about two seconds to import. They are imported by the functions, that use them,
+# so pages without plots do not load them. "preload()" imports them up front.
+HEAVY_MODULES = ['pandas', 'matplotlib.figure', 'matplotlib.backends.backend_agg', 'seaborn', 'wordcloud']
 
 # Plot configurations
 FIG_W = 10 # Width of plots
@@ -12,25 +18,242 @@ FIG_H = 5 # Height of plots
 ROT = 0 # Rotation of x-axis labels
 TS = 15 # Title size
 
-def barplot_channel_video_count(df_all, channel_ids):
-    '''Create a barplot and save the image to a folder. Return image name. Take a dataframe with videodata  as input. Input channel_ids to render image name.'''
+# Rendered plots are cached by plot type and a fingerprint of the input data and plot configuration
+IMAGE_DIR = 'static/images'
+PLOT_CACHE_MAX_BYTES = int(os.getenv('PLOT_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+
+# Where rendered plots go: 'file' saves them to IMAGE_DIR, 'memory' keeps them in this process and serves them under IMAGE_URL,
+# 'data-uri' embeds them in the page. PLOT_FORMAT is 'png' or 'svg'.
+PLOT_OUTPUT = os.getenv('PLOT_OUTPUT', 'file')
+PLOT_FORMAT = os.getenv('PLOT_FORMAT', 'png')
+IMAGE_URL = '/plots/{key}'
+MEMORY_CACHE_MAX_BYTES = int(os.getenv('PLOT_MEMORY_MAX_BYTES', 64 * 1024 * 1024))
+MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# Number of processes, that render the plots of a page
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', os.cpu_count() or 1))
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+# In memory images by key, least recently used first
+_images = OrderedDict()
+_images_bytes = 0
+_images_lock = threading.Lock()
+# Set in render processes: images, that are sent back to the parent process, and keys, that the parent process has already
+_collected = None
+_known_keys = frozenset()
+
+def preload():
+    '''Import the plotting libraries and load the matplotlib font cache. Called before the web app forks its workers, so they share the loaded modules.'''
+    for module in HEAVY_MODULES:
+        importlib.import_module(module)
+    fig, ax = new_figure()
+    ax.set_title('preload')
+    fig.savefig(io.BytesIO(), format=PLOT_FORMAT)
+
+def fingerprint(*data):
+    '''Return a hash of the input data of a plot and the plot configuration. Take as input dataframes, series, strings and other objects with a stable repr().'''
+    import pandas as pd
+    h = hashlib.sha1(repr((FIG_W, FIG_H, ROT, TS)).encode())
+    for d in data:
+        if isinstance(d, (pd.DataFrame, pd.Series)):
+            h.update(repr(list(d.columns) if isinstance(d, pd.DataFrame) else d.name).encode())
+            h.update(pd.util.hash_pandas_object(d, index=False).values.tobytes())
+        elif isinstance(d, str):
+            h.update(d.encode('utf-8', 'surrogatepass'))
+        else:
+            h.update(repr(d).encode())
+        # Separate the inputs
+        h.update(b'\0')
+    return h.hexdigest()[:16]
+
+def image_key(image_name):
+    '''Return the key of an image in the memory store. Take as input an image name returned by cached_image().'''
+    return os.path.basename(image_name)
+
+def image_ref(key, data):
+    '''Return the reference to an in memory image, that is used as src of an img tag.'''
+    if PLOT_OUTPUT == 'data-uri':
+        return f'data:{MIMETYPES[PLOT_FORMAT]};base64,' + base64.b64encode(data).decode('ascii')
+    return IMAGE_URL.format(key=key)
+
+def store_image(key, data):
+    '''Keep image bytes in the memory store and drop the least recently used images above MEMORY_CACHE_MAX_BYTES.'''
+    global _images_bytes
+    if _collected is not None:
+        _collected.append((key, data))
+        return
+    with _images_lock:
+        if key in _images:
+            _images_bytes -= len(_images.pop(key))
+        _images[key] = data
+        _images_bytes += len(data)
+        while _images_bytes > MEMORY_CACHE_MAX_BYTES and len(_images) > 1:
+            _images_bytes -= len(_images.popitem(last=False)[1])
+
+def get_image(key):
+    '''Return the bytes and the mimetype of an in memory image or None, if the image is not in the store.'''
+    with _images_lock:
+        data = _images.get(key)
+        if data is None:
+            return None
+        _images.move_to_end(key)
+    return data, MIMETYPES[key.rsplit('.', 1)[-1]]
+
+def image_exists(image_name):
+    '''Return True, if an image returned by the viz functions can still be served. Saved images may have been evicted
+    and in memory images are lost, when the process stops or the memory store is full.'''
+    if image_name.startswith('data:'):
+        return True
+    if image_name.startswith(IMAGE_URL.format(key='')):
+        with _images_lock:
+            return image_name[len(IMAGE_URL.format(key='')):] in _images
+    return os.path.exists(image_name)
+
+def cached_image(name, *data):
+    '''Return the image name for a plot and whether a valid image exists already. Take as input a plot name and the input data of the plot.
+    If the image exists, the reference for the configured output is returned instead of the image name.'''
+    image_name = f'{IMAGE_DIR}/{name}_{fingerprint(*data)}.{PLOT_FORMAT}'
+    if PLOT_OUTPUT == 'file':
+        if os.path.exists(image_name):
+            # Mark the image as recently used
+            os.utime(image_name)
+            return image_name, True
+        return image_name, False
+
+    key = image_key(image_name)
+    if PLOT_OUTPUT == 'memory' and key in _known_keys:
+        return image_ref(key, None), True
+    with _images_lock:
+        if key in _images:
+            _images.move_to_end(key)
+            return image_ref(key, _images[key]), True
+    return image_name, False
+
+def evict_images(max_bytes=None):
+    '''Delete the least recently used images, until the images folder is smaller than max_bytes. Return the number of deleted images.'''
+    max_bytes = PLOT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    images = []
+    for entry in os.scandir(IMAGE_DIR):
+        if entry.name.endswith(('.png', '.svg')):
+            stat = entry.stat()
+            images.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(i[1] for i in images)
+    deleted = 0
+    for mtime, size, path in sorted(images):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        deleted += 1
+    return deleted
+
+def new_figure():
+    '''Return a new figure and its axes. The figure is not registered with pyplot, so it is freed as soon as it is not used anymore
+    and it can be drawn in several threads at the same time.'''
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(FIG_W, FIG_H))
+    ax = fig.subplots()
+    return fig, ax
+
+def save_image(image_name, fig):
+    '''Save a figure, release its memory and return the reference to the image.
+    In file mode the image is saved to image_name and the images folder is kept below its size limit,
+    otherwise the image is rendered into memory.'''
+    if PLOT_OUTPUT == 'file':
+        # Write to a temporary file first, so concurrent requests for the same plot never see a half written image
+        tmp_name = f'{image_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+        fig.savefig(tmp_name, dpi=100, format=PLOT_FORMAT)
+        fig.clear()
+        os.replace(tmp_name, image_name)
+        evict_images()
+        return image_name
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, dpi=100, format=PLOT_FORMAT)
+    fig.clear()
+    key = image_key(image_name)
+    data = buffer.getvalue()
+    store_image(key, data)
+    return image_ref(key, data)
+
+def get_render_pool():
+    '''Return the process pool for rendering plots. The pool is created once and reused.
+    Worker processes are started by a fork server, because the web app forks from a process with running threads.
+    The fork server imports the plotting libraries once and the workers share them.'''
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            if context.get_start_method() == 'forkserver':
+                context.set_forkserver_preload(HEAVY_MODULES + [__name__])
+            _render_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=context)
+        return _render_pool
+
+def _render(task):
+    func, args, kwargs = task
+    return func(*args, **kwargs)
+
+def _render_remote(task, known_keys):
+    '''Render a plot in a worker process. Return the image reference and the in memory images, that the parent process has to store.'''
+    global _collected, _known_keys
+    _collected, _known_keys = [], known_keys
+    try:
+        return _render(task), _collected
+    finally:
+        _collected, _known_keys = None, frozenset()
+
+def render_plots(tasks, workers=None):
+    '''Render several plots at the same time and return their image names in the order of tasks.\n
+    Take as input a list of tuples of a viz function, a tuple of arguments and a dictionary of keyword arguments.
+    With workers=1 or a single task the plots are rendered in this process.'''
+    workers = RENDER_WORKERS if workers is None else workers
+    if workers <= 1 or len(tasks) <= 1:
+        return [_render(task) for task in tasks]
+
+    with _images_lock:
+        known_keys = frozenset(_images) if PLOT_OUTPUT == 'memory' else frozenset()
+    image_names = []
+    for image_name, images in get_render_pool().map(_render_remote, tasks, [known_keys] * len(tasks)):
+        for key, data in images:
+            store_image(key, data)
+        image_names.append(image_name)
+    return image_names
+
+def barplot_channel_video_count(channel_counts, channel_ids):
+    '''Create a barplot and save the image to a folder. Return image name. Take as input a dataframe with the columns channel_title and video_count
+    like "youtube_data_module.get_channel_rollups()". Input channel_ids to render image name.'''
 
     channel_ids_string = '_'.join(channel_ids)
-    image_name = f'static/images/{channel_ids_string}_barplot_channel_video_count.png'
-
-    plt.figure(figsize=(FIG_W, FIG_H))
-    df_all.groupby('channel_title').size().sort_values(ascending=False).plot.bar()
-    plt.xticks(rotation=ROT)
-    plt.xlabel("Channel Name")
-    plt.ylabel("Video Count")
-    plt.title('Video Counts per Channel', fontdict = {'fontsize' : TS})
-    plt.savefig(image_name, dpi=100)
+    image_name, cached = cached_image(f'{channel_ids_string}_barplot_channel_video_count', channel_counts[['channel_title', 'video_count']])
+    if cached:
+        return image_name
+
+    fig, ax = new_figure()
+    channel_counts.groupby('channel_title')['video_count'].sum().sort_values(ascending=False).plot.bar(ax=ax)
+    ax.tick_params(axis='x', labelrotation=ROT)
+    ax.set_xlabel("Channel Name")
+    ax.set_ylabel("Video Count")
+    ax.set_title('Video Counts per Channel', fontdict = {'fontsize' : TS})
+    image_name = save_image(image_name, fig)
 
     return image_name
 
 def histogram_video_duration_count(df_all, channel_ids):
     '''Create a histogram and save the image to a folder. Return image name. Take a dataframe with videodata  as input. Input channel_ids to render image name.'''
 
+    # Create image name
+    channel_ids_string = '_'.join(channel_ids)
+    image_name, cached = cached_image(f'{channel_ids_string}_histogram_video_duration_count', df_all[['channel_title', 'duration_sec']])
+    if cached:
+        return image_name
+
     df_all['duration_min'] = df_all['duration_sec'].astype('int') / 60
 
     # Calculate outlier and clean them
@@ -45,78 +268,146 @@ def histogram_video_duration_count(df_all, channel_ids):
         video_durations = df_all[df_all['channel_title'] == channel]['duration_min'].to_numpy()
         data.append(video_durations)
 
-    # Create image name
-    channel_ids_string = '_'.join(channel_ids)
-    image_name = f'static/images/{channel_ids_string}_histogram_video_duration_count.png'
-
-    plt.figure(figsize=(FIG_W, FIG_H))
-    plt.hist(data, bins=bin_size, alpha=0.5)
-    plt.legend(labels)
-    plt.xlabel('Duration of videos in minutes')
-    plt.ylabel('Videos count')
-    plt.title('Video counts of durations', fontdict = {'fontsize' : TS})
-    plt.savefig(image_name, dpi=100)
+    fig, ax = new_figure()
+    ax.hist(data, bins=bin_size, alpha=0.5)
+    ax.legend(labels)
+    ax.set_xlabel('Duration of videos in minutes')
+    ax.set_ylabel('Videos count')
+    ax.set_title('Video counts of durations', fontdict = {'fontsize' : TS})
+    image_name = save_image(image_name, fig)
 
     return image_name
 
-def histogram_video_duration_count_single(df_all, channel_id, channel_title=None):
-    '''Create a histogram and save the image to a folder. Return image name. Take a dataframe with videodata  as input. Input channel_ids to render image name.'''
+def quantile_from_counts(values, counts, q):
+    '''Return the q quantile of values, that occur counts times, interpolated linearly like Series.quantile(). values must be sorted.'''
+    import numpy as np
+    position = q * (counts.sum() - 1)
+    lower, upper = int(np.floor(position)), int(np.ceil(position))
+    # Index of the value at every position of the sorted data
+    cumsum = np.cumsum(counts)
+    lower_value, upper_value = values[np.searchsorted(cumsum, [lower, upper], side='right')]
+    return lower_value + (upper_value - lower_value) * (position - lower)
 
-    df_all = df_all[df_all['channel_id'] == channel_id]
+def histogram_video_duration_count_single(duration_counts, channel_id, channel_title=None):
+    '''Create a histogram and save the image to a folder. Return image name. Take as input a series of video counts per duration in seconds
+    like "youtube_data_module.get_duration_counts()". Input channel_id to render image name.'''
+
+    image_name, cached = cached_image(f'{channel_id}_histogram_video_duration_count', duration_counts, channel_title)
+    if cached:
+        return image_name
+
+    duration_counts = duration_counts.sort_index()
+    durations = duration_counts.index.to_numpy()
+    counts = duration_counts.to_numpy()
 
     # Calculate outlier and clean them
-    outlier = (df_all['duration_sec'].describe()['75%'] - df_all['duration_sec'].describe()['25%']) * 1.5 + df_all['duration_sec'].describe()['75%']
-    df_all = df_all[df_all['duration_sec'] <= outlier]
+    q1, q3 = (quantile_from_counts(durations, counts, q) for q in (0.25, 0.75))
+    outlier = (q3 - q1) * 1.5 + q3
+    keep = durations <= outlier
 
-    df_all['duration_min'] = df_all['duration_sec'] / 60
-    df_all['duration_min'] = df_all['duration_min'].astype('int32')
+    duration_min = (durations[keep] / 60).astype('int32')
 
-    bin_size = df_all['duration_min'].max()
+    bin_size = duration_min.max()
     if bin_size < 1:
         bin_size = 1
 
-    image_name = f'static/images/{channel_id}_histogram_video_duration_count.png'
-
-    plt.figure(figsize=(FIG_W, FIG_H))
-    plt.hist(df_all['duration_min'], bins=bin_size, alpha=0.5, edgecolor='black', linewidth=1)
-    plt.legend(df_all['channel_title'].unique())
-    plt.title(f'Video Counts of Durations for "{channel_title}"', fontdict = {'fontsize' : TS})
-    plt.xlabel('Video Duration in Minutes')
-    plt.ylabel('Video Count')
-    plt.xlim(0,bin_size)
-    plt.savefig(image_name, dpi=100)
+    fig, ax = new_figure()
+    # Each duration is counted as often as there are videos with it
+    ax.hist(duration_min, bins=bin_size, weights=counts[keep], alpha=0.5, edgecolor='black', linewidth=1)
+    ax.legend([channel_title])
+    ax.set_title(f'Video Counts of Durations for "{channel_title}"', fontdict = {'fontsize' : TS})
+    ax.set_xlabel('Video Duration in Minutes')
+    ax.set_ylabel('Video Count')
+    ax.set_xlim(0,bin_size)
+    image_name = save_image(image_name, fig)
 
     return image_name
 
-def barplot_links(video_df, channel_ids):
-    '''Create a barplot with counts on how many video descriptions hae clickable links. Save the plot as image.'''
-
-    # Check if there is 'http' in description and insert result
-    video_df['Links in decription'] = video_df['description'].str.contains('http').apply(lambda x: 'Clickable Link' if x else 'No clickable Link')
+def barplot_links(channel_counts, channel_ids):
+    '''Create a barplot with counts on how many video descriptions hae clickable links. Save the plot as image.
+    Take as input a dataframe with the columns channel_title, video_count and link_count like "youtube_data_module.get_channel_rollups()".'''
 
     channel_ids_string = '_'.join(channel_ids)
-    image_name = f'static/images/{channel_ids_string}_barplot_links.png'
-
-    video_df = video_df.groupby(['channel_title', 'Links in decription'])[['video_id']].count().reset_index()
-    sns.set(style="whitegrid")
-    g = sns.catplot(x="channel_title",
-                    y="video_id",
-                    hue="Links in decription",
-                    data=video_df,
-                    height=6,
-                    kind="bar",
-                    palette="muted"
+    image_name, cached = cached_image(f'{channel_ids_string}_barplot_links', channel_counts[['channel_title', 'video_count', 'link_count']])
+    if cached:
+        return image_name
+
+    import pandas as pd
+    import seaborn as sns
+    # One row per channel and link category with the video count in the column video_id, without empty categories
+    counts = channel_counts.groupby('channel_title')[['video_count', 'link_count']].sum()
+    video_df = pd.concat([
+        pd.DataFrame({'Links in decription': 'Clickable Link', 'video_id': counts['link_count']}),
+        pd.DataFrame({'Links in decription': 'No clickable Link', 'video_id': counts['video_count'] - counts['link_count']}),
+    ]).reset_index()
+    video_df = video_df[video_df['video_id'] > 0].sort_values(['channel_title', 'Links in decription']).reset_index(drop=True)
+    fig, ax = new_figure()
+    sns.barplot(x="channel_title",
+                y="video_id",
+                hue="Links in decription",
+                data=video_df,
+                palette="muted",
+                ax=ax
     )
-    g.despine(left=True)
-    g.set_xlabels("Channel Name")
-    g.set_ylabels("Video Count")
-    # g.set_title('Links in Video Descriptions', fontdict = {'fontsize' : TS})
-    plt.savefig(image_name, dpi=100)
+    # White grid style without the left spine, set on the axes instead of the global seaborn style
+    ax.set_axisbelow(True)
+    ax.yaxis.grid(True, color='#eaeaf2')
+    for side in ('left', 'top', 'right'):
+        ax.spines[side].set_visible(False)
+    ax.set_xlabel("Channel Name")
+    ax.set_ylabel("Video Count")
+    # ax.set_title('Links in Video Descriptions', fontdict = {'fontsize' : TS})
+    image_name = save_image(image_name, fig)
 
     return image_name
 
-def create_wordcloud(text, stopwords=STOPWORDS,video_id=None, channel_title=None):
-    '''Return a word cloud image name and save the image. Take as input a string of text and a video id or a channel name for creating the title.'''
+def wordcloud_frequencies(frequencies, stopwords=None):
+    '''Return word frequencies prepared like WordCloud prepares the words of a text: without "'s" endings, numbers and stopwords,
+    with the most common case of each word and plurals merged into their singulars. Take as input a dictionary of words and counts.
+    stopwords=None uses the stopwords of WordCloud.'''
+    from wordcloud import STOPWORDS
+    stopwords = set(s.lower() for s in (STOPWORDS if stopwords is None else stopwords))
+
+    # Counts of the cases of each word
+    cases = {}
+    for word, count in frequencies.items():
+        if word.lower().endswith("'s"):
+            word = word[:-2]
+        if not word or word.isdigit() or word.lower() in stopwords:
+            continue
+        case_counts = cases.setdefault(word.lower(), {})
+        case_counts[word] = case_counts.get(word, 0) + count
+
+    # Merge plurals into the singular like wordcloud.tokenization.process_tokens()
+    for key in list(cases):
+        if key.endswith('s') and not key.endswith('ss') and key[:-1] in cases:
+            singular_counts = cases[key[:-1]]
+            for word, count in cases.pop(key).items():
+                singular_counts[word[:-1]] = singular_counts.get(word[:-1], 0) + count
+
+    return {max(case_counts.items(), key=lambda c: c[1])[0]: sum(case_counts.values()) for case_counts in cases.values()}
+
+def create_wordcloud(text, stopwords=None,video_id=None, channel_title=None):
+    '''Return a word cloud image name and save the image. Take as input a string of text or a dictionary of word frequencies
+    and a video id or a channel name for creating the title. stopwords=None uses the stopwords of WordCloud.'''
+    from wordcloud import WordCloud
+
+    if channel_title:
+        title = channel_title
+    else:
+        title = video_id
+
+    if isinstance(text, dict):
+        text = wordcloud_frequencies(text, stopwords)
+        stopwords = None
+        data = sorted(text.items())
+    else:
+        data = text
+
+    # Create filename
+    image_name, cached = cached_image(f'{video_id or "text"}_wordcloud', data, sorted(stopwords) if stopwords else stopwords, title)
+    if cached:
+        return image_name
 
     wordcloud = WordCloud(
         max_font_size=50,
@@ -131,25 +422,17 @@ def create_wordcloud(text, stopwords=STOPWORDS,video_id=None, channel_title=None
         scale=2.0,
         # Disable word pairs
         collocations=False
-    ).generate(text)
-
-    # Create filename
-    if video_id == None:
-        temp_id = sql.set_temp_id()
-        image_name = f'static/images/{temp_id}_wordcloud.png'
-    else:
-        image_name = f'static/images/{video_id}_wordcloud.png'
-
-    if channel_title:
-        title = channel_title
+    )
+    if isinstance(text, dict):
+        wordcloud.generate_from_frequencies(text)
     else:
-        title = video_id
+        wordcloud.generate(text)
 
-    plt.figure(figsize = (FIG_W, FIG_H))
-    plt.title(f'Wordcloud for "{title}"', fontdict = {'fontsize' : TS})
-    plt.imshow(wordcloud, interpolation="bilinear")
-    plt.axis("off")
-    plt.savefig(image_name, dpi=100)
+    fig, ax = new_figure()
+    ax.set_title(f'Wordcloud for "{title}"', fontdict = {'fontsize' : TS})
+    ax.imshow(wordcloud, interpolation="bilinear")
+    ax.axis("off")
+    image_name = save_image(image_name, fig)
 
     return image_name
 
@@ -173,53 +456,60 @@ def split_sentiment_pos_neg(comment_sentiment):
 def lineplot_cumsum_video_comments(comment_sentiment, video_id):
     '''Create and save a lineplot for the cumsum of video comments over time. Return image name.'''
 
-    image_name = f'static/images/{video_id}_lineplot_cumsum_video_comments.png'
+    image_name, cached = cached_image(f'{video_id}_lineplot_cumsum_video_comments', comment_sentiment[['published_at', 'cumsum']])
+    if cached:
+        return image_name
 
-    plt.figure(figsize=(FIG_W, FIG_H))
-    plt.plot(comment_sentiment['published_at'], comment_sentiment['cumsum'])
-    plt.xticks(rotation=ROT)
-    plt.title('Cumulative sum of comments over time', fontdict = {'fontsize' : TS})
-    plt.xlabel('Date')
-    plt.ylabel('Sum of comments')
-    plt.grid(b=True)
-    plt.savefig(image_name, dpi=100)
+    fig, ax = new_figure()
+    ax.plot(comment_sentiment['published_at'], comment_sentiment['cumsum'])
+    ax.tick_params(axis='x', labelrotation=ROT)
+    ax.set_title('Cumulative sum of comments over time', fontdict = {'fontsize' : TS})
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Sum of comments')
+    ax.grid(True)
+    image_name = save_image(image_name, fig)
 
     return image_name
 
 def lineplot_cumsum_video_comments_pos_neg(comment_sentiment, pos_sent, neg_sent, video_id):
     '''Create and save a lineplot for the cumsum of positive and negative sentiments of video comments over time seperately. Return image name.'''
 
-    image_name = f'static/images/{video_id}_lineplot_cumsum_video_comments_pos_neg.png'
-
-    plt.figure(figsize=(FIG_W, FIG_H))
-    plt.plot('published_at', 'cumsum', data=pos_sent, marker='', color='green', linewidth=1, linestyle='-', label="Positive Sentiment")
-    plt.plot('published_at', 'cumsum', data=neg_sent, marker='', color='red', linewidth=1, linestyle='-', label="Negative Sentiment")
-    plt.legend()
-    plt.title('Cumulative sum of comments over time', fontdict = {'fontsize' : TS})
-    plt.xlabel('Date')
-    plt.ylabel('Sum of comments')
-    plt.xticks(rotation=ROT)
-    plt.grid(b=True)
-    plt.savefig(image_name, dpi=100)
+    image_name, cached = cached_image(f'{video_id}_lineplot_cumsum_video_comments_pos_neg', pos_sent[['published_at', 'cumsum']], neg_sent[['published_at', 'cumsum']])
+    if cached:
+        return image_name
+
+    fig, ax = new_figure()
+    ax.plot('published_at', 'cumsum', data=pos_sent, marker='', color='green', linewidth=1, linestyle='-', label="Positive Sentiment")
+    ax.plot('published_at', 'cumsum', data=neg_sent, marker='', color='red', linewidth=1, linestyle='-', label="Negative Sentiment")
+    ax.legend()
+    ax.set_title('Cumulative sum of comments over time', fontdict = {'fontsize' : TS})
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Sum of comments')
+    ax.tick_params(axis='x', labelrotation=ROT)
+    ax.grid(True)
+    image_name = save_image(image_name, fig)
 
     return image_name
 
 def scatterplot_sentiment_likecount(comment_sentiment, pos_sent, neg_sent, video_id):
     '''Create a scatterplot with like counts vs.sentiment. Save image.Return image name. Take as input the output of "split_sentiment_pos_neg()" and a video id.'''
 
-    image_name = f'static/images/{video_id}_scatterplot_sentiment_likecount.png'
-
-    fig = plt.figure(figsize=(FIG_W, FIG_H))
-    plt.scatter(comment_sentiment['compound'], np.log1p(comment_sentiment['like_count']), label='Neutral Sentiment')
-    plt.scatter(pos_sent['compound'], np.log1p(pos_sent['like_count']), color='green', label='Positive Sentiment')
-    plt.scatter(neg_sent['compound'], np.log1p(neg_sent['like_count']), color='red', label='Negative Sentiment')
-    plt.xticks(rotation=ROT)
-    plt.title('Sentiment / Like count', fontdict = {'fontsize' : TS})
-    plt.xlabel('Sentiment')
-    plt.ylabel('Logarithm of Like count')
-    plt.legend()
-    plt.grid(b=True)
-    fig.savefig(image_name, dpi=100)
+    image_name, cached = cached_image(f'{video_id}_scatterplot_sentiment_likecount', *[df[['compound', 'like_count']] for df in (comment_sentiment, pos_sent, neg_sent)])
+    if cached:
+        return image_name
+
+    import numpy as np
+    fig, ax = new_figure()
+    ax.scatter(comment_sentiment['compound'], np.log1p(comment_sentiment['like_count']), label='Neutral Sentiment')
+    ax.scatter(pos_sent['compound'], np.log1p(pos_sent['like_count']), color='green', label='Positive Sentiment')
+    ax.scatter(neg_sent['compound'], np.log1p(neg_sent['like_count']), color='red', label='Negative Sentiment')
+    ax.tick_params(axis='x', labelrotation=ROT)
+    ax.set_title('Sentiment / Like count', fontdict = {'fontsize' : TS})
+    ax.set_xlabel('Sentiment')
+    ax.set_ylabel('Logarithm of Like count')
+    ax.legend()
+    ax.grid(True)
+    image_name = save_image(image_name, fig)
 
     return image_name
 
@@ -2,23 +2,372 @@
 # -*- coding: utf-8 -*-
 
 import os
-import googleapiclient.discovery
-import google_auth_oauthlib.flow
-import googleapiclient.errors
 import csv
-import pandas as pd
 import re
 import datetime
 import pytz
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 import logging
 import sys
+import json
+import threading
+import queue
+import time
+import hashlib
+import importlib
+from collections import Counter
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from src import sql
+from src import sentiment
+from src import quota
+from src import tracing
+from src import dataset
 
 logger = logging.getLogger('youtube_data_module_logger')
 handler = logging.StreamHandler(sys.stderr)
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
+# pandas and the API client library take about a second to import. They are imported by the functions, that use them,
+# so pages, that need neither, do not load them. "preload()" imports them up front.
+
+# Response cache: time to live in seconds per endpoint
+CACHE_ENABLED = os.getenv('YOUTUBE_CACHE', '1') != '0'
+CACHE_MAX_BYTES = int(os.getenv('YOUTUBE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+CACHE_TTL = {
+    'search': 6 * 3600,
+    'channels': 24 * 3600,
+    'playlistItems': 3600,
+    'videos': 6 * 3600,
+    'videoCategories': 7 * 24 * 3600,
+    'commentThreads': 1800,
+    'comments': 1800
+}
+
+# Quota costs per request and per requested part
+QUOTA_COSTS = {
+    'search': {'base': 100},
+    'channels': {'base': 1, 'snippet': 2, 'contentDetails': 2, 'statistics': 2, 'brandingSettings': 2, 'status': 2, 'topicDetails': 2},
+    'playlistItems': {'base': 1, 'snippet': 2, 'contentDetails': 2, 'status': 2},
+    'videos': {'base': 1, 'snippet': 2, 'statistics': 2, 'contentDetails': 2, 'status': 2, 'topicDetails': 2},
+    'videoCategories': {'base': 1, 'snippet': 2},
+    'commentThreads': {'base': 1, 'snippet': 2, 'replies': 2},
+    'comments': {'base': 1, 'snippet': 1}
+}
+
+# Partial responses: the fields of the items, that the app reads, per endpoint. See "fields_mask()".
+PARTIAL_RESPONSES = os.getenv('YOUTUBE_PARTIAL_RESPONSES', '1') != '0'
+ITEM_FIELDS = {
+    # Search result pages of the templates
+    'search': ['snippet/publishedAt', 'snippet/channelId', 'snippet/title', 'snippet/description', 'snippet/channelTitle', 'snippet/thumbnails/medium/url'],
+    # "videoIdList()"
+    'playlistItems': ['snippet/resourceId/videoId', 'snippet/publishedAt'],
+    # "snippets_to_dict()", the video store, the search index and the statistics of the search results
+    'videos': ['snippet/publishedAt', 'snippet/channelId', 'snippet/title', 'snippet/description', 'snippet/channelTitle', 'snippet/tags',
+               'snippet/categoryId', 'snippet/liveBroadcastContent', 'snippet/thumbnails/default/url', 'snippet/thumbnails/medium/url',
+               'contentDetails/duration',
+               'contentDetails/dimension', 'contentDetails/definition', 'contentDetails/caption', 'contentDetails/licensedContent',
+               'contentDetails/projection', 'status/privacyStatus', 'status/license', 'status/embeddable', 'status/publicStatsViewable',
+               'statistics'],
+    # "comments_to_df()", "extract_comments()", the comment store and the reply handling of "iter_all_comments()".
+    # Replies, that come with a thread, are read like comments.
+    'commentThreads': ['snippet/totalReplyCount', 'snippet/topLevelComment/kind', 'snippet/topLevelComment/id',
+                       'snippet/topLevelComment/snippet/textOriginal', 'snippet/topLevelComment/snippet/likeCount',
+                       'snippet/topLevelComment/snippet/publishedAt', 'snippet/topLevelComment/snippet/updatedAt',
+                       'replies/comments/kind', 'replies/comments/id', 'replies/comments/snippet/parentId',
+                       'replies/comments/snippet/textOriginal', 'replies/comments/snippet/likeCount',
+                       'replies/comments/snippet/publishedAt', 'replies/comments/snippet/updatedAt'],
+    'comments': ['snippet/parentId', 'snippet/textOriginal', 'snippet/likeCount', 'snippet/publishedAt', 'snippet/updatedAt'],
+}
+
+# Parts of the videos of the channel comparison
+VIDEO_PARTS = 'snippet,statistics,contentDetails,player,status'
+
+# Search pages answer from the local search index, if it has at least this many results, see "search_videos()"
+LOCAL_SEARCH_MIN_RESULTS = int(os.getenv('YOUTUBE_LOCAL_SEARCH_MIN_RESULTS', 1))
+
+# Incremental channel sync: refresh statistics of stored videos older than this many seconds
+STALE_AFTER = int(os.getenv('YOUTUBE_STALE_AFTER', 24 * 3600))
+# Refresh the statistics of at most this many of the most recent stale videos per sync. 0 refreshes all stale videos.
+STALE_REFRESH_LIMIT = int(os.getenv('YOUTUBE_STALE_REFRESH_LIMIT', 200))
+
+# Number of concurrent requests for fetch modes, that support concurrency
+FETCH_WORKERS = int(os.getenv('YOUTUBE_FETCH_WORKERS', 8))
+
+# Send several list requests in one Google API batch request, see "api_batch()". Batches hold at most BATCH_SIZE requests.
+BATCH_REQUESTS = os.getenv('YOUTUBE_BATCH', '0') == '1'
+BATCH_SIZE = int(os.getenv('YOUTUBE_BATCH_SIZE', 50))
+
+# Number of idle keep-alive http objects, that are kept for the next requests
+HTTP_POOL_SIZE = int(os.getenv('YOUTUBE_HTTP_POOL_SIZE', 16))
+
+# Base url of the API such as http://localhost:8080/ to use a local stand-in of the API, see benchmarks/fake_youtube.py
+API_ENDPOINT = os.getenv('YOUTUBE_API_ENDPOINT')
+
+# Discovery documents, that do not come with google-api-python-client, are downloaded once to this folder
+DISCOVERY_CACHE_DIR = os.getenv('YOUTUBE_DISCOVERY_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'youtube-data-analytics-tools'))
+
+cache_stats = {'hits': 0, 'misses': 0, 'quota_used': 0, 'quota_saved': 0}
+_cache_stats_lock = threading.Lock()
+
+def quota_cost(endpoint, part=None):
+    '''Return the estimated quota costs of a single request to an endpoint with the given comma separated parts.'''
+    costs = QUOTA_COSTS.get(endpoint, {'base': 1})
+    cost = costs['base']
+    if part:
+        for p in part.split(','):
+            cost += costs.get(p.strip(), 0)
+    return cost
+
+def fields_mask(endpoint, part):
+    '''Return the fields parameter for a partial response of a list request, that keeps kind and id of the items, the fields
+    of ITEM_FIELDS of the requested parts and the token of the next page, e.g. "items(kind,id,snippet(resourceId(videoId))),nextPageToken".\n
+    Return None, if PARTIAL_RESPONSES is off.'''
+    if not PARTIAL_RESPONSES:
+        return None
+
+    parts = {p.strip() for p in part.split(',')}
+    tree = {}
+    for path in ['kind', 'id'] + [p for p in ITEM_FIELDS.get(endpoint, []) if p.split('/')[0] in parts]:
+        node = tree
+        for name in path.split('/'):
+            node = node.setdefault(name, {})
+
+    def render(node):
+        return ','.join(name + (f'({render(child)})' if child else '') for name, child in node.items())
+
+    return f'items({render(tree)}),nextPageToken'
+
+def cache_key(endpoint, params):
+    '''Return a cache key for an endpoint and its request parameters. Parameters with value None are ignored.'''
+    normalized = {k: v for k, v in params.items() if v is not None and v != ''}
+    return endpoint + ':' + json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+
+def _count(**increments):
+    with _cache_stats_lock:
+        for k, v in increments.items():
+            cache_stats[k] += v
+
+def api_call(youtube, endpoint, use_cache=True, **params):
+    '''Execute a list request for an endpoint such as 'videos' or 'commentThreads' and return the response.\n
+    Responses are cached on disk for CACHE_TTL seconds per endpoint. Set use_cache=False to force a fresh request.
+    Requests go through the quota scheduler, that keeps them within the daily quota and retries failed requests, see "quota.QuotaScheduler".'''
+    cost = quota_cost(endpoint, params.get('part'))
+    use_cache = use_cache and CACHE_ENABLED
+    key = cache_key(endpoint, params)
+
+    if use_cache:
+        response = sql.cache_get(key, CACHE_TTL.get(endpoint, 3600))
+        if response is not None:
+            _count(hits=1, quota_saved=cost)
+            tracing.count('youtube_api_cache_hits_total', endpoint=endpoint)
+            return response
+        _count(misses=1)
+
+    request = count_response_bytes(getattr(youtube, endpoint)().list(**params), endpoint)
+    response = quota.get_scheduler().execute(lambda: execute_request(youtube, request), cost, endpoint)
+    _count(quota_used=cost)
+    count_request(endpoint, cost, response)
+
+    if use_cache:
+        sql.cache_set(key, endpoint, response, max_bytes=CACHE_MAX_BYTES)
+
+    return response
+
+def count_request(endpoint, cost, response):
+    '''Count a request, its quota units and the items of its response in the metrics, see "tracing.render_metrics()".'''
+    tracing.count('youtube_api_requests_total', endpoint=endpoint)
+    tracing.count('youtube_api_quota_units_total', cost, endpoint=endpoint)
+    tracing.count('youtube_api_items_total', len(response.get('items', [])), endpoint=endpoint)
+
+def count_response_bytes(request, endpoint):
+    '''Count the bytes of the response of a request and the seconds it takes to parse them in the metrics. Return the request.'''
+    postproc = getattr(request, 'postproc', None)
+    if postproc is not None:
+        def counting_postproc(resp, content):
+            tracing.count('youtube_api_response_bytes_total', len(content), endpoint=endpoint)
+            start = time.perf_counter()
+            try:
+                return postproc(resp, content)
+            finally:
+                tracing.count('youtube_api_parse_seconds_total', time.perf_counter() - start, endpoint=endpoint)
+        request.postproc = counting_postproc
+    return request
+
+def api_batch(youtube, endpoint, params_list, use_cache=True):
+    '''Execute several list requests for an endpoint and return their responses in the order of params_list.\n
+    Cached responses are taken from the cache like in "api_call()". The other requests are sent in Google API batch requests
+    of up to BATCH_SIZE requests, so they need one round trip per batch. Failed requests are retried like in "api_call()",
+    a request, that still fails, raises its HttpError.'''
+    use_cache = use_cache and CACHE_ENABLED
+    keys = [cache_key(endpoint, params) for params in params_list]
+    responses = [None] * len(params_list)
+
+    pending = []
+    for i, params in enumerate(params_list):
+        if use_cache:
+            response = sql.cache_get(keys[i], CACHE_TTL.get(endpoint, 3600))
+            if response is not None:
+                _count(hits=1, quota_saved=quota_cost(endpoint, params.get('part')))
+                tracing.count('youtube_api_cache_hits_total', endpoint=endpoint)
+                responses[i] = response
+                continue
+            _count(misses=1)
+        pending.append(i)
+
+    scheduler = quota.get_scheduler()
+    for s in range(0, len(pending), BATCH_SIZE):
+        chunk = pending[s:s + BATCH_SIZE]
+        errors = {}
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                errors[int(request_id)] = exception
+            else:
+                responses[int(request_id)] = response
+
+        def send(indices):
+            batch = youtube.new_batch_http_request(callback=callback)
+            for i in indices:
+                batch.add(count_response_bytes(getattr(youtube, endpoint)().list(**params_list[i]), endpoint), request_id=str(i))
+            execute_request(youtube, batch)
+
+        # Failed requests of a batch are sent again, if all of them failed with errors, that may go away
+        attempt = 0
+        to_send = chunk
+        while to_send:
+            errors.clear()
+            cost = sum(quota_cost(endpoint, params_list[i].get('part')) for i in to_send)
+            scheduler.execute(lambda: send(to_send), cost, endpoint)
+            _count(quota_used=cost)
+            for i in to_send:
+                if i not in errors:
+                    count_request(endpoint, quota_cost(endpoint, params_list[i].get('part')), responses[i])
+            to_send = sorted(errors)
+            if to_send:
+                error = errors[to_send[0]]
+                if any(quota.is_daily_quota_error(e) for e in errors.values()):
+                    raise quota.QuotaExceeded(f'{endpoint} request was rejected by the API, because the daily quota is used up') from error
+                if attempt >= scheduler.max_retries or not all(quota.is_retryable(e) for e in errors.values()):
+                    raise error
+                scheduler.wait_retry(attempt, error, endpoint)
+                attempt += 1
+
+        if use_cache:
+            for i in chunk:
+                sql.cache_set(keys[i], endpoint, responses[i], max_bytes=CACHE_MAX_BYTES)
+
+    return responses
+
+def batch_pages(youtube, endpoint, params_list, use_cache=True):
+    '''Return the items of several paged list requests for an endpoint, one list of items per request in the order of params_list.\n
+    The first pages of all requests are sent in batch requests, then the next pages of the requests with more pages and so on.'''
+    items = [[] for _ in params_list]
+    pending = [(i, None) for i in range(len(params_list))]
+    while pending:
+        responses = api_batch(youtube, endpoint, [dict(params_list[i], pageToken=page_token) for i, page_token in pending], use_cache=use_cache)
+        next_pending = []
+        for (i, _), response in zip(pending, responses):
+            items[i] += response.get('items', [])
+            if response.get('nextPageToken'):
+                next_pending.append((i, response['nextPageToken']))
+        pending = next_pending
+    return items
+
+_http_pool = queue.LifoQueue(maxsize=HTTP_POOL_SIZE)
+
+def acquire_http():
+    '''Take an http object from the pool or create a new one. The pool keeps the connections to the API open between requests.
+    httplib2 connections must not be shared between threads, so an http object is used by one thread at a time until "release_http()".'''
+    try:
+        return _http_pool.get_nowait()
+    except queue.Empty:
+        import googleapiclient.http
+        return googleapiclient.http.build_http()
+
+def release_http(http):
+    '''Return an http object to the pool. Its connections are closed, if the pool is full.'''
+    try:
+        _http_pool.put_nowait(http)
+    except queue.Full:
+        for connection in http.connections.values():
+            connection.close()
+
+def execute_request(youtube, request):
+    '''Execute a request or a batch request of a client with an http object of the pool and return the response.'''
+    http = acquire_http()
+    try:
+        return request.execute(http=authorized_http(youtube, http))
+    finally:
+        release_http(http)
+
+def authorized_http(youtube, http):
+    '''Return the http object to execute requests of a client with.'''
+    import google_auth_httplib2
+    # Clients created with OAuth credentials need an authorized http object. httplib2.Http has a credentials attribute as well.
+    client_http = getattr(youtube, '_http', None)
+    if isinstance(client_http, google_auth_httplib2.AuthorizedHttp):
+        return google_auth_httplib2.AuthorizedHttp(client_http.credentials, http=http)
+    return http
+
+class RateLimiter:
+    '''Allow at most max_per_second calls per second across all threads. max_per_second=None disables the limit.'''
+
+    def __init__(self, max_per_second=None):
+        self.interval = 1.0 / max_per_second if max_per_second else 0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+_fetch_executors = {}
+_fetch_executors_lock = threading.Lock()
+
+def get_fetch_executor(workers):
+    '''Return the thread pool with workers threads, that sends concurrent requests. The pools are created once per worker count and reused,
+    so their threads keep their SQLite connections and http objects.'''
+    with _fetch_executors_lock:
+        executor = _fetch_executors.get(workers)
+        if executor is None:
+            executor = _fetch_executors[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'fetch{workers}')
+        return executor
+
+def map_concurrent(func, items, workers=None, rate_limiter=None, label='requests'):
+    '''Call func for every item with a pool of workers and return the results in the order of items. Log the wall-clock time.
+    Calls from a thread of a pool run in that thread, so a pool never waits for itself.'''
+    items = list(items)
+    workers = FETCH_WORKERS if workers is None else workers
+
+    def call(item):
+        if rate_limiter:
+            rate_limiter.wait()
+        return func(item)
+
+    start = time.perf_counter()
+    if workers <= 1 or len(items) <= 1 or threading.current_thread().name.startswith('fetch'):
+        results = [call(item) for item in items]
+    else:
+        results = list(get_fetch_executor(workers).map(call, items))
+
+    if items:
+        logger.info(f'{len(items)} {label} with {workers} workers in {time.perf_counter() - start:.2f}s')
+
+    return results
+
+def get_cache_stats():
+    '''Return a copy of the cache counters: hits, misses, quota used and quota saved by cache hits.'''
+    with _cache_stats_lock:
+        return dict(cache_stats)
+
+@tracing.traced
 def video_categories(youtube, regionCode="None", part=None, id=None):
     '''Return a json file of categories and a dict, that is reduced to ids and titles'''
 
@@ -27,49 +376,111 @@ def video_categories(youtube, regionCode="None", part=None, id=None):
     if part == None:
         return video_category_dict
     else:
-        request = youtube.videoCategories().list(
+        video_categories_response = api_call(
+            youtube,
+            'videoCategories',
             part=part,
             regionCode=regionCode,
             id=id
         )
-        video_categories_response = request.execute()
         video_category_dict = {x['id']: x['snippet']['title'] for x in video_categories_response['items']}
         return video_categories_response
 
+_discovery_documents = {}
+_discovery_lock = threading.Lock()
+_clients = {}
+_clients_lock = threading.Lock()
+
+def discovery_document(api_service_name, api_version):
+    '''Return the parsed discovery document of an API. The document is read once per process from the documents,
+    that come with google-api-python-client, or from a local copy in DISCOVERY_CACHE_DIR, that is downloaded on first use.'''
+    key = (api_service_name, api_version)
+    with _discovery_lock:
+        document = _discovery_documents.get(key)
+        if document is not None:
+            return document
+
+        import googleapiclient.discovery
+        import googleapiclient.discovery_cache
+        import googleapiclient.errors
+        get_static_doc = getattr(googleapiclient.discovery_cache, 'get_static_doc', None)
+        content = get_static_doc(api_service_name, api_version) if get_static_doc else None
+        if content is None:
+            path = os.path.join(DISCOVERY_CACHE_DIR, f'{api_service_name}.{api_version}.json')
+            if not os.path.exists(path):
+                uri = googleapiclient.discovery.DISCOVERY_URI.format(api=api_service_name, apiVersion=api_version)
+                http = acquire_http()
+                try:
+                    resp, content = http.request(uri)
+                finally:
+                    release_http(http)
+                if resp.status >= 400:
+                    raise googleapiclient.errors.HttpError(resp, content, uri=uri)
+                os.makedirs(DISCOVERY_CACHE_DIR, exist_ok=True)
+                with open(f'{path}.{os.getpid()}.tmp', 'wb') as f:
+                    f.write(content)
+                os.replace(f'{path}.{os.getpid()}.tmp', path)
+            with open(path, 'rb') as f:
+                content = f.read()
+
+        document = _discovery_documents[key] = json.loads(content)
+        return document
+
+def preload():
+    '''Import pandas and the API client and read the discovery document of the YouTube Data API.'''
+    importlib.import_module('pandas')
+    importlib.import_module('googleapiclient.discovery')
+    discovery_document('youtube', 'v3')
+
 def youtubeAPIkey(DEVELOPER_KEY, OAUTHLIB_INSECURE_TRANSPORT = "1", api_service_name = "youtube", api_version = "v3"):
     '''Get YouTube Data API credentials via API Key\n
     Disable OAuthlib's HTTPS verification when running locally.\n
-    *DO NOT* leave this option enabled in production.'''
+    *DO NOT* leave this option enabled in production.\n
+    Clients are reused: the process builds one client per API key from the cached discovery document, which all threads share.
+    The client only builds the requests. They are executed with the keep-alive http objects of the pool, see "api_call()".'''
 
     os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = OAUTHLIB_INSECURE_TRANSPORT
-    youtube = googleapiclient.discovery.build(
-        api_service_name, api_version, developerKey = DEVELOPER_KEY)
+    key = (DEVELOPER_KEY, api_service_name, api_version)
+    with _clients_lock:
+        youtube = _clients.get(key)
+        if youtube is None:
+            document = discovery_document(api_service_name, api_version)
+            if API_ENDPOINT:
+                # Requests and batch requests are sent to the root url of the document
+                document = dict(document, rootUrl=API_ENDPOINT, baseUrl=API_ENDPOINT + document.get('servicePath', ''))
+            import googleapiclient.discovery
+            youtube = _clients[key] = googleapiclient.discovery.build_from_document(document, developerKey = DEVELOPER_KEY)
     return youtube
 
+@tracing.traced
 def youtubeSearchList(youtube, channel_id=None, q=None, maxResults=50, type=None):
     '''
     Return a list of video snippets. \n Documentation: https://developers.google.com/youtube/v3/docs/search/list
     '''
-    request = youtube.search().list(
-        part="snippet"
+    responseSearchList = api_call(
+        youtube
+        ,'search'
+        ,part="snippet"
         ,channelId=channel_id
         ,maxResults=maxResults
         ,q=q
-        ,fields='items(id,snippet),nextPageToken',
+        ,fields=fields_mask('search', 'snippet') or 'items(id,snippet),nextPageToken',
         type=type
         )
-    responseSearchList = request.execute()
     return responseSearchList
 
+@tracing.traced
 def youtubeSearchListStatistics(youtube, q=None, maxResults=10):
-    '''Get video search results for a query. Returns advanced statistics such as counts forlikes, dislikes, views and comments. Return a json file.'''
+    '''Get video search results for a query. Returns advanced statistics such as counts forlikes, dislikes, views and comments. Return a json file.\n
+    The videos are added to the local search index, see "search_videos()".'''
 
     query_result = youtubeSearchList(youtube, q=q, maxResults=maxResults, type='video')
 
     # Create a list of video ids
     video_id_list = [x['id']['videoId'] for x in query_result['items']]
 
-    snippets = video_snippets(youtube, video_id_list, maxResults=10, part="statistics")
+    # The snippets cost 2 more units per request, see "QUOTA_COSTS". They let the index answer the next searches without a search request of 100 units.
+    snippets = video_snippets(youtube, video_id_list, maxResults=10, part="snippet,statistics", fields=fields_mask('videos', 'snippet,statistics'))
     assert len(query_result['items']) == len(snippets), 'Query result length does not match statistics length.'
 
     counter = 0
@@ -77,19 +488,62 @@ def youtubeSearchListStatistics(youtube, q=None, maxResults=10):
         i['statistics'] = snippets[counter]['statistics']
         counter += 1
 
+    sql.index_videos(snippets)
     return query_result
 
-def videoIdList(youtube, channelId):
+def search_local(kind, q, maxResults):
+    '''Return a search response of kind 'video' or 'channel' from the local search index or None, if it has less than LOCAL_SEARCH_MIN_RESULTS results.'''
+    items = sql.search_index(kind, q or '', limit=maxResults)
+    if items is None or len(items) < max(LOCAL_SEARCH_MIN_RESULTS, 1):
+        tracing.count('local_search_total', kind=kind, result='miss')
+        return None
+    tracing.count('local_search_total', kind=kind, result='hit')
+    return {'kind': 'youtube#searchListResponse', 'source': 'index', 'items': items}
+
+@tracing.traced
+def search_videos(youtube, q, maxResults=10, local=True):
+    '''Return video search results with statistics like "youtubeSearchListStatistics()".\n
+    With local=True the results come from the local search index of the videos, that were downloaded before, ranked by how well
+    their title, tags, channel title and description match q. Only when the index has no results, the API is asked, which costs
+    101 quota units. The response has 'source' 'index' or 'youtube'.'''
+    if local:
+        response = search_local('video', q, maxResults)
+        if response is not None:
+            return response
+    response = youtubeSearchListStatistics(youtube, q=q, maxResults=maxResults)
+    response['source'] = 'youtube'
+    return response
+
+@tracing.traced
+def search_channels(youtube, q, maxResults=5, local=True):
+    '''Return channel search results like "youtubeSearchList()" with type 'channel'.\n
+    With local=True the results come from the local search index of the channels, that were searched or analysed before.
+    Only when the index has no results, the API is asked. The response has 'source' 'index' or 'youtube'.'''
+    if local:
+        response = search_local('channel', q, maxResults)
+        if response is not None:
+            return response
+    response = youtubeSearchList(youtube, channel_id=None, q=q, maxResults=maxResults, type='channel')
+    sql.index_channels(response['items'])
+    response['source'] = 'youtube'
+    return response
+
+@tracing.traced
+def videoIdList(youtube, channelId, known_ids=None, use_cache=True):
     '''
-    Return a list of all public video ids (in a specific channel)
+    Return a list of all public video ids (in a specific channel)\n
+    The upload playlist is ordered from new to old. If known_ids is given, stop at the first known video and return only the newer ones.
     '''
     videoIdList = []
-    requestChannelsList = youtube.channels().list(
-        part="contentDetails"
+    # The snippet costs 2 more units, see "QUOTA_COSTS", and adds the channel to the local search index, see "search_channels()"
+    responseChannelsList = api_call(
+        youtube
+        ,'channels'
+        ,part="contentDetails,snippet"
         ,id=channelId
-        ,fields='items/contentDetails/relatedPlaylists/uploads'
+        ,fields='items(id,snippet(title,description,publishedAt,thumbnails/medium/url),contentDetails/relatedPlaylists/uploads)'
     )
-    responseChannelsList = requestChannelsList.execute()
+    sql.index_channels(responseChannelsList.get('items', []))
 
     # Get upload playlist id from dictionary
     channelUploadPlaylistID = responseChannelsList.get('items')[0].get('contentDetails').get('relatedPlaylists').get('uploads')
@@ -98,20 +552,31 @@ def videoIdList(youtube, channelId):
     playlistNextPageToken = ''
 
     while playlistNextPageToken != None:
-        requestPlaylistItems = youtube.playlistItems().list(
-            part="snippet"
+        responsePlaylistItems = api_call(
+            youtube
+            ,'playlistItems'
+            ,use_cache=use_cache
+            ,part="snippet"
             ,maxResults=50
             ,pageToken=playlistNextPageToken
             ,playlistId=channelUploadPlaylistID
+            ,fields=fields_mask('playlistItems', 'snippet')
         )
-        responsePlaylistItems = requestPlaylistItems.execute()
 
         for video in responsePlaylistItems['items']:
-            videoIdList.append(video['snippet']['resourceId']['videoId'])
-
-        playlistNextPageToken = responsePlaylistItems.get('nextPageToken')
+            video_id = video['snippet']['resourceId']['videoId']
+            if known_ids and video_id in known_ids:
+                # All following videos are known already
+                playlistNextPageToken = None
+                break
+            videoIdList.append(video_id)
+        else:
+            playlistNextPageToken = responsePlaylistItems.get('nextPageToken')
 
-    logger.info(f'The channel {channelId} has {len(videoIdList)} public videos')
+    if known_ids:
+        logger.info(f'The channel {channelId} has {len(videoIdList)} new public videos')
+    else:
+        logger.info(f'The channel {channelId} has {len(videoIdList)} public videos')
 
     return videoIdList
 
@@ -129,7 +594,7 @@ def list_slice(input_list, n=50):
 
     return list_slices
 
-def videoSnippet(youtube, videoId, maxResults=50, part="snippet,statistics,contentDetails,player,status"):
+def videoSnippet(youtube, videoId, maxResults=50, part="snippet,statistics,contentDetails,player,status", use_cache=True, fields=None):
     '''
     Return a infos of a specific video\n
     Quota costs per video and info:\n
@@ -141,14 +606,18 @@ def videoSnippet(youtube, videoId, maxResults=50, part="snippet,statistics,conte
     status 2
     topicDetails 2
     '''
-    requestSnippet = youtube.videos().list(
-        part=part
+    responseSnippet = api_call(
+        youtube
+        ,'videos'
+        ,use_cache=use_cache
+        ,part=part
         ,id=videoId
+        ,fields=fields
     )
-    responseSnippet = requestSnippet.execute()
     return responseSnippet
 
-def video_snippets(youtube, video_id_list, maxResults=50, part="snippet,statistics,contentDetails,player,status"):
+@tracing.traced
+def video_snippets(youtube, video_id_list, maxResults=50, part="snippet,statistics,contentDetails,player,status", use_cache=True, batch=None, fields=None):
     '''
     Return a infos of a single or several videos. Input is a list object of video ids.\n
     Quota costs per video and info:\n
@@ -158,13 +627,20 @@ def video_snippets(youtube, video_id_list, maxResults=50, part="snippet,statisti
     player 0
     recordingDetails ?
     status 2
-    topicDetails 2
+    topicDetails 2\n
+    Set batch=True to send the requests for all chunks of 50 ids in batch requests, see "api_batch()".
+    Pass fields=fields_mask('videos', part) to get only the fields, that "snippets_to_dict()" reads.
     '''
     video_id_chunks = list_slice(video_id_list, n=50)
 
+    batch = BATCH_REQUESTS if batch is None else batch
+    if batch:
+        responses = api_batch(youtube, 'videos', [{'part': part, 'id': chunk, 'fields': fields} for chunk in video_id_chunks], use_cache=use_cache)
+    else:
+        responses = [videoSnippet(youtube, chunk, part=part, use_cache=use_cache, fields=fields) for chunk in video_id_chunks]
+
     video_snippets =[]
-    for chunk in video_id_chunks:
-        responseSnippet = videoSnippet(youtube, chunk, part=part)
+    for responseSnippet in responses:
         [video_snippets.append(i) for i in responseSnippet['items']]
 
     return video_snippets
@@ -172,6 +648,8 @@ def video_snippets(youtube, video_id_list, maxResults=50, part="snippet,statisti
 
 def youtubeOauth(scopes, api_service_name, api_version, client_secrets_file, OAUTHLIB_INSECURE_TRANSPORT):
     '''Disable OAuthlib's HTTPS verification when running locally. *DO NOT* leave this option enabled in production.'''
+    import google_auth_oauthlib.flow
+    import googleapiclient.discovery
     os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = OAUTHLIB_INSECURE_TRANSPORT
     flow = google_auth_oauthlib.flow.InstalledAppFlow.from_client_secrets_file(
         client_secrets_file, scopes)
@@ -190,6 +668,15 @@ def to_int(string):
     '''Turn duration from text string such as 'PT1H23M09S' to an int'''
     return int(string[:-1]) if string else 0
 
+# Word tokenizers for word clouds. Comments are lower cased and split into letters and digits,
+# tags are upper cased and split into words like WordCloud does.
+COMMENT_WORD_PATTERN = re.compile('[a-z0-9]+')
+TAG_WORD_PATTERN = re.compile(r"\w[\w']*")
+# Increase when the tokenizers change, so stored word frequencies are counted again
+WORD_COUNT_VERSION = 1
+
+DURATION_PATTERN = r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?'
+
 def get_duration_sec(pt):
     '''Turn duration from text string such as 'PT1H23M09S' to an int of seconds'''
     pattern = 'PT(\d*H)?(\d*M)?(\d*S)?'
@@ -197,137 +684,172 @@ def get_duration_sec(pt):
     duration_sec = timestamp[0] * 3600 + timestamp[1] * 60 + timestamp[2]
     return duration_sec
 
+def durations_to_sec(durations):
+    '''Turn a list of duration text strings such as 'PT1H23M09S' to a list of ints of seconds. Vectorized version of "get_duration_sec()".'''
+    import pandas as pd
+    parts = pd.Series(durations, dtype='object').str.extract(DURATION_PATTERN)
+    parts = parts.fillna(0).astype('int64')
+    return (parts[0] * 3600 + parts[1] * 60 + parts[2]).tolist()
+
+@tracing.traced
 def snippets_to_dict(video_snippet_list, yt_credentials=None):
     '''Return a dictionary from a given list of one or more video snippets.\
     The dictionary is optimized for creating a dataframe'''
-
-    # Create an empty dictionary
-    df_data = {'video_id': [],
-               'published_at': [],
-               'channel_id': [],
-               'title': [],
-               'description': [],
-               'channel_title': [],
-               'tags': [],
-               'category_id': [],
+    import pandas as pd
+
+    snippets = [i.get('snippet') for i in video_snippet_list]
+    content_details = [i['contentDetails'] for i in video_snippet_list]
+    status = [i['status'] for i in video_snippet_list]
+    statistics = [i['statistics'] for i in video_snippet_list]
+    durations = [c.get('duration') for c in content_details]
+
+    # Create the dictionary column by column
+    df_data = {'video_id': [i.get('id') for i in video_snippet_list],
+               'published_at': pd.to_datetime([s.get('publishedAt') for s in snippets]),
+               'channel_id': [s.get('channelId') for s in snippets],
+               'title': [s.get('title') for s in snippets],
+               'description': [s.get('description') for s in snippets],
+               'channel_title': [s.get('channelTitle') for s in snippets],
+               'tags': [s.get('tags') for s in snippets],
+               'category_id': [s.get('categoryId') for s in snippets],
                'category' : [],
-               'live_broadcast_content': [],
-               'duration': [],
-               'duration_sec': [],
-               'dimension': [],
-               'definition': [],
-               'caption': [],
-               'licensed_content': [],
-               'projection': [],
-               'privacy_status': [],
-               'license': [],
-               'embeddable': [],
-               'public_stats_viewable': [],
-               'view_count': [],
-               'like_count': [],
-               'dislike_count': [],
-               'favorite_count': [],
-               'comment_count': [],
-               'thumbnails_default': [],
-               'date_data_created': []
+               'live_broadcast_content': [s.get('liveBroadcastContent') for s in snippets],
+               'duration': durations,
+               'duration_sec': durations_to_sec(durations),
+               'dimension': [c.get('dimension') for c in content_details],
+               'definition': [c.get('definition') for c in content_details],
+               'caption': [c.get('caption') for c in content_details],
+               'licensed_content': [c.get('licensedContent') for c in content_details],
+               'projection': [c.get('projection') for c in content_details],
+               'privacy_status': [s.get('privacyStatus') for s in status],
+               'license': [s.get('license') for s in status],
+               'embeddable': [s.get('embeddable') for s in status],
+               'public_stats_viewable': [s.get('publicStatsViewable') for s in status],
+               'view_count': [int(s.get('viewCount') or 0) for s in statistics],
+               'like_count': [int(s.get('likeCount') or 0) for s in statistics],
+               'dislike_count': [int(s.get('dislikeCount') or 0) for s in statistics],
+               'favorite_count': [int(s.get('favoriteCount') or 0) for s in statistics],
+               'comment_count': [int(s.get('commentCount') or 0) for s in statistics],
+               'thumbnails_default': [s.get('thumbnails').get('default').get('url') for s in snippets],
+               # One timestamp for the whole batch
+               'date_data_created': [datetime.datetime.now(tz=pytz.UTC)] * len(video_snippet_list)
               }
 
     if yt_credentials:
         video_category_dict = video_categories(yt_credentials)
+        # Like the former row by row version, the column holds the category of the last video
+        if snippets:
+            df_data['category'] = video_category_dict[snippets[-1].get('categoryId')]
     else:
         del df_data['category']
 
-    for i in video_snippet_list:
-        df_data['video_id'].append(i.get('id'))
-        df_data['published_at'].append(pd.to_datetime(i.get('snippet').get('publishedAt')))
-        df_data['channel_id'].append(i.get('snippet').get('channelId'))
-        df_data['title'].append(i.get('snippet').get('title'))
-        df_data['description'].append(i.get('snippet').get('description'))
-        df_data['channel_title'].append(i.get('snippet').get('channelTitle'))
-        df_data['tags'].append(i.get('snippet').get('tags'))
-        df_data['category_id'].append(i['snippet'].get('categoryId'))
-
-        if yt_credentials:
-            df_data['category'] = video_category_dict[i['snippet'].get('categoryId')]
-
-        df_data['live_broadcast_content'].append(i['snippet'].get('liveBroadcastContent'))
-        df_data['duration'].append(i['contentDetails'].get('duration'))
-
-        duration_text = i['contentDetails'].get('duration')
-        df_data['duration_sec'].append(get_duration_sec(duration_text))
-
-        df_data['dimension'].append(i['contentDetails'].get('dimension'))
-        df_data['definition'].append(i['contentDetails'].get('definition'))
-        df_data['caption'].append(i['contentDetails'].get('caption'))
-        df_data['licensed_content'].append(i['contentDetails'].get('licensedContent'))
-        df_data['projection'].append(i['contentDetails'].get('projection'))
-        df_data['privacy_status'].append(i['status'].get('privacyStatus'))
-        df_data['license'].append(i['status'].get('license'))
-        df_data['embeddable'].append(i['status'].get('embeddable'))
-        df_data['public_stats_viewable'].append(i['status'].get('publicStatsViewable'))
-        df_data['view_count'].append(int(i['statistics'].get('viewCount') or 0))
-        df_data['like_count'].append(int(i['statistics'].get('likeCount') or 0))
-        df_data['dislike_count'].append(int(i['statistics'].get('dislikeCount') or 0))
-        df_data['favorite_count'].append(int(i['statistics'].get('favoriteCount') or 0))
-        df_data['comment_count'].append(int(i['statistics'].get('commentCount') or 0))
-        df_data['thumbnails_default'].append(i.get('snippet').get('thumbnails').get('default').get('url'))
-        df_data['date_data_created'].append(datetime.datetime.now(tz=pytz.UTC))
-
     return df_data
 
 def get_channel_snippet(youtube, channel_id, nextPageToken=None):
     '''Get a cannel snippet. Take as input a string of one channel_id or a concatenated string of ids separated by commas without spaces.'''
-    request = youtube.channels().list(
+    response = api_call(
+        youtube,
+        'channels',
         part="snippet",
         id=channel_id,
         maxResults=50,
         pageToken=nextPageToken
     )
-    response = request.execute()
     return response
 
 
+def iter_pages(youtube, endpoint, max_pages=None, max_items=None, **params):
+    '''Yield the items of a list request page by page. Follow nextPageToken until the last page, max_pages pages or max_items items are reached.'''
+    page_token = None
+    pages = 0
+    items = 0
+
+    while True:
+        response = api_call(youtube, endpoint, pageToken=page_token, **params)
+        page_items = response.get('items', [])
+        tracing.count('youtube_api_pages_total', endpoint=endpoint)
+        if max_items is not None and items + len(page_items) > max_items:
+            page_items = page_items[:max_items - items]
+        pages += 1
+        items += len(page_items)
+        yield page_items
+
+        page_token = response.get('nextPageToken')
+        if page_token is None:
+            break
+        if max_pages is not None and pages >= max_pages:
+            break
+        if max_items is not None and items >= max_items:
+            break
+
+def iter_comment_threads(
+    youtube,
+    part="id,replies,snippet",
+    channel_id=None,
+    comment_thread_id=None,
+    video_id=None,
+    maxResults=100,
+    max_pages=None,
+    max_items=None,
+    order=None,
+    use_cache=True,
+    fields=None
+):
+    '''Yield lists of top-level comments and meta data page by page. Parameters are the same as for "get_comment_threads()".\n
+    Stop after max_pages pages or max_items comment threads.'''
+    costs = 0
+    cost_per_query = quota_cost('commentThreads', part)
+    for page in iter_pages(
+        youtube,
+        'commentThreads',
+        max_pages=max_pages,
+        max_items=max_items,
+        use_cache=use_cache,
+        part=part,
+        maxResults=maxResults,
+        videoId=video_id,
+        id=comment_thread_id,
+        channelId=channel_id,
+        order=order,
+        fields=fields
+    ):
+        costs += cost_per_query
+        yield page
+
+    if costs > 0:
+        logger.info(f'Comment thread query costs: {costs}')
+
+@tracing.traced
 def get_comment_threads(
     youtube,
     part="id,replies,snippet",
     channel_id=None,
     comment_thread_id=None,
     video_id=None,
-    maxResults=100
+    maxResults=100,
+    max_pages=None,
+    max_items=None,
+    fields=None
 ):
     '''Return a .json with top-level comments and meta data. Take as input the youtube credential object and the videoId.\n
     Specify exactly one filter out of: channel_id, comment_thread_id, video_id.\n
     See detailied info in the documentation: https://developers.google.com/youtube/v3/docs/commentThreads/list \n
-    Quota costs: id: 0, replies: 2, snippet: 2'''
+    Quota costs: id: 0, replies: 2, snippet: 2\n
+    Pass fields for a partial response, e.g. fields_mask('commentThreads', part).'''
 
-    # Get items from upload playlist
-    commentThreadsNextPageToken = ''
     output = []
-
-    # Calculate the costs for query
-    costs = 0
-    cost_per_query = 0
-    if 'replies' in part:
-        cost_per_query += 2
-    if 'snippet' in part:
-        cost_per_query += 2
-
-    while commentThreadsNextPageToken != None:
-        costs += cost_per_query
-        request = youtube.commentThreads().list(
-            part=part,
-            maxResults=maxResults,
-            videoId=video_id,
-            id=comment_thread_id,
-            channelId=channel_id,
-            pageToken = commentThreadsNextPageToken
-        )
-        response = request.execute()
-        [output.append(x) for x in response['items']]
-        commentThreadsNextPageToken = response.get('nextPageToken')
-
-    if costs > 0:
-        logger.info(f'Comment thread query costs: {costs}')
+    for page in iter_comment_threads(
+        youtube,
+        part=part,
+        channel_id=channel_id,
+        comment_thread_id=comment_thread_id,
+        video_id=video_id,
+        maxResults=maxResults,
+        max_pages=max_pages,
+        max_items=max_items,
+        fields=fields
+    ):
+        output += page
 
     return output
 
@@ -395,45 +917,41 @@ def comment_threads_to_dict(comments):
     return df_data
 
 
-def get_comments_list(youtube, part="id", maxResults=100, parent_id=None, id=None):
-    '''Return a list of ids and/or snippets for a given comment id. Specify exactly one filter out of: parentId, id.\n
-    Take as filter input a string of comma seperated parentIds/ids. Maximum is 50,even though max of maxResults=100.
-    Quota costs for 'part' paramter: id: 0, snippet: 1.\n
-    Idea for improvement: Calculate the most efficient way, if sippets should be retrieved by the get_comments_list() or get_comments_threads()'''
-    # Set false NextPageToken and empty output list
-    commentThreadsNextPageToken = ''
-    output = []
-
-    # Setup calculation for the costs for query
+def iter_comments(youtube, part="id", maxResults=100, parent_id=None, id=None, max_pages=None, max_items=None, use_cache=True, fields=None):
+    '''Yield lists of comment ids and/or snippets page by page. Parameters are the same as for "get_comments_list()".\n
+    Stop after max_pages pages or max_items comments.'''
     costs = 0
-    cost_per_query = 0
-    if 'snippet' in part:
-        cost_per_query += 2
-
-    # Loop as long as there are next pages of results
-
-    while commentThreadsNextPageToken != None:
-        # Increment costs
+    cost_per_query = quota_cost('comments', part)
+    for page in iter_pages(
+        youtube,
+        'comments',
+        max_pages=max_pages,
+        max_items=max_items,
+        use_cache=use_cache,
+        part=part,
+        maxResults=maxResults,
+        parentId=parent_id,
+        id=id,
+        fields=fields
+    ):
         costs += cost_per_query
-        # Do the youtube request
-        request = youtube.comments().list(
-            part=part,
-            maxResults=maxResults,
-            parentId=parent_id,
-            id=id
-        )
-        response = request.execute()
+        yield page
 
-        # Append each element sepeerately to the output list
-        [output.append(x) for x in response['items']]
-        # Get a NextPageToken in case there is one, else set it to None
-        commentThreadsNextPageToken = response.get('nextPageToken')
-
-    # Print costs
     if costs > 0:
         logger.info(f'Comment list query costs: {costs}')
 
-    return response
+@tracing.traced
+def get_comments_list(youtube, part="id", maxResults=100, parent_id=None, id=None, max_pages=None, max_items=None, use_cache=True, fields=None):
+    '''Return a list of ids and/or snippets for a given comment id. Specify exactly one filter out of: parentId, id.\n
+    Take as filter input a string of comma seperated parentIds/ids. Maximum is 50,even though max of maxResults=100.
+    Quota costs for 'part' paramter: id: 0, snippet: 1.\n
+    Idea for improvement: Calculate the most efficient way, if sippets should be retrieved by the get_comments_list() or get_comments_threads()\n
+    Pass fields for a partial response, e.g. fields_mask('comments', part).'''
+    output = []
+    for page in iter_comments(youtube, part=part, maxResults=maxResults, parent_id=parent_id, id=id, max_pages=max_pages, max_items=max_items, use_cache=use_cache, fields=fields):
+        output += page
+
+    return output
 
 def list_slice(input_list, n=50):
     '''Concatenate n list elements separated by ',' and return a new list of concatenations.\n
@@ -484,79 +1002,166 @@ def comment_list_to_dict(reply_comments_snippets):
     return df_data
 
 
-def get_all_comments(youtube, video_id):
+def comment_lists(youtube, params_list, workers=None, rate_limiter=None, batch=None, label='comment requests', use_cache=True):
+    '''Return the comments of several "get_comments_list()" requests, one list per request in the order of params_list.\n
+    Take as input a list of dictionaries of part, either parentId or id and optionally fields. The requests are sent with up to workers concurrent requests,
+    limited by rate_limiter, or with batch=True in batch requests, see "batch_pages()".'''
+    batch = BATCH_REQUESTS if batch is None else batch
+    if batch:
+        return batch_pages(youtube, 'comments', [dict(params, maxResults=100) for params in params_list], use_cache=use_cache)
+
+    return map_concurrent(
+        lambda params: get_comments_list(youtube, part=params['part'], parent_id=params.get('parentId'), id=params.get('id'), use_cache=use_cache, fields=params.get('fields')),
+        params_list,
+        workers=workers,
+        rate_limiter=rate_limiter,
+        label=label
+    )
+
+def iter_all_comments(youtube, video_id, workers=None, max_per_second=None, max_pages=None, max_items=None, batch=None):
+    '''Yield lists of comment threads and replies of a video, one list per page of comment threads.\n
+    Each list holds the threads of the page, the replies that did not come with the threads and the replies that came with the threads.
+    Replies are fetched with up to workers concurrent requests (workers=1 for the serial path), limited to max_per_second requests,
+    or with batch=True in batch requests. max_pages and max_items limit the number of comment thread pages and comment threads.'''
+    rate_limiter = RateLimiter(max_per_second)
 
     logger.info('Starting to get comment threads')
-    # Get list of snippets of threads
-    thread_snippets = get_comment_threads(youtube, part="snippet,replies", video_id=video_id)
+    for thread_snippets in iter_comment_threads(youtube, part="snippet,replies", video_id=video_id, max_pages=max_pages, max_items=max_items, fields=fields_mask('commentThreads', 'snippet,replies')):
+
+        # Check if the thread comments have more than 5 replies and if true append the id to a dict
+        thread_ids_with_more_replies = {}
+        already_downloaded_replies = {}
+
+        # Loop through threads and search for >5 replies
+        for t_id in thread_snippets:
+            if t_id['snippet']['totalReplyCount'] > 5:
+
+                # Wite parent_id of threads with >5 replies to dict index
+                thread_ids_with_more_replies[t_id['id']] = True
+
+                if t_id.get('replies') != None:
+
+                    # Write reply id to dict
+                    for reply_id in t_id['replies']['comments']:
+                        already_downloaded_replies[reply_id['id']] = True
+                else:
+                    logger.info(f"Thread {t_id['id']} has {t_id['snippet']['totalReplyCount']} replies, but none came with the thread")
+
+        # Get the reply ids of thread ids with >5 replies, which were not downloaded yet
+        reply_id_lists = comment_lists(
+            youtube,
+            [{'part': 'id', 'parentId': thread_id, 'fields': fields_mask('comments', 'id')} for thread_id in thread_ids_with_more_replies],
+            workers=workers,
+            rate_limiter=rate_limiter,
+            batch=batch,
+            label='reply id requests'
+        )
+        reply_ids = {}
+        for replies in reply_id_lists:
+            for r_id in replies:
+                if r_id['id'] not in already_downloaded_replies:
+                    reply_ids[r_id['id']] = True
+
+        # Get reply snippets in strings of 50 ids each, that were not downloaded yet
+        reply_snippet_lists = comment_lists(
+            youtube,
+            [{'part': 'snippet', 'id': id_string, 'fields': fields_mask('comments', 'snippet')} for id_string in list_slice(list(reply_ids), n=50)],
+            workers=workers,
+            rate_limiter=rate_limiter,
+            batch=batch,
+            label='reply snippet requests'
+        )
+        reply_snippets = []
+        for r_snippets in reply_snippet_lists:
+            reply_snippets += r_snippets
+
+        # Add already downloaded replies (that came with threads) to list
+        thread_replies = []
+        for t_id in thread_snippets:
+            if t_id['snippet']['totalReplyCount'] > 0 and t_id.get('replies'):
+                thread_replies += t_id['replies']['comments']
+
+        # Yield thread snippets + reply snippets together
+        yield thread_snippets + reply_snippets + thread_replies
+
     logger.info('Done getting comment threads')
 
-    # Check if the thread comments have more than 5 replies and if true append the id to a dict
-    thread_ids_with_more_replies = {}
-    already_downloaded_replies = {}
+@tracing.traced
+def sync_video_comments(youtube, video_id, workers=None, max_per_second=None, batch=None):
+    '''Synchronize the local comment store with a video and return all stored comment threads and replies of the video.\n
+    See "update_video_comments()" for the sync.'''
+    update_video_comments(youtube, video_id, workers=workers, max_per_second=max_per_second, batch=batch)
+    return sql.get_comments(video_id)
+
+@tracing.traced
+def update_video_comments(youtube, video_id, workers=None, max_per_second=None, batch=None):
+    '''Synchronize the local comment store with a video.\n
+    The first sync downloads all comments. Later syncs page through the comment threads from new to old and stop at the page,
+    that reaches the newest thread of the last sync. Replies are downloaded again only for threads, whose totalReplyCount changed.'''
+    watermark = sql.get_comment_watermark(video_id)
+
+    if watermark is None:
+        logger.info(f'Downloading all comments of video {video_id}')
+        for snippets in iter_all_comments(youtube, video_id, workers=workers, max_per_second=max_per_second, batch=batch):
+            sql.upsert_comments(video_id, snippets)
+        sql.set_comment_watermark(video_id)
+        return
+
+    logger.info(f'Downloading comments of video {video_id} newer than {watermark}')
+    reply_counts = sql.get_thread_reply_counts(video_id)
+    rate_limiter = RateLimiter(max_per_second)
+
+    for thread_snippets in iter_comment_threads(youtube, part="snippet,replies", video_id=video_id, order='time', use_cache=False, fields=fields_mask('commentThreads', 'snippet,replies')):
+        changed_threads = []
+        thread_replies = []
+        reached_watermark = False
+
+        for t_id in thread_snippets:
+            if t_id['snippet']['topLevelComment']['snippet']['publishedAt'] <= watermark:
+                reached_watermark = True
+
+            total_reply_count = t_id['snippet']['totalReplyCount']
+            if reply_counts.get(t_id['id']) == total_reply_count:
+                continue
+
+            if total_reply_count > 5:
+                # Only 5 replies come with the thread
+                changed_threads.append(t_id['id'])
+            elif t_id.get('replies'):
+                thread_replies += t_id['replies']['comments']
+
+        reply_snippet_lists = comment_lists(
+            youtube,
+            [{'part': 'snippet', 'parentId': thread_id, 'fields': fields_mask('comments', 'snippet')} for thread_id in changed_threads],
+            workers=workers,
+            rate_limiter=rate_limiter,
+            batch=batch,
+            label='reply requests for changed threads',
+            use_cache=False
+        )
+        for r_snippets in reply_snippet_lists:
+            thread_replies += r_snippets
 
-    # Loop through threads and search for >5 replies
-    for t_id in thread_snippets:
-        if t_id['snippet']['totalReplyCount'] > 5:
+        sql.upsert_comments(video_id, thread_snippets + thread_replies)
 
-            # Wite parent_id of threads with >5 replies to dict index
-            thread_ids_with_more_replies[t_id['id']] = True
+        if reached_watermark:
+            break
 
-            # This print statement tries to evaluate an error, that I couldn't fix yet
-            logger.info(t_id['id'], 'has more than 5 replies')
-            if t_id.get('replies') != None:
+    sql.set_comment_watermark(video_id)
 
-                # Write reply id to dict
-                for reply_id in t_id['replies']['comments']:
-                    already_downloaded_replies[reply_id['id']] = True
-            else:
-                # This print statement tries to evaluate an error, that I couldn't fix yet
-                logger.info(f"* * * * * {t_id['id']} would throw a key error for 'replies' * * * * * ")
-
-    # Get a list of reply ids for thread ids with more than 5 replies
-    # Slice list into strings of 50 ids each
-    strings_of_thread_ids_with_more_replies = list_slice(list(thread_ids_with_more_replies), n=50)
-
-    # Create empty dict for reply ids
-    reply_ids = {}
-
-    # Loop through thread ids with >5 replies
-    logger.info('Start getting reply comment ids, that were not downloaded yet')
-    for id_string in thread_ids_with_more_replies:
-        # Get the reply ids
-        replies = get_comments_list(youtube, part="id", parent_id=id_string, id=None)
-        # Write the reply ids into a dict, if they are not downlaoded yet
-        for r_id in replies['items']:
-            if r_id['id'] not in already_downloaded_replies:
-                reply_ids[r_id['id']] = True
-    logger.info('Done getting reply comment ids, that were not downloaded yet')
-
-    # Create a list with id strings
-    strings_of_reply_ids = list_slice(list(reply_ids), n=50)
-
-    # Create empty list for new reply snippets
-    reply_snippets = []
-
-    # Get reply snippets, that were not downloaded yet
-    logger.info('Start downloading reply comments, that were not downloaded yet')
-    for id_string in strings_of_reply_ids:
-        r_snippets = get_comments_list(youtube, part="snippet", parent_id=None, id=id_string)
-        reply_snippets += r_snippets['items']
-    logger.info('Done downloading reply comments, that were not downloaded yet')
-
-    # Create an empty list for already downloaded replies (that came with threads)
-    already_downloaded_replies = []
-
-    # Loop through threads and search for >0 replies
-    for t_id in thread_snippets:
-        # Add already downloaded replies to list
-        if t_id['snippet']['totalReplyCount'] > 0:
-            already_downloaded_replies += t_id['replies']['comments']
-
-    # Add thread snippets + reply snippets together
-    all_snippets = thread_snippets + reply_snippets + already_downloaded_replies
+@tracing.traced
+def get_all_comments(youtube, video_id, workers=None, max_per_second=None, max_pages=None, max_items=None, incremental=False, batch=None):
+    '''Return all comment threads and replies of a video. Take as input the youtube credential object and the video id.\n
+    See "iter_all_comments()" for the parameters. Set incremental=True to use the local comment store, see "sync_video_comments()".'''
+    if incremental:
+        return sync_video_comments(youtube, video_id, workers=workers, max_per_second=max_per_second, batch=batch)
+
+    all_snippets = []
+    for snippets in iter_all_comments(youtube, video_id, workers=workers, max_per_second=max_per_second, max_pages=max_pages, max_items=max_items, batch=batch):
+        all_snippets += snippets
     return all_snippets
 
+@tracing.traced
 def extract_comments(comments):
     '''Extract comments from a json file.Return a dictionary. Take as input the result of function "get_all_comments()"'''
     comment_dict = {}
@@ -569,102 +1174,243 @@ def extract_comments(comments):
 
 def concat_comments(comment_dict):
     '''Concat comment in values of a dictionary and return one string. Used for WordCloud input data.'''
-    string = ''
-    for i, c in comment_dict.items():
-        result = re.findall('[a-z0-9]+', c.lower())
-        string += ' '.join(result) + ' '
-    return string
+    return ' '.join(' '.join(COMMENT_WORD_PATTERN.findall(c.lower())) for c in comment_dict.values()) + ' '
 
 def concat_listelements(series_object):
     '''Concat elements in lists in series objects and return them as a string. Needed as input for a wordcloud.'''
-    result = ''
-    for tag_list in series_object:
-        if tag_list:
-            for tag in tag_list:
-                result += ' ' + ''.join(tag).upper()
-    return result
-
+    return ''.join(' ' + tag.upper() for tag_list in series_object if tag_list for tag in tag_list)
+
+def count_comment_words(texts, counter=None):
+    '''Count the words of comments and return a Counter. Used for WordCloud input data.\n
+    Take as input an iterable of comment texts or a dictionary with comment texts as values.
+    Pass the Counter of an earlier chunk of comments as counter to add the words of the next chunk.'''
+    counter = Counter() if counter is None else counter
+    if isinstance(texts, dict):
+        texts = texts.values()
+    # One update with a chain of all words counts in C instead of one update per comment
+    counter.update(chain.from_iterable(map(COMMENT_WORD_PATTERN.findall, map(str.lower, texts))))
+    return counter
+
+def count_tag_words(series_object, counter=None):
+    '''Count the words of the tags in lists in series objects and return a Counter. Used for WordCloud input data.\n
+    Pass the Counter of an earlier chunk of videos as counter to add the words of the next chunk.'''
+    counter = Counter() if counter is None else counter
+    tags = (tag.upper() for tag_list in series_object if tag_list for tag in tag_list)
+    counter.update(chain.from_iterable(map(TAG_WORD_PATTERN.findall, tags)))
+    return counter
+
+@tracing.traced
+def word_frequencies(frequency_key, texts, count_words=count_comment_words, version=None):
+    '''Return the word frequencies of comments or tag lists as dictionary.\n
+    Take as input a key like "comments:<video_id>", the texts and the counting function "count_comment_words()" or "count_tag_words()".
+    The frequencies are stored with a hash of the texts, so they are counted again only when the texts of the video or channel change.
+    Pass the version of the local store, that the texts come from, to store them with the version instead of hashing the texts.
+    texts can be a function, that returns the texts. It is called only when the words are counted.'''
+    if version is not None and CACHE_ENABLED:
+        input_hash = f'{count_words.__name__}:{WORD_COUNT_VERSION}:store:{version}'
+        frequencies = sql.get_word_frequencies(frequency_key, input_hash)
+        if frequencies is None:
+            frequencies = dict(count_words(texts() if callable(texts) else texts))
+            sql.set_word_frequencies(frequency_key, input_hash, frequencies)
+        return frequencies
+
+    if callable(texts):
+        texts = texts()
+    if isinstance(texts, dict):
+        texts = texts.values()
+    texts = list(texts)
+    if not CACHE_ENABLED:
+        return dict(count_words(texts))
+
+    h = hashlib.sha1(f'{count_words.__name__}:{WORD_COUNT_VERSION}'.encode())
+    for text in texts:
+        h.update(repr(text).encode('utf-8', 'surrogatepass'))
+        h.update(b'\0')
+    input_hash = h.hexdigest()
+
+    frequencies = sql.get_word_frequencies(frequency_key, input_hash)
+    if frequencies is None:
+        frequencies = dict(count_words(texts))
+        sql.set_word_frequencies(frequency_key, input_hash, frequencies)
+    return frequencies
+
+@tracing.traced
 def comments_to_df(all_comments):
     '''Extract comments from "get_all_comments()" json and return a dataframe.'''
+    import pandas as pd
+
+    # Top-level comments of threads and replies have the same fields in different places
+    comment_snippets = [
+        c['snippet']['topLevelComment']['snippet'] if c['kind'] == 'youtube#commentThread' else c['snippet']
+        for c in all_comments
+    ]
 
     new_dict = {
-    'id':[],
-    'text_original':[],
-    'like_count':[],
-    'published_at':[],
-    'total_reply_count':[]
+    'id': [c['id'] for c in all_comments],
+    'text_original': [s['textOriginal'] for s in comment_snippets],
+    'like_count': [s['likeCount'] for s in comment_snippets],
+    'published_at': pd.to_datetime([s['publishedAt'] for s in comment_snippets], utc=True),
+    'total_reply_count': [c['snippet'].get('totalReplyCount') for c in all_comments]
     }
 
-    for c in all_comments:
-        if c['kind'] == 'youtube#commentThread':
-            new_dict['id'].append(c['id'])
-            new_dict['like_count'].append(c['snippet']['topLevelComment']['snippet']['likeCount'])
-            new_dict['text_original'].append(c['snippet']['topLevelComment']['snippet']['textOriginal'])
-            new_dict['published_at'].append(pd.to_datetime(c['snippet']['topLevelComment']['snippet']['publishedAt'], utc=True))
-            new_dict['total_reply_count'].append(c['snippet']['totalReplyCount'])
-        else:
-            new_dict['id'].append(c['id'])
-            new_dict['like_count'].append(c['snippet']['likeCount'])
-            new_dict['text_original'].append(c['snippet']['textOriginal'])
-            new_dict['published_at'].append(pd.to_datetime(c['snippet']['publishedAt'], utc=True))
-            new_dict['total_reply_count'].append(c['snippet'].get('totalReplyCount'))
-
     comment_df = pd.DataFrame(data=new_dict).set_index('id')
     return comment_df
 
-def analyze_comment_sentiments(comment_df):
-    '''Analyse sentiment. Take as input a comment dataframe from "comments_to_df()"'''
-    analyzer = SentimentIntensityAnalyzer()
-
-    sentiment = {
-        'neg':[],
-        'neu':[],
-        'pos':[],
-        'compound':[]
-    }
+@tracing.traced
+def get_comment_df(youtube, video_id, workers=None, max_per_second=None, batch=None, columns=None, filters=None):
+    '''Synchronize the local comment store with a video and return its comments as dataframe like "comments_to_df()".\n
+    The dataframe is read from the Parquet dataset of the video, unless the sync changed the stored comments, see "dataset.load_frame()".
+    Pass columns and filters to read only a part of the dataset.'''
+    update_video_comments(youtube, video_id, workers=workers, max_per_second=max_per_second, batch=batch)
+    return dataset.load_frame(
+        'comments',
+        video_id,
+        sql.get_store_version(f'comments:{video_id}'),
+        lambda: comments_to_df(sql.get_comments(video_id)),
+        columns=columns,
+        filters=filters
+    )
 
-    for comment in comment_df['text_original']:
-        vs = analyzer.polarity_scores(comment)
-        for k, v in vs.items():
-            sentiment[k].append(v)
+@tracing.traced
+def analyze_comment_sentiments(comment_df, workers=None):
+    '''Analyse sentiment. Take as input a comment dataframe from "comments_to_df()"\n
+    Big dataframes are scored by a pool of workers processes, see "sentiment.score_texts()".
+    Scores of known comment texts are taken from the score cache, see "sentiment.score_texts_cached()".'''
+    import pandas as pd
+    if sentiment.CACHE_ENABLED:
+        scores = sentiment.score_texts_cached(comment_df['text_original'], workers=workers)
+    else:
+        scores = sentiment.score_texts(comment_df['text_original'], workers=workers)
 
-    sentiment_df = pd.DataFrame(data=sentiment)
+    sentiment_df = pd.DataFrame(data=scores, columns=sentiment.COLUMNS)
     comment_sentiment = pd.concat([comment_df.reset_index(), sentiment_df], axis=1)
     return comment_sentiment
 
-def get_channel_video_df(youtube, channel_ids):
-    '''Get video data for a list of given channel ids and return a concatenated dataframe.'''
-
-    video_df = pd.DataFrame([])
-    for channel_id in channel_ids:
-
-        if video_df.empty == True:
-            # Get list of video ids
-            v_list = videoIdList(youtube, channel_id)
-
-            # Get data for videos
-            video_snippet_list = video_snippets(youtube, v_list, maxResults=50)
-
-            # Write data to a dict
-            video_data_dict = snippets_to_dict(video_snippet_list, yt_credentials=youtube)
-
-            # Insert data into a dataframe
-            video_df = pd.DataFrame(video_data_dict)
-
-        else:
-            # Get list of video ids
-            v_list = videoIdList(youtube, channel_id)
-
-            # Get data for videos
-            video_snippet_list = video_snippets(youtube, v_list, maxResults=50)
-
-            # Write data to a dict
-            video_data_dict = snippets_to_dict(video_snippet_list, yt_credentials=youtube)
-
-            # Insert data into a dataframe
-            video_df_temp = pd.DataFrame(video_data_dict)
-
-            # Cancatenate dataframes
-            video_df = pd.concat([video_df, video_df_temp])
+@tracing.traced
+def sync_channel_videos(youtube, channel_id, stale_after=None):
+    '''Synchronize the local video store with a channel and return the snippets of all stored videos of the channel.\n
+    See "update_channel_videos()" for the sync.'''
+    update_channel_videos(youtube, channel_id, stale_after=stale_after)
+    return sql.get_videos(channel_id)
+
+@tracing.traced
+def update_channel_videos(youtube, channel_id, stale_after=None, refresh_limit=None):
+    '''Synchronize the local video store with a channel.\n
+    Only videos, that are newer than the last known upload, are downloaded. Statistics of stored videos are refreshed,
+    if they are older than stale_after seconds (default STALE_AFTER). Only the refresh_limit most recent stale videos
+    (default STALE_REFRESH_LIMIT, 0 for all) are refreshed, because the numbers of older videos change slowly.
+    The refresh costs one request of 3 units per 50 videos, e.g. 12 units for 200 videos. Without a limit it costs
+    about as much as downloading a large channel again.'''
+    stale_after = STALE_AFTER if stale_after is None else stale_after
+    refresh_limit = STALE_REFRESH_LIMIT if refresh_limit is None else refresh_limit
+    known_ids = sql.get_video_ids(channel_id)
+
+    # Get new videos
+    new_ids = videoIdList(youtube, channel_id, known_ids=known_ids, use_cache=False)
+    if new_ids:
+        sql.upsert_videos(video_snippets(youtube, new_ids, maxResults=50, use_cache=False, fields=fields_mask('videos', VIDEO_PARTS)))
+
+    # Refresh statistics of stale videos
+    stale_ids = sql.get_stale_video_ids(channel_id, stale_after, limit=refresh_limit or None)
+    if stale_ids:
+        logger.info(f'Refreshing statistics of {len(stale_ids)} videos of channel {channel_id}')
+        statistics = video_snippets(youtube, stale_ids, maxResults=50, part="statistics", use_cache=False, fields=fields_mask('videos', 'statistics'))
+        sql.update_video_statistics({i['id']: i['statistics'] for i in statistics})
+
+    sql.set_channel_synced(channel_id)
+
+@tracing.traced
+def channel_video_df(youtube, channel_id, incremental=False, columns=None):
+    '''Get video data for a single channel id and return a dataframe. Set incremental=True to use "update_channel_videos()".\n
+    With incremental=True the dataframe is read from the Parquet dataset of the channel, unless the sync changed the stored videos,
+    see "dataset.load_frame()". Pass columns to read only these columns.'''
+    import pandas as pd
+
+    if incremental:
+        update_channel_videos(youtube, channel_id)
+        return dataset.load_frame(
+            'videos',
+            channel_id,
+            sql.get_store_version(f'videos:{channel_id}'),
+            lambda: pd.DataFrame(snippets_to_dict(sql.get_videos(channel_id), yt_credentials=youtube)),
+            columns=columns
+        )
 
-    return video_df
+    # Get list of video ids
+    v_list = videoIdList(youtube, channel_id)
+
+    # Get data for videos
+    video_snippet_list = video_snippets(youtube, v_list, maxResults=50, fields=fields_mask('videos', VIDEO_PARTS))
+
+    # Write data to a dict
+    video_data_dict = snippets_to_dict(video_snippet_list, yt_credentials=youtube)
+
+    # Insert data into a dataframe
+    video_df = pd.DataFrame(video_data_dict)
+    return video_df[columns] if columns is not None else video_df
+
+@tracing.traced
+def get_channel_video_df(youtube, channel_ids, workers=None, incremental=False, columns=None):
+    '''Get video data for a list of given channel ids and return a concatenated dataframe.\n
+    Channels are fetched with up to workers concurrent channels. A channel that fails is logged and left out of the dataframe.\n
+    Set incremental=True to download only new videos and refresh stale statistics, see "channel_video_df()". Pass columns to get only these columns.'''
+    import pandas as pd
+
+    def fetch(channel_id):
+        try:
+            return channel_video_df(youtube, channel_id, incremental=incremental, columns=columns)
+        except Exception:
+            logger.exception(f'Could not get videos of channel {channel_id}')
+            return None
+
+    channel_dfs = map_concurrent(fetch, channel_ids, workers=workers, label='channels')
+    channel_dfs = [df for df in channel_dfs if df is not None and not df.empty]
+
+    if not channel_dfs:
+        return pd.DataFrame([])
+
+    # Cancatenate dataframes once
+    return pd.concat(channel_dfs)
+
+@tracing.traced
+def sync_channels(youtube, channel_ids, workers=None):
+    '''Synchronize the local video store with several channels at the same time, see "update_channel_videos()".
+    Return the ids of the channels, that were synchronized. A channel that fails is logged and left out.'''
+
+    def sync(channel_id):
+        try:
+            update_channel_videos(youtube, channel_id)
+            return channel_id
+        except Exception:
+            logger.exception(f'Could not get videos of channel {channel_id}')
+            return None
+
+    return [channel_id for channel_id in map_concurrent(sync, channel_ids, workers=workers, label='channels') if channel_id is not None]
+
+def get_channel_rollups(channel_ids):
+    '''Return a dataframe with the columns channel_id, channel_title, video_count and link_count of the stored videos of channels.\n
+    The counts are kept up to date, while videos are stored, see "sql.get_channel_rollups()". Channels without videos are left out.'''
+    import pandas as pd
+    return pd.DataFrame(sql.get_channel_rollups(channel_ids), columns=['channel_id', 'channel_title', 'video_count', 'link_count'])
+
+def get_duration_counts(channel_id):
+    '''Return a series of the number of stored videos of a channel per duration in seconds.'''
+    import pandas as pd
+    rows = sql.get_duration_counts(channel_id)
+    return pd.Series([r[1] for r in rows], index=pd.Index([r[0] for r in rows], name='duration_sec'), name='video_count', dtype='int64')
+
+def get_top_videos(channel_ids, metric='view', n=5):
+    '''Return a dataframe with the n stored videos with the highest count of metric of every channel.
+    Possible metrics are like, dislike, comment and view. The dataframe is an input of "viz.top_videos()".'''
+    import pandas as pd
+    return pd.DataFrame(sql.get_top_videos(channel_ids, metric=metric, n=n), columns=['video_id', 'channel_id', 'channel_title', 'title', f'{metric}_count'])
+
+@tracing.traced
+def channel_tag_frequencies(channel_id):
+    '''Return the word frequencies of the tags of the stored videos of a channel. They are counted again only when the stored videos change.'''
+    return word_frequencies(
+        f'tags:{channel_id}',
+        lambda: [i['snippet'].get('tags') for i in sql.get_videos(channel_id)],
+        count_tag_words,
+        version=sql.get_store_version(f'videos:{channel_id}')
+    )
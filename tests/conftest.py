@@ -0,0 +1,43 @@
+'''Fixtures of the tests: the local fake of the YouTube Data API, see benchmarks/fake_youtube.py, and a temporary database.
+
+The environment is set before the modules of the app are imported, because they read it on import.'''
+import os
+import sys
+import tempfile
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import fake_youtube
+
+_server = fake_youtube.start()
+os.environ.update({
+    'YOUTUBE_API_ENDPOINT': _server.url,
+    'YOUTUBE_DATA_DB': os.path.join(tempfile.mkdtemp(prefix='youtube_data_tests_'), 'youtube_data.db'),
+    'YOUTUBE_API_KEY': 'test',
+    'YOUTUBE_CACHE': '0',
+    'YOUTUBE_DAILY_QUOTA': str(10 ** 9),
+    'PLOT_OUTPUT': 'memory',
+    'RENDER_WORKERS': '1',
+    'MPLBACKEND': 'Agg',
+})
+
+# Channel 0 has 60 videos. Video 0 of channel 1 has 300 comments, about half of the threads have more than the 5 replies,
+# that come with a thread.
+CHANNEL_ID = fake_youtube.channel_id(0)
+VIDEO_ID = fake_youtube.video_id(1, 0)
+
+@pytest.fixture
+def api():
+    '''Return a new fake API, that the app sends its requests to.'''
+    dataset = fake_youtube.Dataset(replies_per_thread=6, sizes={CHANNEL_ID: 60, fake_youtube.channel_id(1): 1, VIDEO_ID: 300})
+    _server.api = fake_youtube.FakeYouTube(dataset)
+    return _server.api
+
+@pytest.fixture
+def youtube(api):
+    '''Return an API client for the fake API.'''
+    from src import youtube_data_module as ydt
+    return ydt.youtubeAPIkey('test')
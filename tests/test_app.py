@@ -0,0 +1,41 @@
+import time
+import pytest
+from conftest import CHANNEL_ID
+
+@pytest.fixture
+def client(api):
+    import app
+    return app.app.test_client()
+
+def wait_for(client, location):
+    '''Wait until the job of a job page is done and return the page.'''
+    for _ in range(300):
+        if client.get(location + '/status').json['status'] in ('done', 'failed'):
+            return client.get(location)
+        time.sleep(0.1)
+    raise AssertionError(f'{location} did not finish')
+
+def clear_images():
+    from src import viz
+    with viz._images_lock:
+        viz._images.clear()
+        viz._images_bytes = 0
+
+def test_lost_images_are_rendered_again_once(client):
+    location = client.get(f'/channels?a={CHANNEL_ID}').headers['Location']
+    assert b'/plots/' in wait_for(client, location).data
+
+    # The images are gone, e.g. after a restart in memory mode: the analysis runs again
+    clear_images()
+    response = client.get(location)
+    assert response.status_code == 302
+    rerun = response.headers['Location']
+    page = wait_for(client, rerun)
+    assert b'/plots/' in page.data and b'not available' not in page.data
+
+    # The images of the rerun are gone as well: no further rerun, the pages show placeholders
+    clear_images()
+    assert client.get(location).headers['Location'] == rerun
+    page = client.get(rerun)
+    assert page.status_code == 200
+    assert b'/plots/' not in page.data and b'not available' in page.data
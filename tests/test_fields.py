@@ -0,0 +1,42 @@
+import pytest
+from conftest import CHANNEL_ID, VIDEO_ID
+from src import tracing
+from src import youtube_data_module as ydt
+
+ENDPOINTS = ['search', 'playlistItems', 'videos', 'commentThreads', 'comments']
+
+def download(youtube):
+    '''Download the videos of a channel, the comments of a video and search results with statistics like the app.
+    Return the video and comment dataframes, the search results and the requests and response bytes per endpoint.'''
+    before = {e: (tracing.get_count('youtube_api_requests_total', endpoint=e), tracing.get_count('youtube_api_response_bytes_total', endpoint=e))
+              for e in ENDPOINTS}
+    video_df = ydt.channel_video_df(youtube, CHANNEL_ID).drop(columns='date_data_created')
+    comment_df = ydt.comments_to_df(ydt.get_all_comments(youtube, VIDEO_ID, workers=1))
+    search = ydt.youtubeSearchListStatistics(youtube, q='fake', maxResults=10)
+    counts = {e: (tracing.get_count('youtube_api_requests_total', endpoint=e) - before[e][0],
+                  tracing.get_count('youtube_api_response_bytes_total', endpoint=e) - before[e][1]) for e in ENDPOINTS}
+    return video_df, comment_df, search, counts
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_masked_responses_give_the_same_data_with_fewer_bytes(api, youtube, monkeypatch, batch):
+    import pandas as pd
+    monkeypatch.setattr(ydt, 'BATCH_REQUESTS', batch)
+    monkeypatch.setattr(ydt, 'PARTIAL_RESPONSES', False)
+    full_videos, full_comments, full_search, full_counts = download(youtube)
+    monkeypatch.setattr(ydt, 'PARTIAL_RESPONSES', True)
+    masked_videos, masked_comments, masked_search, masked_counts = download(youtube)
+
+    assert len(full_videos) == 60 and len(full_comments) == 300
+    pd.testing.assert_frame_equal(full_videos, masked_videos)
+    pd.testing.assert_frame_equal(full_comments, masked_comments)
+    # The fields, that the search result pages read
+    for full, masked in zip(full_search['items'], masked_search['items']):
+        assert masked['id'] == full['id'] and masked['statistics'] == full['statistics']
+        for field in ('publishedAt', 'channelId', 'title', 'description', 'channelTitle'):
+            assert masked['snippet'][field] == full['snippet'][field]
+        assert masked['snippet']['thumbnails']['medium']['url'] == full['snippet']['thumbnails']['medium']['url']
+
+    for endpoint in ENDPOINTS:
+        requests, full_bytes = full_counts[endpoint]
+        assert requests > 0 and masked_counts[endpoint][0] == requests, endpoint
+        assert masked_counts[endpoint][1] < full_bytes, endpoint
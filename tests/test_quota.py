@@ -0,0 +1,90 @@
+import googleapiclient.errors
+import pytest
+from src import quota
+from src import youtube_data_module as ydt
+
+@pytest.fixture
+def waits(monkeypatch):
+    '''Install a quota scheduler, that records its waits instead of sleeping, and return the list of waits.'''
+    waits = []
+    monkeypatch.setattr(quota, '_scheduler', quota.QuotaScheduler(units_per_second=0, backoff_base=1, backoff_max=32, sleep=waits.append))
+    return waits
+
+def call(youtube, i=0):
+    return ydt.api_call(youtube, 'videos', part='id', id=f'v001000000{i}')
+
+def test_token_bucket_lets_the_burst_through_and_then_throttles(youtube, waits):
+    scheduler = quota.get_scheduler()
+    scheduler.units_per_second, scheduler.burst, scheduler.tokens = 10, 5, 5
+
+    for _ in range(5):
+        call(youtube)
+    assert waits == []
+
+    call(youtube)
+    assert waits == [pytest.approx(0.1, abs=0.02)]
+    assert scheduler.get_metrics()['throttled_seconds'] == pytest.approx(0.1, abs=0.02)
+
+def test_retryable_errors_are_retried_with_backoff(api, youtube, waits):
+    api.errors = [(503, 'backendError'), (403, 'rateLimitExceeded'), (429, 'rateLimitExceeded'), (403, 'userRateLimitExceeded')]
+
+    assert call(youtube)['items'][0]['id'] == 'v0010000000'
+    assert api.stats['api_requests'] == 5
+    assert len(waits) == 4
+    for attempt, wait in enumerate(waits):
+        assert 0 <= wait <= 2 ** attempt
+    assert quota.get_metrics()['retries'] == 4
+
+def test_errors_are_raised_after_max_retries(api, youtube, waits):
+    quota.get_scheduler().max_retries = 2
+    api.errors = [(503, 'backendError')] * 10
+
+    with pytest.raises(googleapiclient.errors.HttpError):
+        call(youtube)
+    assert api.stats['api_requests'] == 3
+    assert len(waits) == 2
+
+def test_errors_that_do_not_go_away_are_not_retried(api, youtube, waits):
+    api.errors = [(403, 'forbidden')]
+
+    with pytest.raises(googleapiclient.errors.HttpError):
+        call(youtube)
+    assert api.stats['api_requests'] == 1
+    assert waits == []
+
+def test_exceeded_daily_quota_of_the_api_is_not_retried(api, youtube, waits):
+    api.errors = [(403, 'quotaExceeded')]
+
+    with pytest.raises(quota.QuotaExceeded):
+        call(youtube)
+    assert api.stats['api_requests'] == 1
+    assert waits == []
+
+def test_exceeded_daily_quota_of_the_api_in_a_batch_is_not_retried(api, youtube, waits):
+    api.errors = [(403, 'quotaExceeded')]
+
+    with pytest.raises(quota.QuotaExceeded):
+        ydt.api_batch(youtube, 'videos', [{'part': 'id', 'id': 'v0010000000'}, {'part': 'id', 'id': 'v0010000001'}])
+    assert waits == []
+
+def test_requests_beyond_the_daily_quota_are_not_sent(api, youtube, waits):
+    quota.get_scheduler().daily_quota = quota.get_metrics()['used_today'] + 3
+
+    for i in range(3):
+        call(youtube, i)
+    with pytest.raises(quota.QuotaExceeded):
+        call(youtube, 3)
+    assert api.stats['api_requests'] == 3
+    assert quota.get_metrics()['remaining_today'] == 0
+
+def test_daily_quota_is_shared_by_schedulers():
+    # Schedulers of several processes count in the same database
+    used = quota.get_metrics()['used_today']
+    first = quota.QuotaScheduler(daily_quota=used + 5)
+    second = quota.QuotaScheduler(daily_quota=used + 5)
+
+    first.acquire(3)
+    second.acquire(2)
+    with pytest.raises(quota.QuotaExceeded):
+        first.acquire(1)
+    assert second.get_metrics()['used_today'] == used + 5
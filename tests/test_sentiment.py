@@ -0,0 +1,41 @@
+import threading
+import numpy as np
+from src import sentiment
+
+TEXTS = [f'I love this video {i}' if i % 2 else f'This is terrible {i}' for i in range(400)]
+
+def test_parallel_scores_equal_serial_scores():
+    expected = sentiment.score_chunk(TEXTS)
+    assert np.array_equal(sentiment.score_texts(TEXTS, workers=2, min_parallel=10, chunk_size=100), expected)
+
+def test_callers_with_other_worker_counts_do_not_break_each_other():
+    expected = sentiment.score_chunk(TEXTS)
+    results = []
+    errors = []
+    def score(workers):
+        try:
+            for _ in range(3):
+                results.append(sentiment.score_texts(TEXTS, workers=workers, min_parallel=10, chunk_size=50))
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=score, args=(workers,)) for workers in (2, 3, 2, 3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert len(results) == 12 and all(np.array_equal(r, expected) for r in results)
+
+def test_least_recently_used_scores_are_evicted(tmp_path):
+    from src import sql
+    db_path = str(tmp_path / 'youtube_data.db')
+    sql.set_sentiment_scores({'a': (0, 1, 0, 0), 'b': (0, 1, 0, 0)}, max_rows=3, db_path=db_path)
+    connection = sql.get_connection(db_path)
+    connection.execute('UPDATE sentiment_scores SET last_access = last_access - 2 * 24 * 3600')
+    connection.commit()
+    # Reading a marks it as recently used
+    assert set(sql.get_sentiment_scores(['a'], db_path=db_path)) == {'a'}
+    sql.set_sentiment_scores({'c': (0, 1, 0, 0), 'd': (0, 1, 0, 0)}, max_rows=3, db_path=db_path)
+
+    assert set(sql.get_sentiment_scores(['a', 'b', 'c', 'd'], db_path=db_path)) == {'a', 'c', 'd'}
@@ -0,0 +1,61 @@
+import sqlite3
+import threading
+import fake_youtube
+from src import sql
+
+def connect_at_once(db_path, threads=8):
+    '''Open the first connections of several threads to a database at the same time. Return the errors.'''
+    barrier = threading.Barrier(threads)
+    errors = []
+    def connect():
+        barrier.wait()
+        try:
+            sql.get_connection(db_path)
+        except Exception as e:
+            errors.append(e)
+    started = [threading.Thread(target=connect) for _ in range(threads)]
+    for t in started:
+        t.start()
+    for t in started:
+        t.join()
+    return errors
+
+def test_first_connections_of_several_threads_build_the_search_index_once(tmp_path):
+    db_path = str(tmp_path / 'youtube_data.db')
+    dataset = fake_youtube.Dataset()
+    sql.upsert_videos([dataset.video(fake_youtube.video_id(0, i)) for i in range(100)], db_path=db_path)
+    # A database of a version without the search index
+    connection = sqlite3.connect(db_path)
+    connection.executescript('DROP TABLE search_items; DROP TABLE video_index; DROP TABLE channel_index;')
+    connection.close()
+
+    assert connect_at_once(db_path) == []
+    connection = sql.get_connection(db_path)
+    assert connection.execute('SELECT COUNT(*) FROM search_items').fetchone()[0] == 100
+    assert connection.execute('SELECT COUNT(*) FROM video_index').fetchone()[0] == 100
+
+def test_indexing_an_item_again_replaces_it(tmp_path):
+    db_path = str(tmp_path / 'youtube_data.db')
+    video = fake_youtube.Dataset().video(fake_youtube.video_id(0, 0))
+    sql.index_videos([video], db_path=db_path)
+    video['snippet']['title'] = 'Renamed zebra video'
+    sql.index_videos([video], db_path=db_path)
+
+    connection = sql.get_connection(db_path)
+    assert connection.execute('SELECT COUNT(*) FROM search_items').fetchone()[0] == 1
+    assert connection.execute('SELECT COUNT(*) FROM video_index').fetchone()[0] == 1
+    assert [i['id']['videoId'] for i in sql.search_index('video', 'zebra', db_path=db_path)] == [video['id']]
+
+def test_first_connections_of_several_threads_build_the_rollups_once(tmp_path):
+    db_path = str(tmp_path / 'youtube_data.db')
+    dataset = fake_youtube.Dataset()
+    sql.upsert_videos([dataset.video(fake_youtube.video_id(0, i)) for i in range(100)], db_path=db_path)
+    expected = sql.get_channel_rollups([fake_youtube.channel_id(0)], db_path=db_path)
+    # A database of a version without the rollups
+    connection = sqlite3.connect(db_path)
+    connection.executescript('DROP TABLE video_facts; DROP TABLE channel_rollups; DROP TABLE channel_durations;')
+    connection.close()
+
+    assert connect_at_once(db_path) == []
+    assert expected[0]['video_count'] == 100
+    assert sql.get_channel_rollups([fake_youtube.channel_id(0)], db_path=db_path) == expected